@@ -1,11 +1,33 @@
+import os
 import pandas as pd
 from pathlib import Path
 from collections import defaultdict
+from contextlib import contextmanager
 from sql_connection import TRN
+from redgenes_settings import redgenes_config
+from metadata import identifier_key, IDENTIFIER_CACHE
+from load_ledger import record_stage, stage_reached
+from profiling import PROFILER
+from embedding import embed_genome, load_kmer_vectors
+from utils import _source_paths
 #from add_accession import add_gene_accession
-# from add_embedding import add_embedding, load_kmer_vectors
 
-#kmer2vec_file = "/panfs/roles/redgenes/redgenes/kmernode2vec/emp500_kmer-node2vec-embedding.txt"
+DBXREF_TABLES = ['kegg', 'refseq', 'uniparc', 'uniref', 'so', 'pfam']
+BAKTA_COLUMNS = ["contig_ID", "type", "start", "stop", "strand", "locus_tag", "gene", "product", "dbxrefs"]
+BAKTA_DTYPES = {
+    "contig_ID": str,
+    "type": "category",
+    "start": "int32",
+    "stop": "int32",
+    "strand": "category",
+    "locus_tag": str,
+    "gene": str,
+    "product": str,
+    "dbxrefs": str,
+}
+# Dictionary-encoded bakta columns, each with a bakta_<column> lookup table,
+# and their position in the rows passed to insert_bakta_results
+BAKTA_TERMS = {"type": 2, "strand": 5, "gene": 7, "product": 8}
 
 def process_dbxref(dbxref):
     """
@@ -28,35 +50,104 @@ def insert_dbxref_info(bakta_accession, dbxref_data):
     for dbxref_type, accession_list in dbxref_data.items():
         table_name = dbxref_type.lower()
         if table_name in valid_tables:
-            sql = f"INSERT INTO {table_name} (bakta_accession, {table_name.upper()}) VALUES (?, ?)"
+            sql = f"INSERT OR IGNORE INTO {table_name} (bakta_accession, {table_name.upper()}) VALUES (?, ?)"
             for accession in accession_list:
                 TRN.add(sql, [bakta_accession, accession])
     TRN.execute()
 
+def explode_dbxrefs(bakta_df):
+    """
+    Split the dbxrefs column of a whole genome at once.
+
+    Returns a DataFrame with one (bakta_accession, table, accession) row per
+    dbxref entry that belongs to one of DBXREF_TABLES.
+    """
+    entries = bakta_df.set_index('bakta_accession')['dbxrefs'].dropna()
+    entries = entries.str.split(', ').explode()
+    parts = entries.str.split(':', n=1, expand=True)
+    if parts.shape[1] < 2:
+        # No entry has a colon
+        return pd.DataFrame(columns=['bakta_accession', 'table', 'accession'])
+    dbxref_df = pd.DataFrame({
+        'table': parts[0].str.strip().str.lower(),
+        'accession': parts[1].str.strip(),
+    }).dropna().reset_index()
+    return dbxref_df[dbxref_df['table'].isin(DBXREF_TABLES)]
+
+def insert_dbxref_frame(dbxref_df):
+    """
+    Insert the output of explode_dbxrefs with one bulk statement per table.
+    A dbxref listed twice for the same feature is stored once.
+    """
+    for table_name, table_df in dbxref_df.groupby('table', sort=False):
+        sql = f"INSERT OR IGNORE INTO {table_name} (bakta_accession, {table_name.upper()}) VALUES (?, ?)"
+        TRN.add_bulk(sql, table_df[['bakta_accession', 'accession']].itertuples(index=False, name=None))
+    TRN.execute()
+
+@contextmanager
+def open_bakta_tsv(tsv_path):
+    """
+    Open a Bakta tsv file positioned at its first feature line.
+
+    Skips the '#' comment lines written by Bakta, including its '#Sequence Id'
+    column header, and a plain column header line if there is one.
+    """
+    PROFILER.count_read(os.path.getsize(tsv_path))
+    with open(tsv_path) as f:
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if line.startswith('#'):
+                continue
+            if line.split('\t', 1)[0] in ("contig_ID", "Sequence Id"):
+                continue
+            f.seek(position)
+            break
+        yield f
+
+def _read_bakta_tsv(f, chunksize=None):
+    return pd.read_csv(f, header=None, names=BAKTA_COLUMNS, dtype=BAKTA_DTYPES, sep='\t', chunksize=chunksize)
+
+def iter_bakta_results(tsv_path, chunksize=None):
+    """
+    Yield the features of a Bakta tsv output file in typed chunks of at most
+    chunksize rows (redgenes_config.bakta_chunksize by default), without gaps.
+    """
+    with open_bakta_tsv(tsv_path) as f:
+        for chunk in _read_bakta_tsv(f, chunksize or redgenes_config.bakta_chunksize):
+            yield chunk[chunk["type"] != "gap"]
+
 def extract_bakta_results(tsv_path):
     """
     Extract information from a Bakta tsv output file.
     """
-    column_names = ["contig_ID", "type", "start", "stop", "strand", "locus_tag", "gene", "product", "dbxrefs"]
-    df = pd.read_csv(tsv_path, header=0, names=column_names, comment='#', sep='\t')
+    with open_bakta_tsv(tsv_path) as f:
+        df = _read_bakta_tsv(f)
     df = df[df["type"] != "gap"]
     return df
 
 def fetch_entity_id(row):
     """
     Fetch and return the entity ID based on filename and filepath.
+    Ids already in IDENTIFIER_CACHE are returned without a query.
     """
     try:
-        local_path, filename = Path(row["local_path"]), row["assembly_accession"]
+        key = identifier_key(row)
+        entity_id = IDENTIFIER_CACHE.get(key)
+        if entity_id is not None:
+            return entity_id
+
+        filename, local_path = key
         with TRN:
             sql_fetch = """
                 SELECT entity_id
                 FROM identifier
                 WHERE filename_full = ? AND filepath = ?"""
-            args_fetch = [filename, str(local_path)]
+            args_fetch = [filename, local_path]
             TRN.add(sql_fetch, args_fetch)
             entity_id = TRN.execute_fetchflatten()
             if entity_id:
+                IDENTIFIER_CACHE.put(key, entity_id[0])
                 return entity_id[0]  # Return the first (and should be the only) ID fetched
             else:
                 print("No entity found with the given filename and filepath.")
@@ -65,52 +156,155 @@ def fetch_entity_id(row):
         print(f"Error fetching entity ID: {e}")
         return None
 
-def insert_bakta_results(entity_id, args_bakta):
+def insert_bakta_terms(args_bakta):
     """
-    Insert Bakta results into the database.
+    Queue the inserts of the type, strand, gene and product values of
+    args_bakta that are not in their lookup tables yet.
+    """
+    for term, position in BAKTA_TERMS.items():
+        values = {row[position] for row in args_bakta}
+        sql = f"INSERT OR IGNORE INTO bakta_{term} ({term}) VALUES (?)"
+        TRN.add_bulk(sql, ([value] for value in values if isinstance(value, str)))
+
+def insert_bakta_results(entity_id, args_bakta, bulk=True):
     """
+    Insert Bakta results into the database and return their accessions.
+
+    Type, strand, gene and product are added to their lookup tables first and
+    stored as keys. By default all rows are sent with a single executemany.
+    AUTOINCREMENT hands out consecutive keys while we hold the write lock, so
+    the accessions are the range ending at last_insert_rowid(). With bulk=False
+    every row is inserted with its own INSERT ... RETURNING, which is kept for
+    comparison.
+    """
+    args_bakta = list(args_bakta)
+    insert_bakta_terms(args_bakta)
     sql_bakta_info = """
         INSERT INTO bakta (
             entity_id,
             contig_id,
-            type,
+            type_key,
             start,
             stop,
-            strand,
+            strand_key,
             locus_tag,
-            gene,
-            product)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        RETURNING bakta_accession;"""
-    TRN.add(sql_bakta_info, args_bakta, many=True)
-    bakta_accession = TRN.execute()
-    return bakta_accession
+            gene_key,
+            product_key)
+        VALUES (
+            ?,
+            ?,
+            (SELECT type_key FROM bakta_type WHERE type = ?),
+            ?,
+            ?,
+            (SELECT strand_key FROM bakta_strand WHERE strand = ?),
+            ?,
+            (SELECT gene_key FROM bakta_gene WHERE gene = ?),
+            (SELECT product_key FROM bakta_product WHERE product = ?))"""
+    if not bulk:
+        TRN.add(sql_bakta_info + " RETURNING bakta_accession;", args_bakta, many=True)
+        results = TRN.execute()[len(BAKTA_TERMS):]
+        return [sublist[0][0] if sublist else None for sublist in results]
+
+    TRN.add_bulk(sql_bakta_info, args_bakta)
+    TRN.add("SELECT last_insert_rowid()")
+    *_, inserted, last = TRN.execute()
+    num_inserted, last_accession = inserted[0][0], last[0][0]
+    return range(last_accession - num_inserted + 1, last_accession + 1)
+
+def index_bakta_text(accessions):
+    """
+    Add the product, gene and locus_tag of newly inserted features to the
+    bakta_fts full-text index, in the transaction that inserted them.
+    """
+    if len(accessions) == 0:
+        return
+    sql = """
+        INSERT INTO bakta_fts (rowid, product, gene, locus_tag)
+        SELECT bakta_accession, product, gene, locus_tag
+        FROM bakta_info
+        WHERE bakta_accession BETWEEN ? AND ?"""
+    # accessions are ascending, as handed out by AUTOINCREMENT
+    TRN.add(sql, [accessions[0], accessions[-1]])
+    TRN.execute()
+
+def fetch_bakta_accessions(entity_id):
+    """
+    Return the accessions of the Bakta rows already loaded for entity_id, in load order.
+    """
+    with TRN:
+        sql = "SELECT bakta_accession FROM bakta WHERE entity_id = ? ORDER BY bakta_accession"
+        TRN.add(sql, [entity_id])
+        return TRN.execute_fetchflatten()
+
+def load_bakta_chunk(entity_id, chunk, accessions=None):
+    """
+    Insert one chunk of Bakta features, their full-text index entries and
+    their dbxrefs. When accessions is given the features are already loaded
+    and only the dbxrefs are inserted.
+    """
+    if accessions is None:
+        args_bakta = (
+            (entity_id, *values)
+            for values in chunk[BAKTA_COLUMNS[:8]].itertuples(index=False, name=None)
+        )
+        accessions = insert_bakta_results(entity_id, args_bakta)
+        index_bakta_text(accessions)
+    dbxref_df = explode_dbxrefs(pd.DataFrame({
+        'bakta_accession': accessions,
+        'dbxrefs': chunk['dbxrefs'].to_numpy(),
+    }))
+    insert_dbxref_frame(dbxref_df)
 
-def annotation_pipeline(row, tmpdir, logger):
+def annotation_pipeline(row, tmpdir, logger, bakta_df=None, stage=None):
     """
     Annotate genomes based on Bakta and insert information into the database.
+    bakta_df can be passed in when it was already parsed, e.g. by a worker process,
+    otherwise the tsv is streamed in chunks so memory does not grow with its size.
+    stage is the last stage recorded in the load ledger; when the Bakta rows are
+    already loaded only the dbxrefs are inserted.
     """
-    logger.info("Bakta insertion started")
-    bakta_path, filename = Path(row["bakta_path"]), row["assembly_accession"]
-    bakta_df = extract_bakta_results(str(bakta_path))
+    with PROFILER.stage("bakta", row["assembly_accession"].strip()):
+        _annotation_pipeline(row, logger, bakta_df, stage)
 
+def _annotation_pipeline(row, logger, bakta_df, stage):
+    logger.info("Bakta insertion started")
     entity_id = fetch_entity_id(row)
-    bakta_df.insert(loc=0, column='entity_id', value=entity_id)
-    bakta_res = bakta_df.iloc[:, 0:9].values.tolist()
+    if entity_id is None:
+        logger.error(f"Skipping Bakta insertion of {row['assembly_accession']}: no identifier entry")
+        return
+
+    if bakta_df is None:
+        chunks = iter_bakta_results(str(Path(row["bakta_path"].strip())))
+    else:
+        chunks = [bakta_df]
 
     with TRN:
-        bakta_accession = insert_bakta_results(entity_id, bakta_res)
-        bakta_df['bakta_accession'] = [sublist[0][0] if sublist else None for sublist in bakta_accession]
-
-        if entity_id:
-            for _, row in bakta_df.iterrows():
-                dbxref_data = process_dbxref(row['dbxrefs'])
-                insert_dbxref_info(row['bakta_accession'], dbxref_data)
-
-            # Uncomment or implement the following as needed:
-            # kmer_vectors = load_kmer_vectors(kmer2vec_file)
-            # for _, row in bakta_res.iterrows():
-            #     add_embedding(kmer_vectors, row['bakta_accession'], local_path, row['contig_ID'], row['start'], row['stop'])
-            #     add_gene_accession(row['bakta_accession'])
+        loaded = fetch_bakta_accessions(entity_id) if stage_reached(stage, "bakta") else None
+        offset = 0
+        for chunk in chunks:
+            accessions = None
+            if loaded is not None:
+                accessions = loaded[offset:offset + len(chunk)]
+                if len(accessions) != len(chunk):
+                    raise ValueError(f"{row['bakta_path']} does not match the Bakta rows already loaded")
+            load_bakta_chunk(entity_id, chunk, accessions)
+            offset += len(chunk)
+        if loaded is not None and offset != len(loaded):
+            raise ValueError(f"{row['bakta_path']} does not match the Bakta rows already loaded")
+
+        if loaded is None:
+            record_stage(row, entity_id, "bakta")
+        if redgenes_config.kmer_vectors:
+            with PROFILER.stage("embedding", row["assembly_accession"].strip()):
+                kmer_vectors = load_kmer_vectors(redgenes_config.kmer_vectors)
+                # local_path may be a glob pattern, resolved as staging does;
+                # a FASTA that cannot be read does not fail the genome's load
+                try:
+                    fasta_path = _source_paths(row["local_path"].strip())[0]
+                    embedded = embed_genome(entity_id, fasta_path, kmer_vectors, logger)
+                    logger.info(f"{embedded} gene embeddings inserted")
+                except OSError as e:
+                    logger.warning(f"Skipping gene embeddings of {row['assembly_accession'].strip()}: {e}")
+        record_stage(row, entity_id, "dbxref")
 
     return
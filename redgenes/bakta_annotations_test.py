@@ -3,7 +3,8 @@ from unittest.mock import MagicMock, patch
 import pandas as pd
 from collections import defaultdict
 from pathlib import Path
-from bakta_annotations import process_dbxref, insert_dbxref_info, extract_bakta_results, fetch_entity_id, insert_bakta_results
+from metadata import IDENTIFIER_CACHE
+from bakta_annotations import process_dbxref, insert_dbxref_info, explode_dbxrefs, insert_dbxref_frame, extract_bakta_results, iter_bakta_results, fetch_entity_id, insert_bakta_terms, insert_bakta_results
 
 # Mocking the SQL transaction object
 TRN = MagicMock()
@@ -17,6 +18,12 @@ def setup_database():
     # Teardown database connection, if needed
     TRN.reset_mock()
 
+@pytest.fixture(autouse=True)
+def clear_identifier_cache():
+    IDENTIFIER_CACHE.clear()
+    yield
+    IDENTIFIER_CACHE.clear()
+
 # Test process_dbxref function
 def test_process_dbxref_valid_input():
     input_str = "kegg:K12345, refseq:XP_123456"
@@ -40,6 +47,43 @@ def test_insert_dbxref_info_valid_data(mock_trn):
     mock_trn.add.assert_called()
     mock_trn.execute.assert_called_once()
 
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_fetch_entity_id_cached(mock_trn):
+    IDENTIFIER_CACHE.put(("XYZ123", "/fake/path"), 7)
+    row = {"local_path": "/fake/path ", "assembly_accession": "XYZ123"}
+    assert fetch_entity_id(row) == 7
+    mock_trn.add.assert_not_called()
+
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_fetch_entity_id_fills_cache(mock_trn):
+    mock_trn.execute_fetchflatten.return_value = [123]
+    row = {"local_path": "/fake/path", "assembly_accession": "XYZ123"}
+    fetch_entity_id(row)
+    assert IDENTIFIER_CACHE.get(("XYZ123", "/fake/path")) == 123
+
+# Test explode_dbxrefs function
+def test_explode_dbxrefs():
+    bakta_df = pd.DataFrame({
+        "bakta_accession": [1, 2, 3],
+        "dbxrefs": ["KEGG:K12345, RefSeq:WP_1.1, GO:0005524", None, "keggK1, PFAM: PF00001"],
+    })
+    result = list(explode_dbxrefs(bakta_df).itertuples(index=False, name=None))
+    assert result == [(1, "kegg", "K12345"), (1, "refseq", "WP_1.1"), (3, "pfam", "PF00001")]
+
+def test_explode_dbxrefs_no_entries():
+    bakta_df = pd.DataFrame({"bakta_accession": [1], "dbxrefs": [None]})
+    assert explode_dbxrefs(bakta_df).empty
+
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_insert_dbxref_frame_one_statement_per_table(mock_trn):
+    bakta_df = pd.DataFrame({
+        "bakta_accession": [1, 2],
+        "dbxrefs": ["KEGG:K1, RefSeq:WP_1.1", "KEGG:K2"],
+    })
+    insert_dbxref_frame(explode_dbxrefs(bakta_df))
+    assert mock_trn.add_bulk.call_count == 2
+    mock_trn.execute.assert_called_once()
+
 # Test extract_bakta_results function
 def test_extract_bakta_results_valid_file(tmpdir):
     # Create a temporary CSV file
@@ -59,6 +103,30 @@ def test_extract_bakta_results_valid_file(tmpdir):
     result_df = extract_bakta_results(str(tsv_file))
     assert len(result_df) == 1  # Only one row should be returned (gap rows excluded)
 
+BAKTA_TSV = """# Annotated with Bakta
+# Software: v1.8.2
+#Sequence Id\tType\tStart\tStop\tStrand\tLocus Tag\tGene\tProduct\tDbXrefs
+contig1\tcds\t1\t900\t+\tLT1\tgene1\tenzyme1\tKEGG:K12345
+contig1\tgap\t901\t1000\t?\t\t\tgap (100 bp)\t
+contig1\ttRNA\t1001\t1080\t-\tLT2\t\ttRNA-Leu\tSO:0000253
+contig2\tcds\t1\t300\t+\tLT3\t\thypothetical protein\t
+"""
+
+def test_extract_bakta_results_bakta_header(tmpdir):
+    tsv_file = tmpdir.join("bakta.tsv")
+    tsv_file.write(BAKTA_TSV)
+    result_df = extract_bakta_results(str(tsv_file))
+    assert result_df["locus_tag"].tolist() == ["LT1", "LT2", "LT3"]
+
+def test_iter_bakta_results_typed_chunks(tmpdir):
+    tsv_file = tmpdir.join("bakta.tsv")
+    tsv_file.write(BAKTA_TSV)
+    chunks = list(iter_bakta_results(str(tsv_file), chunksize=2))
+    assert [len(chunk) for chunk in chunks] == [1, 2]  # the gap is dropped from the first chunk
+    assert chunks[0]["type"].dtype == "category"
+    assert chunks[0]["start"].dtype == "int32"
+    assert pd.isna(chunks[1]["gene"]).all()
+
 @patch('bakta_annotations.TRN', new_callable=MagicMock)
 def test_fetch_entity_id_found(mock_trn):
     mock_trn.execute_fetchflatten.return_value = [123]
@@ -71,6 +139,36 @@ def test_fetch_entity_id_not_found(mock_trn):
     row = {"local_path": "/fake/path", "assembly_accession": "XYZ123"}
     assert fetch_entity_id(row) is None
 
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_insert_bakta_results_bulk(mock_trn):
+    # four lookup table inserts, executemany inserted 3 rows, last_insert_rowid() is 12
+    mock_trn.execute.return_value = [[(1,)]] * 4 + [[(3,)], [(12,)]]
+    args_bakta = [[1, "contig1", "cds", 1, 900, "+", "LT1", "gene1", "enzyme1"]] * 3
+    assert list(insert_bakta_results(1, args_bakta)) == [10, 11, 12]
+    assert mock_trn.add_bulk.call_count == 5
+
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_insert_bakta_results_row_by_row(mock_trn):
+    mock_trn.execute.return_value = [[(1,)]] * 4 + [[(10,)], [(11,)]]
+    args_bakta = [[1, "contig1", "cds", 1, 900, "+", "LT1", "gene1", "enzyme1"]] * 2
+    assert insert_bakta_results(1, args_bakta, bulk=False) == [10, 11]
+    assert mock_trn.add_bulk.call_count == 4  # only the lookup tables
+
+@patch('bakta_annotations.TRN', new_callable=MagicMock)
+def test_insert_bakta_terms_distinct_values(mock_trn):
+    args_bakta = [
+        [1, "contig1", "cds", 1, 900, "+", "LT1", "gene1", "hypothetical protein"],
+        [1, "contig1", "cds", 901, 1800, "+", "LT2", float("nan"), "hypothetical protein"],
+    ]
+    insert_bakta_terms(args_bakta)
+    inserted = {call.args[0].split()[4]: sorted(call.args[1]) for call in mock_trn.add_bulk.call_args_list}
+    assert inserted == {
+        "bakta_type": [["cds"]],
+        "bakta_strand": [["+"]],
+        "bakta_gene": [["gene1"]],
+        "bakta_product": [["hypothetical protein"]],
+    }
+
 # Run tests
 if __name__ == "__main__":
     pytest.main()
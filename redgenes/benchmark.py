@@ -0,0 +1,551 @@
+import os
+import json
+import time
+import click
+import random
+import shutil
+import logging
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from functools import lru_cache
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from profiling import PROFILER
+from sql_initialize_db import initialize_db, get_patch_list, execute_patch_file
+import workflow
+from bakta_annotations import (
+    extract_bakta_results,
+    insert_bakta_results,
+    explode_dbxrefs,
+    insert_dbxref_frame,
+    DBXREF_TABLES,
+)
+from utils import read_gff_file, extract_gff_info, parse_gff3
+from similarity import normalize, top_k, ExactIndex, build_ivf_index
+
+
+TEST_FILES = Path(__file__).parent / "test_files"
+BAKTA_HEADER = [
+    "# Annotated with Bakta",
+    "# Software: v1.8.2",
+    "# Database: v5.0, full",
+    "# DOI: 10.1099/mgen.0.000685",
+    "# URL: github.com/oschwengers/bakta",
+    "#Sequence Id\tType\tStart\tStop\tStrand\tLocus Tag\tGene\tProduct\tDbXrefs",
+]
+PRODUCTS = [
+    "hypothetical protein",
+    "hypothetical protein",
+    "hypothetical protein",
+    "DNA-directed RNA polymerase subunit beta",
+    "ABC transporter ATP-binding protein",
+    "30S ribosomal protein S12",
+    "Elongation factor Tu",
+    "TonB-dependent receptor",
+]
+GENES = [None, None, "rpoB", "rpsL", "tuf", "gyrA", "recA"]
+SCALES = [10, 1000, 10000]
+# Tables written by each stage of db_insertion
+STAGE_TABLES = {
+    "qc": ["identifier", "md_info", "qc_info", "load_ledger"],
+    "bakta": ["bakta", "bakta_type", "bakta_strand", "bakta_gene", "bakta_product"]
+    + ["bakta_fts_data", "bakta_fts_idx", "bakta_fts_docsize"]
+    + DBXREF_TABLES,
+}
+
+
+################################
+# Synthetic inputs
+################################
+@lru_cache(maxsize=None)
+def read_contig_lengths(fasta_path):
+    """Return [(contig_id, length)] of a FASTA file."""
+    contigs = []
+    with open(fasta_path) as f:
+        for line in f:
+            if line.startswith(">"):
+                contigs.append([line[1:].split()[0], 0])
+            elif contigs:
+                contigs[-1][1] += len(line.rstrip())
+    return [tuple(contig) for contig in contigs]
+
+
+def synthetic_dbxrefs(rng):
+    """Return a Bakta-like DbXrefs string for one CDS."""
+    n = rng.randrange(1, 100000)
+    return ", ".join(
+        [
+            "SO:0001217",
+            f"UniRef:UniRef50_A0A{n:06d}",
+            f"UniRef:UniRef90_A0A{n:06d}",
+            f"UniParc:UPI{n:010X}",
+            f"RefSeq:WP_{n:09d}.1",
+            f"KEGG:K{n % 25000:05d}",
+            f"PFAM:PF{n % 20000:05d}",
+            f"GO:{n % 50000:07d}",
+        ]
+    )
+
+
+def synthetic_features(fasta_path, feature_length=1000, seed=0):
+    """Yield Bakta-like feature fields, one feature per feature_length bp of fasta_path."""
+    rng = random.Random(seed)
+    prefix = Path(fasta_path).stem[:8].upper()
+    num_features = 0
+    for contig_id, length in read_contig_lengths(fasta_path):
+        for start in range(1, length - feature_length, feature_length):
+            num_features += 1
+            kind = rng.random()
+            if kind < 0.9:
+                ftype, product, dbxrefs = "cds", rng.choice(PRODUCTS), synthetic_dbxrefs(rng)
+            elif kind < 0.97:
+                ftype, product, dbxrefs = "tRNA", "tRNA-Leu", "SO:0000253"
+            else:
+                ftype, product, dbxrefs = "gap", "gap (100 bp)", ""
+            yield [
+                contig_id,
+                ftype,
+                start,
+                start + feature_length - 100,
+                rng.choice("+-"),
+                f"{prefix}_{num_features * 5:05d}",
+                (rng.choice(GENES) or "") if ftype == "cds" else "",
+                product,
+                dbxrefs,
+            ]
+
+
+def synthetic_bakta_tsv(fasta_path, out_path, feature_length=1000, seed=0):
+    """Write a Bakta-like TSV with one feature per feature_length bp of fasta_path.
+
+    Returns the number of feature lines written.
+    """
+    num_features = 0
+    with open(out_path, "w") as f:
+        f.write("\n".join(BAKTA_HEADER) + "\n")
+        for fields in synthetic_features(fasta_path, feature_length, seed):
+            num_features += 1
+            f.write("\t".join(map(str, fields)) + "\n")
+    return num_features
+
+
+def synthetic_bakta_gff3(fasta_path, out_path, feature_length=1000, seed=0):
+    """Write the features of synthetic_bakta_tsv as Bakta GFF3.
+
+    Returns the number of feature lines written.
+    """
+    num_features = 0
+    with open(out_path, "w") as f:
+        f.write("##gff-version 3\n")
+        for contig_id, length in read_contig_lengths(fasta_path):
+            f.write(f"##sequence-region {contig_id} 1 {length}\n")
+        for contig_id, ftype, start, stop, strand, locus_tag, gene, product, dbxrefs in synthetic_features(
+            fasta_path, feature_length, seed
+        ):
+            num_features += 1
+            attributes = f"ID={locus_tag};Name={product};locus_tag={locus_tag};product={product}"
+            if gene:
+                attributes += f";gene={gene}"
+            if dbxrefs:
+                attributes += f";Dbxref={dbxrefs.replace(', ', ',')}"
+            phase = "0" if ftype == "cds" else "."
+            source = "Prodigal" if ftype == "cds" else "tRNAscan-SE"
+            f.write(f"{contig_id}\t{source}\t{ftype}\t{start}\t{stop}\t.\t{strand}\t{phase}\t{attributes}\n")
+        f.write("##FASTA\n")
+        with open(fasta_path) as fasta:
+            shutil.copyfileobj(fasta, f)
+    return num_features
+
+
+def synthetic_checkm_stats(fasta_path, out_path, seed=0):
+    """Write a CheckM bin_stats_ext.tsv line for fasta_path."""
+    rng = random.Random(seed)
+    lengths = sorted((length for _, length in read_contig_lengths(fasta_path)), reverse=True)
+    stats = {
+        "marker lineage": "k__Bacteria",
+        "lineage_uid": "UID203",
+        "# genomes": 5449,
+        "# markers": 104,
+        "# marker sets": 58,
+        "Completeness": round(rng.uniform(90, 100), 2),
+        "Contamination": round(rng.uniform(0, 5), 2),
+        "GC": 0.45,
+        "Genome size": sum(lengths),
+        "# scaffolds": len(lengths),
+        "# contigs": len(lengths),
+        "Longest scaffold": lengths[0],
+        "Longest contig": lengths[0],
+        "N50 (scaffolds)": lengths[len(lengths) // 2],
+        "N50 (contigs)": lengths[len(lengths) // 2],
+        "Mean scaffold length": sum(lengths) / len(lengths),
+        "Mean contig length": sum(lengths) / len(lengths),
+        "Coding density": 0.89,
+        "Translation table": 11,
+        "# predicted genes": sum(lengths) // 1000,
+    }
+    with open(out_path, "w") as f:
+        f.write(f"{Path(fasta_path).stem}\t{stats}\n")
+
+
+def synthetic_dataset(out_dir, num_genomes, fasta_paths=None, feature_length=1000):
+    """Write Bakta TSVs, CheckM stats and a manifest for num_genomes genomes
+    laid over the contigs of fasta_paths (test_files by default).
+
+    Files already in out_dir are reused. Returns the path of the manifest.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fasta_paths = [str(path) for path in fasta_paths or sorted(TEST_FILES.glob("*.fa"))]
+    rows = []
+    for i in range(num_genomes):
+        fasta_path = fasta_paths[i % len(fasta_paths)]
+        accession = f"GCA_{i:09d}.1"
+        bakta_path = out_dir / f"{accession}.tsv"
+        checkm_path = out_dir / f"{accession}.bin_stats_ext.tsv"
+        if not bakta_path.exists():
+            synthetic_bakta_tsv(fasta_path, bakta_path, feature_length, seed=i)
+        if not checkm_path.exists():
+            synthetic_checkm_stats(fasta_path, checkm_path, seed=i)
+        rows.append([fasta_path, accession, str(bakta_path), str(checkm_path), "synthetic"])
+
+    manifest = out_dir / f"manifest_{num_genomes}.tsv"
+    columns = ["local_path", "assembly_accession", "bakta_path", "checkm_path", "source"]
+    pd.DataFrame(rows, columns=columns).to_csv(manifest, sep="\t", index=False)
+    return manifest
+
+
+################################
+# Benchmarks
+################################
+def peak_rss_mib():
+    """Peak resident set size of this process and its finished children."""
+    return sum(
+        resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    ) / 1024
+
+
+def table_stats():
+    """Return {table: (rows, bytes)}, bytes including the table's indexes."""
+    with TRN:
+        sql = """
+            SELECT m.tbl_name, sum(s.pgsize)
+            FROM dbstat s JOIN sqlite_master m ON s.name = m.name
+            GROUP BY m.tbl_name"""
+        TRN.add(sql)
+        sizes = dict(TRN.execute_fetchindex())
+        counts = {}
+        for table in sizes:
+            TRN.add(f"SELECT count(*) FROM {table}")
+            counts[table] = TRN.execute_fetchflatten()[0]
+    return {table: (counts[table], sizes[table]) for table in sizes}
+
+
+def bench_ingestion(manifest, jobs=1, batch_size=100, bulk_load=False):
+    """Run db_insertion on manifest against a temporary database.
+
+    Returns a report with genomes/s, rows/s and database bytes per stage,
+    peak RSS and the size of the database file. Stage times come from the
+    profiler, so parsing done in worker processes is included.
+    """
+    num_genomes = len(pd.read_csv(manifest, sep="\t", usecols=["assembly_accession"]))
+    logger = logging.getLogger("redgenes.benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        redgenes_config.dbpath = str(Path(tmp_dir) / "benchmark.db")
+        if bulk_load:
+            redgenes_config.use_profile("bulk_load")
+        PROFILER.start()
+        start = time.perf_counter()
+        try:
+            workflow.run_db_insertion(str(manifest), tmp_dir, logger, jobs, batch_size, bulk_load)
+        finally:
+            PROFILER.stop()
+        total_seconds = time.perf_counter() - start
+        stats = table_stats()
+        TRN.close()
+        db_bytes = sum(path.stat().st_size for path in Path(tmp_dir).glob("benchmark.db*"))
+
+    stages = {}
+    for stage, totals in PROFILER.totals.items():
+        seconds = totals["seconds"] or 1e-9
+        stages[stage] = {
+            "seconds": round(totals["seconds"], 3),
+            "sql_seconds": round(totals["sql_seconds"], 3),
+            "genomes_per_s": round(num_genomes / seconds, 1),
+            "rows": totals["rows_written"],
+            "rows_per_s": round(totals["rows_written"] / seconds),
+            "bytes_read": totals["bytes_read"],
+            "db_bytes": sum(stats.get(table, (0, 0))[1] for table in STAGE_TABLES.get(stage, [])),
+        }
+    return {
+        "genomes": num_genomes,
+        "jobs": jobs,
+        "bulk_load": bulk_load,
+        "seconds": round(total_seconds, 3),
+        "genomes_per_s": round(num_genomes / total_seconds, 1),
+        "peak_rss_mib": round(peak_rss_mib(), 1),
+        "db_bytes": db_bytes,
+        "stages": stages,
+    }
+
+def _fresh_db(tmp_dir, name):
+    """Point redgenes at a new database file under tmp_dir and create the schema."""
+    redgenes_config.dbpath = str(Path(tmp_dir) / f"{name}.db")
+    initialize_db()
+
+
+def _patched_db(tmp_dir, name, last_patch):
+    """Like _fresh_db, but only apply the patches up to last_patch."""
+    redgenes_config.dbpath = str(Path(tmp_dir) / f"{name}.db")
+    for patch in get_patch_list("support_files"):
+        if int(patch.stem) <= last_patch:
+            execute_patch_file(patch)
+
+
+def bench_bakta_insert(fasta_paths, repeats=3):
+    """Time insert_bakta_results in bulk and row-by-row mode.
+
+    Returns {mode: (rows, seconds)} summed over all fasta_paths and repeats.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        frames = []
+        for i, fasta_path in enumerate(fasta_paths):
+            tsv_path = Path(tmp_dir) / f"genome_{i}.tsv"
+            synthetic_bakta_tsv(fasta_path, tsv_path, seed=i)
+            frames.append(extract_bakta_results(str(tsv_path)))
+
+        for mode, bulk in [("row-by-row", False), ("bulk", True)]:
+            _fresh_db(tmp_dir, mode)
+            rows, seconds = 0, 0.0
+            for repeat in range(repeats):
+                for entity_id, bakta_df in enumerate(frames, start=1):
+                    bakta_df.insert(loc=0, column="entity_id", value=entity_id)
+                    args_bakta = bakta_df.iloc[:, 0:9].values.tolist()
+                    bakta_df.pop("entity_id")
+                    start = time.perf_counter()
+                    with TRN:
+                        accessions = insert_bakta_results(entity_id, args_bakta, bulk=bulk)
+                    seconds += time.perf_counter() - start
+                    rows += len(accessions)
+            results[mode] = (rows, seconds)
+    return results
+
+
+def bench_dbxref(fasta_paths, repeats=3, lookups=1000):
+    """Compare the dbxref tables before patch 006 (AUTOINCREMENT key and an
+    accession index) and after it (WITHOUT ROWID, clustered on the accession).
+
+    Every genome is loaded repeats times, then lookups random KEGG and RefSeq
+    accessions are resolved to their bakta accessions.
+    Returns {schema: {"rows", "insert_seconds", "lookups", "lookup_seconds"}}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        frames = []
+        for i, fasta_path in enumerate(fasta_paths):
+            tsv_path = Path(tmp_dir) / f"genome_{i}.tsv"
+            synthetic_bakta_tsv(fasta_path, tsv_path, seed=i)
+            frames.append(extract_bakta_results(str(tsv_path)))
+
+        for schema, last_patch in [("rowid", 5), ("clustered", 6)]:
+            _patched_db(tmp_dir, schema, last_patch)
+            rows, insert_seconds, queries = 0, 0.0, []
+            for repeat in range(repeats):
+                for entity_id, bakta_df in enumerate(frames, start=1):
+                    with TRN:
+                        args_bakta = [[entity_id, *values] for values in bakta_df.iloc[:, 0:8].values.tolist()]
+                        accessions = insert_bakta_results(entity_id, args_bakta)
+                        dbxref_df = explode_dbxrefs(pd.DataFrame({
+                            "bakta_accession": accessions,
+                            "dbxrefs": bakta_df["dbxrefs"].to_numpy(),
+                        }))
+                        start = time.perf_counter()
+                        insert_dbxref_frame(dbxref_df)
+                    insert_seconds += time.perf_counter() - start
+                    rows += len(dbxref_df)
+                    queries.extend(dbxref_df[dbxref_df["table"].isin(["kegg", "refseq"])][["table", "accession"]].itertuples(index=False, name=None))
+
+            rng = random.Random(0)
+            queries = rng.sample(queries, min(lookups, len(queries)))
+            start = time.perf_counter()
+            with TRN:
+                for table, accession in queries:
+                    TRN.add(f"SELECT bakta_accession FROM {table} WHERE {table.upper()} = ?", [accession])
+                    TRN.execute_fetchflatten()
+            results[schema] = {
+                "rows": rows,
+                "insert_seconds": insert_seconds,
+                "lookups": len(queries),
+                "lookup_seconds": time.perf_counter() - start,
+            }
+    return results
+
+
+def bench_gff3(fasta_paths, repeats=3):
+    """Time parse_gff3 against the skbio path on Bakta-like GFF3 files.
+
+    Returns {parser: (features, seconds)} summed over all fasta_paths and repeats.
+    """
+    parsers = {
+        "skbio": lambda path: extract_gff_info(read_gff_file(path)),
+        "parse_gff3": parse_gff3,
+    }
+    results = {name: (0, 0.0) for name in parsers}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, fasta_path in enumerate(fasta_paths):
+            gff_path = str(Path(tmp_dir) / f"genome_{i}.gff3")
+            synthetic_bakta_gff3(fasta_path, gff_path, seed=i)
+            for repeat in range(repeats):
+                for name, parser in parsers.items():
+                    start = time.perf_counter()
+                    gff_df = parser(gff_path)
+                    seconds = time.perf_counter() - start
+                    features, total = results[name]
+                    results[name] = (features + len(gff_df), total + seconds)
+    return results
+
+
+def synthetic_embeddings(num_vectors, dimension, seed=0):
+    """Unit vectors scattered around num_vectors / 100 random centers, so
+    neighbors cluster as gene families do."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(num_vectors // 100, 1), dimension)).astype(np.float32)
+    noise = rng.normal(scale=1.0, size=(num_vectors, dimension)).astype(np.float32)
+    return normalize(centers[rng.integers(len(centers), size=num_vectors)] + noise)
+
+
+def bench_similarity(num_vectors=200000, dimension=128, num_queries=100, k=10, n_lists=None, n_probes=(1, 4, 16, 64)):
+    """Time exact and IVF top-k cosine search on synthetic embeddings and
+    measure the recall of the IVF results against the exact ones.
+
+    Returns {"exact": {...}, "build_seconds": ..., "ivf": {n_probe: {...}}},
+    latencies in seconds per query.
+    """
+    matrix = synthetic_embeddings(num_vectors, dimension)
+    accessions = np.arange(1, num_vectors + 1)
+    rng = np.random.default_rng(1)
+    queries = matrix[rng.choice(num_vectors, num_queries, replace=False)]
+    queries = normalize(queries + rng.normal(scale=0.1, size=queries.shape).astype(np.float32))
+
+    exact = ExactIndex(accessions, matrix)
+    start = time.perf_counter()
+    truth, _ = exact.search(queries, k)
+    results = {"exact": {"batch_seconds_per_query": (time.perf_counter() - start) / num_queries}}
+    start = time.perf_counter()
+    for query in queries:
+        exact.search(query, k)
+    results["exact"]["seconds_per_query"] = (time.perf_counter() - start) / num_queries
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        index = build_ivf_index(accessions, matrix, Path(tmp_dir) / "index", n_lists)
+        results["build_seconds"] = time.perf_counter() - start
+        results["lists"] = index.info["lists"]
+        results["ivf"] = {}
+        for n_probe in n_probes:
+            start = time.perf_counter()
+            found = np.concatenate([index.search(query, k, n_probe)[0] for query in queries])
+            seconds = (time.perf_counter() - start) / num_queries
+            recall = np.mean([len(set(hit) & set(true)) / k for hit, true in zip(found, truth)])
+            results["ivf"][n_probe] = {"seconds_per_query": seconds, "recall": recall}
+    return results
+
+
+@click.group()
+def benchmark():
+    pass
+
+
+@benchmark.command("bakta-insert")
+@click.option("--fasta", "fasta_paths", type=click.Path(exists=True), multiple=True)
+@click.option("--repeats", type=int, default=3, show_default=True)
+def bakta_insert(fasta_paths, repeats):
+    """Compare bulk and row-by-row Bakta insertion (defaults to test_files)."""
+    fasta_paths = fasta_paths or sorted(TEST_FILES.glob("*.fa"))
+    for mode, (rows, seconds) in bench_bakta_insert(fasta_paths, repeats).items():
+        click.echo(f"{mode:>12}: {rows} rows in {seconds:.3f}s ({rows / seconds:,.0f} rows/s)")
+
+
+@benchmark.command("dbxref")
+@click.option("--fasta", "fasta_paths", type=click.Path(exists=True), multiple=True)
+@click.option("--repeats", type=int, default=3, show_default=True)
+@click.option("--lookups", type=int, default=1000, show_default=True)
+def dbxref(fasta_paths, repeats, lookups):
+    """Compare dbxref insert rate and accession lookup latency before and after patch 006 (defaults to test_files)."""
+    fasta_paths = fasta_paths or sorted(TEST_FILES.glob("*.fa"))
+    for schema, stats in bench_dbxref(fasta_paths, repeats, lookups).items():
+        click.echo(
+            f"{schema:>10}: {stats['rows']} rows in {stats['insert_seconds']:.3f}s "
+            f"({stats['rows'] / stats['insert_seconds']:,.0f} rows/s), "
+            f"{stats['lookups']} lookups at {stats['lookup_seconds'] / stats['lookups'] * 1e6:.0f} us"
+        )
+
+
+@benchmark.command("gff3")
+@click.option("--fasta", "fasta_paths", type=click.Path(exists=True), multiple=True)
+@click.option("--repeats", type=int, default=3, show_default=True)
+def gff3(fasta_paths, repeats):
+    """Compare GFF3 parsing throughput of parse_gff3 and skbio (defaults to test_files)."""
+    fasta_paths = fasta_paths or sorted(TEST_FILES.glob("*.fa"))
+    for parser, (features, seconds) in bench_gff3(fasta_paths, repeats).items():
+        click.echo(f"{parser:>12}: {features} features in {seconds:.3f}s ({features / seconds:,.0f} features/s)")
+
+
+@benchmark.command("similarity")
+@click.option("--vectors", "num_vectors", type=int, default=200000, show_default=True)
+@click.option("--dimension", type=int, default=128, show_default=True)
+@click.option("--queries", "num_queries", type=int, default=100, show_default=True)
+@click.option("--top-k", type=int, default=10, show_default=True)
+@click.option("--n-lists", type=int, required=False, help="[default: 4 * sqrt(vectors)]")
+@click.option("--n-probe", "n_probes", type=int, multiple=True, help="Repeatable [default: 1, 4, 16, 64].")
+def similarity(num_vectors, dimension, num_queries, top_k, n_lists, n_probes):
+    """Compare exact and IVF cosine search latency and IVF recall@k on synthetic embeddings."""
+    results = bench_similarity(num_vectors, dimension, num_queries, top_k, n_lists, n_probes or (1, 4, 16, 64))
+    exact = results["exact"]
+    click.echo(
+        f"   exact: {exact['seconds_per_query'] * 1e3:.2f} ms/query, "
+        f"{exact['batch_seconds_per_query'] * 1e3:.2f} ms/query batched, recall 1.000"
+    )
+    click.echo(f"     ivf: {results['lists']} lists built in {results['build_seconds']:.1f}s")
+    for n_probe, stats in results["ivf"].items():
+        click.echo(f"{n_probe:>8}: {stats['seconds_per_query'] * 1e3:.2f} ms/query, recall {stats['recall']:.3f}")
+
+
+@benchmark.command("ingestion")
+@click.option("--genomes", "scales", type=int, multiple=True, help=f"Number of synthetic genomes, repeatable [default: {SCALES[0]}; the suite uses {SCALES}].")
+@click.option("--fixtures-dir", type=click.Path(), required=False, help="Keep and reuse the synthetic inputs here.")
+@click.option("--feature-length", type=int, default=1000, show_default=True, help="One Bakta feature per this many bp.")
+@click.option("--jobs", type=int, default=1, show_default=True)
+@click.option("--batch-size", type=int, default=100, show_default=True)
+@click.option("--bulk-load", is_flag=True)
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON report per scale.")
+def ingestion(scales, fixtures_dir, feature_length, jobs, batch_size, bulk_load, as_json):
+    """Run db_insertion on synthetic Bakta/CheckM inputs and report throughput."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_genomes in scales or SCALES[:1]:
+            out_dir = Path(fixtures_dir or tmp_dir) / f"genomes_{num_genomes}_{feature_length}"
+            manifest = synthetic_dataset(out_dir, num_genomes, feature_length=feature_length)
+            report = bench_ingestion(manifest, jobs, batch_size, bulk_load)
+            if as_json:
+                click.echo(json.dumps(report))
+                continue
+            click.echo(
+                f"{report['genomes']} genomes in {report['seconds']}s "
+                f"({report['genomes_per_s']} genomes/s), peak RSS {report['peak_rss_mib']} MiB, "
+                f"database {report['db_bytes'] / 2**20:.1f} MiB"
+            )
+            for stage, stats in report["stages"].items():
+                click.echo(
+                    f"{stage:>8}: {stats['seconds']}s ({stats['sql_seconds']}s SQL), {stats['genomes_per_s']} genomes/s, "
+                    f"{stats['rows']} rows ({stats['rows_per_s']} rows/s), {stats['db_bytes'] / 2**20:.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,212 @@
+import os
+import gzip
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from functools import lru_cache
+from sql_connection import TRN
+from fasta_stats import header_positions, concatenated_ranges
+
+
+# 2-bit codes of the nucleotides, 4 for any other byte
+BASE_CODE = np.full(256, 4, dtype=np.uint8)
+for code, bases in enumerate(["Aa", "Cc", "Gg", "TtUu"]):
+    for base in bases:
+        BASE_CODE[ord(base)] = code
+# Size of the genes x vocabulary kmer count matrix built at a time when
+# computing gene embeddings, 64 MiB of float32
+EMBEDDING_BATCH_CELLS = 2**24
+
+
+class KmerVectors:
+    """kmer2vec vectors as a read-only, memory-mapped float32 matrix with one
+    row per kmer, and a lookup from the 2-bit code of any kmer to its row.
+    A kmer missing from the vocabulary uses the row of its reverse complement,
+    so canonical kmer vocabularies work too."""
+
+    def __init__(self, digits, vectors):
+        self.k = digits.shape[1]
+        self.vectors = vectors
+        self.dimension = vectors.shape[1]
+        codes = digits.astype(np.int64) @ 4 ** np.arange(self.k - 1, -1, -1)
+        self.rows = np.full(4**self.k, -1, dtype=np.int32)
+        self.rows[reverse_complement_codes(codes, self.k)] = np.arange(len(codes))
+        self.rows[codes] = np.arange(len(codes))
+
+
+def reverse_complement_codes(codes, k):
+    """2-bit codes of the reverse complements of kmers given as 2-bit codes."""
+    complement = 4**k - 1 - codes
+    reverse = np.zeros_like(complement)
+    for _ in range(k):
+        reverse = reverse * 4 + complement % 4
+        complement //= 4
+    return reverse
+
+
+def _cache_paths(path):
+    path = Path(path)
+    return path.with_name(path.name + ".kmers.npy"), path.with_name(path.name + ".vectors.npy")
+
+
+def convert_kmer_vectors(path):
+    """Convert a kmer2vec text file, word2vec format with or without its
+    "<count> <dimension>" header line, into .npy files next to it: the kmers
+    as rows of 2-bit digits and their vectors as float32. Kmers with other
+    bases than A, C, G and T are dropped."""
+    with open(path) as f:
+        header = f.readline().split()
+    df = pd.read_csv(path, sep=" ", header=None, skiprows=1 if len(header) == 2 else 0, dtype={0: str})
+    # trailing spaces read as empty columns
+    df = df.dropna(axis=1, how="all")
+    kmers = df.pop(0).str.encode("ascii")
+    if kmers.str.len().nunique() != 1:
+        raise ValueError(f"{path} holds kmers of different lengths")
+    digits = BASE_CODE[np.frombuffer(b"".join(kmers), dtype=np.uint8).reshape(len(kmers), -1)]
+    keep = (digits < 4).all(axis=1)
+
+    kmers_path, vectors_path = _cache_paths(path)
+    # written to temporary files and renamed, so a reader never sees a partial file
+    for out_path, array in [(kmers_path, digits[keep]), (vectors_path, df.to_numpy(np.float32)[keep])]:
+        tmp_path = out_path.with_name(out_path.name + f".{os.getpid()}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, out_path)
+
+
+@lru_cache(maxsize=None)
+def load_kmer_vectors(path):
+    """Load a kmer2vec file once per process. The text is converted on first
+    use and the vectors are then memory-mapped from the .npy file."""
+    kmers_path, vectors_path = _cache_paths(path)
+    if not vectors_path.exists() or vectors_path.stat().st_mtime < Path(path).stat().st_mtime:
+        convert_kmer_vectors(path)
+    return KmerVectors(np.load(kmers_path), np.load(vectors_path, mmap_mode="r"))
+
+
+def read_contigs(fasta_path):
+    """Return {contig id: 2-bit codes of its bases} of a FASTA file, gzipped
+    or not. The contig id is the header up to the first whitespace."""
+    if str(fasta_path).endswith(".gz"):
+        with gzip.open(fasta_path, "rb") as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+    else:
+        data = np.fromfile(fasta_path, dtype=np.uint8)
+    starts, header_ends = header_positions(data)
+    contig_ends = np.append(starts[1:], len(data))
+    contigs = {}
+    for start, header_end, contig_end in zip(starts, header_ends, contig_ends):
+        contig_id = data[start + 1:header_end].tobytes().split(maxsplit=1)[0].decode()
+        sequence = data[header_end + 1:contig_end]
+        sequence = sequence[(sequence != ord("\n")) & (sequence != ord("\r"))]
+        contigs[contig_id] = BASE_CODE[sequence]
+    return contigs
+
+
+def kmer_rows(bases, kmer_vectors):
+    """Rows in kmer_vectors of the kmer starting at every position of a
+    contig and of its reverse complement, -1 where the kmer holds other bases
+    than A, C, G and T."""
+    k = kmer_vectors.k
+    n = len(bases) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    forward = np.zeros(n, dtype=np.int64)
+    reverse = np.zeros(n, dtype=np.int64)
+    for j in range(k):
+        window = np.minimum(bases[j:j + n], 3).astype(np.int64)
+        forward = forward * 4 + window
+        reverse += (3 - window) * 4**j
+    other = np.concatenate([[0], np.cumsum(bases == 4)])
+    invalid = (other[k:] - other[:-k]) > 0
+    rows = kmer_vectors.rows
+    return np.where(invalid, -1, rows[forward]), np.where(invalid, -1, rows[reverse])
+
+
+def gene_embeddings(contigs, features, kmer_vectors):
+    """Embed every feature as the mean vector of the kmers within it, read on
+    its strand. features has contig_id, start, stop (1-based, inclusive) and
+    strand columns.
+
+    Returns a float32 matrix with a row per feature; rows of features without
+    any known kmer, or on contigs missing from contigs, are NaN.
+    """
+    k = kmer_vectors.k
+    # the forward then the reverse complement rows of every contig, end to end
+    forward, reverse, offsets, sizes, total = [], [], {}, {}, 0
+    for contig_id, bases in contigs.items():
+        rows_forward, rows_reverse = kmer_rows(bases, kmer_vectors)
+        forward.append(rows_forward)
+        reverse.append(rows_reverse)
+        offsets[contig_id], sizes[contig_id] = total, len(rows_forward)
+        total += len(rows_forward)
+    all_rows = np.concatenate(forward + reverse) if contigs else np.zeros(0, dtype=np.int32)
+
+    # [lows, highs) of every feature in all_rows, empty on unknown contigs
+    offset = features["contig_id"].map(offsets).fillna(0).to_numpy(np.int64)
+    offset += np.where(features["strand"].to_numpy() == "-", total, 0)
+    limits = offset + features["contig_id"].map(sizes).fillna(0).to_numpy(np.int64)
+    lows = np.minimum(offset + features["start"].to_numpy(np.int64) - 1, limits)
+    highs = np.clip(offset + features["stop"].to_numpy(np.int64) - k + 1, lows, limits)
+
+    # Each batch of genes counts its kmers into a genes x vocabulary matrix
+    # and sums their vectors with one matrix product, far faster than adding
+    # the gathered vectors gene by gene
+    vocabulary = len(kmer_vectors.vectors)
+    batch_size = max(EMBEDDING_BATCH_CELLS // vocabulary, 1)
+    embeddings = np.full((len(features), kmer_vectors.dimension), np.nan, dtype=np.float32)
+    for first in range(0, len(features), batch_size):
+        low, high = lows[first:first + batch_size], highs[first:first + batch_size]
+        rows = all_rows[concatenated_ranges(low, high)]
+        genes = np.repeat(np.arange(len(low)), high - low)
+        known = rows >= 0
+        counts = np.bincount(genes[known] * vocabulary + rows[known], minlength=len(low) * vocabulary)
+        counts = counts.reshape(len(low), vocabulary).astype(np.float32)
+        totals = counts.sum(axis=1)
+        present = totals > 0
+        embeddings[first:first + batch_size][present] = (counts[present] @ kmer_vectors.vectors) / totals[present, None]
+    return embeddings
+
+
+def pack_embedding(vector):
+    """An embedding as stored in the embedding table, little-endian float32."""
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def unpack_embedding(blob):
+    """The float32 vector of an embedding table blob."""
+    return np.frombuffer(blob, dtype="<f4")
+
+
+def insert_embeddings(bakta_accessions, embeddings):
+    """Insert or replace one packed embedding per bakta_accession."""
+    sql = "INSERT OR REPLACE INTO embedding (bakta_accession, dimension, embedding) VALUES (?, ?, ?)"
+    args = [[int(accession), len(vector), pack_embedding(vector)] for accession, vector in zip(bakta_accessions, embeddings)]
+    with TRN:
+        TRN.add_bulk(sql, args)
+        return TRN.execute()[-1][0][0]
+
+
+def embed_genome(entity_id, fasta_path, kmer_vectors, logger=None):
+    """Compute and insert the embeddings of the Bakta features of one genome
+    from its FASTA file. Features whose contig is not in the FASTA file, as
+    when Bakta renamed the contigs, or without any known kmer are not
+    embedded and counted in a warning to logger. Returns the number of
+    embeddings inserted."""
+    with TRN:
+        sql = """
+            SELECT bakta_accession, contig_id, start, stop, strand
+            FROM bakta_info WHERE entity_id = ? ORDER BY bakta_accession"""
+        TRN.add(sql, [int(entity_id)])
+        features = pd.DataFrame(
+            [tuple(row) for row in TRN.execute_fetchindex()], columns=["bakta_accession", "contig_id", "start", "stop", "strand"])
+        if features.empty:
+            return 0
+        contigs = read_contigs(fasta_path)
+        embeddings = gene_embeddings(contigs, features, kmer_vectors)
+        embedded = ~np.isnan(embeddings).any(axis=1)
+        if logger is not None and not embedded.all():
+            unknown_contig = int((~features["contig_id"].isin(list(contigs))).sum())
+            logger.warning(
+                f"{int((~embedded).sum())} of {len(features)} features of {fasta_path} not embedded, "
+                f"{unknown_contig} of them on contigs not in the FASTA file")
+        return insert_embeddings(features["bakta_accession"][embedded], embeddings[embedded])
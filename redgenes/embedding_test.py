@@ -0,0 +1,82 @@
+import logging
+import itertools
+import pytest
+import numpy as np
+import pandas as pd
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db
+from metadata import insert_metadata, IDENTIFIER_CACHE
+from bakta_annotations import load_bakta_chunk, BAKTA_COLUMNS
+from embedding import load_kmer_vectors, read_contigs, gene_embeddings, embed_genome, unpack_embedding
+
+KMERS = ["".join(kmer) for kmer in itertools.product("ACGT", repeat=2)]
+
+
+def vector(kmer):
+    i = KMERS.index(kmer)
+    return np.array([i, 1, -2 * i], dtype=np.float32)
+
+
+@pytest.fixture
+def kmer_vectors(tmp_path):
+    path = tmp_path / "kmer2vec.txt"
+    lines = [f"{len(KMERS)} 3"] + [f"{kmer} " + " ".join(map(str, vector(kmer))) + " " for kmer in KMERS]
+    path.write_text("\n".join(lines) + "\n")
+    return load_kmer_vectors(str(path))
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    path = tmp_path / "genome.fa"
+    path.write_text(">c1 description\nACGTAC\nGT\n>c2\nAANAA\n")
+    return path
+
+
+def test_load_kmer_vectors(kmer_vectors, tmp_path):
+    assert (kmer_vectors.k, kmer_vectors.dimension) == (2, 3)
+    assert isinstance(kmer_vectors.vectors, np.memmap)
+    assert (tmp_path / "kmer2vec.txt.vectors.npy").exists()
+    assert kmer_vectors.rows[KMERS.index("GT")] == KMERS.index("GT")
+
+
+def test_read_contigs(fasta):
+    contigs = read_contigs(fasta)
+    assert list(contigs) == ["c1", "c2"]
+    assert contigs["c1"].tolist() == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert contigs["c2"].tolist() == [0, 0, 4, 0, 0]
+
+
+def test_gene_embeddings(kmer_vectors, fasta):
+    features = pd.DataFrame(
+        [["c1", 1, 4, "+"], ["c1", 1, 3, "-"], ["c2", 1, 5, "+"], ["c3", 1, 5, "+"]],
+        columns=["contig_id", "start", "stop", "strand"])
+    embeddings = gene_embeddings(read_contigs(fasta), features, kmer_vectors)
+    np.testing.assert_allclose(embeddings[0], np.mean([vector("AC"), vector("CG"), vector("GT")], axis=0))
+    # ACG read on the reverse strand is CGT
+    np.testing.assert_allclose(embeddings[1], np.mean([vector("CG"), vector("GT")], axis=0))
+    # kmers with an N are skipped
+    np.testing.assert_allclose(embeddings[2], vector("AA"))
+    assert np.isnan(embeddings[3]).all()
+
+
+def test_embed_genome(tmp_path, monkeypatch, caplog, kmer_vectors, fasta):
+    logger = logging.getLogger("test")
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "embedding.db"))
+    IDENTIFIER_CACHE.clear()
+    initialize_db()
+    features = [["c1", "cds", 1, 4, "+", "LT1", None, "hypothetical protein", None],
+                ["c9", "cds", 1, 4, "+", "LT2", None, "hypothetical protein", None]]
+    try:
+        with TRN:
+            entity_id = insert_metadata({"local_path": str(fasta), "assembly_accession": "GCA_1", "source": "NCBI"})[0]
+            load_bakta_chunk(entity_id, pd.DataFrame(features, columns=BAKTA_COLUMNS))
+            assert embed_genome(entity_id, fasta, kmer_vectors, logger) == 1
+            TRN.add("SELECT bakta_accession, dimension, embedding FROM embedding")
+            [(accession, dimension, blob)] = TRN.execute_fetchindex()
+        assert (accession, dimension) == (1, 3)
+        np.testing.assert_allclose(unpack_embedding(blob), [6, 1, -12])
+        assert "1 of 2 features" in caplog.text and "1 of them on contigs not in the FASTA file" in caplog.text
+    finally:
+        IDENTIFIER_CACHE.clear()
+        TRN.close()
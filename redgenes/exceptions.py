@@ -38,6 +38,14 @@ class BaktaError(AnnotationError):
     pass
 
 
+class QualityControlError(Error):
+    pass
+
+
+class CheckmError(QualityControlError):
+    pass
+
+
 class InputError(Error):
     pass
 
@@ -0,0 +1,272 @@
+import os
+import csv
+import shutil
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import run_command_and_check_outputs
+from exceptions import BaktaError, CheckmError
+from quality_control import read_checkm_table
+from fasta_stats import fasta_stats, prefilter
+
+
+MANIFEST_COLUMNS = ["local_path", "assembly_accession", "bakta_path", "checkm_path", "source"]
+# Written to <sample_dir>/checkm_results.txt, as run_checkm_bakta.sh did
+QC_PASS, QC_FAIL = "PASS", "FAIL"
+
+
+def sample_paths(fasta_path, output_dir):
+    """Output locations of one genome, in the layout of run_checkm_bakta.sh."""
+    name = Path(fasta_path).stem
+    sample_dir = Path(output_dir) / name
+    return {
+        "name": name,
+        "sample_dir": sample_dir,
+        "checkm_dir": sample_dir / "checkm",
+        "lineage_log": sample_dir / "checkm" / "lineage.log",
+        "bin_stats": sample_dir / "checkm" / "storage" / "bin_stats_ext.tsv",
+        "qc_result": sample_dir / "checkm_results.txt",
+        "bakta_dir": sample_dir / "bakta",
+        "bakta_tsv": sample_dir / "bakta" / f"{name}.tsv",
+    }
+
+
+def run_checkm(fasta_paths, output_dir, threads=1, batch_name=None):
+    """Run one checkm lineage_wf over a batch of genomes, so the marker sets
+    and the reference tree are loaded once per batch rather than once per
+    genome. The CheckM outputs are split per genome into lineage.log and
+    storage/bin_stats_ext.tsv of each sample directory.
+
+    Returns {name: CheckM table row} of the genomes CheckM reported.
+    """
+    names = [Path(fasta_path).stem for fasta_path in fasta_paths]
+    if len(set(names)) != len(names):
+        raise CheckmError(f"Genome names must be unique within a CheckM batch: {names}")
+    suffixes = {Path(fasta_path).suffix for fasta_path in fasta_paths}
+    if len(suffixes) != 1:
+        raise CheckmError(f"Genomes of a CheckM batch must share one extension: {suffixes}")
+
+    batch_dir = Path(output_dir) / "checkm_batches" / (batch_name or names[0])
+    bins_dir, checkm_dir = batch_dir / "bins", batch_dir / "checkm"
+    # lineage_wf does not reuse the output of an interrupted run
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    bins_dir.mkdir(parents=True)
+    for fasta_path in fasta_paths:
+        shutil.copy(fasta_path, bins_dir)
+
+    commands = [
+        "checkm", "lineage_wf", "--tab_table",
+        "-x", suffixes.pop().lstrip("."),
+        "-t", str(threads),
+        str(bins_dir), str(checkm_dir),
+    ]
+    bin_stats = checkm_dir / "storage" / "bin_stats_ext.tsv"
+    res, _ = run_command_and_check_outputs(commands, CheckmError, files=[bin_stats])
+    lineage_log = batch_dir / "lineage.log"
+    lineage_log.write_bytes(res.stdout)
+    split_checkm_outputs(lineage_log, bin_stats, fasta_paths, output_dir)
+    return read_checkm_table(lineage_log)
+
+
+def split_checkm_outputs(lineage_log, bin_stats, fasta_paths, output_dir):
+    """Write the CheckM table row and bin_stats_ext line of every genome of a
+    batch into its own sample directory, the files
+    quality_control.extract_checkm_results and read_checkm_table read."""
+    header = None
+    rows = {}
+    with open(lineage_log) as f:
+        for line in f:
+            bin_id = line.split("\t", 1)[0]
+            if bin_id == "Bin Id":
+                header = line
+            elif header:
+                rows[bin_id] = line
+    with open(bin_stats) as f:
+        stats = {line.split("\t", 1)[0]: line for line in f}
+
+    for fasta_path in fasta_paths:
+        paths = sample_paths(fasta_path, output_dir)
+        if paths["name"] not in rows or paths["name"] not in stats:
+            continue
+        shutil.rmtree(paths["checkm_dir"], ignore_errors=True)
+        paths["bin_stats"].parent.mkdir(parents=True)
+        paths["lineage_log"].write_text(header + rows[paths["name"]])
+        paths["bin_stats"].write_text(stats[paths["name"]])
+
+
+def qc_verdict(checkm_row, min_completeness=95, max_contamination=5):
+    """Whether a genome passes QC and goes on to Bakta."""
+    return (
+        checkm_row["Completeness"] > min_completeness
+        and checkm_row["Contamination"] < max_contamination
+    )
+
+
+def run_bakta(fasta_path, output_dir, threads=4, bakta_db=None):
+    """Annotate one genome with Bakta and return the path of its tsv."""
+    paths = sample_paths(fasta_path, output_dir)
+    # features keep the FASTA contig ids, which embed_genome matches them on
+    commands = [
+        "bakta", "--threads", str(threads), "--force", "--keep-contig-headers",
+        "--outdir", str(paths["bakta_dir"]), "--prefix", paths["name"],
+    ]
+    if bakta_db:
+        commands += ["--db", str(bakta_db)]
+    commands.append(str(fasta_path))
+    run_command_and_check_outputs(commands, BaktaError, files=[paths["bakta_tsv"]])
+    return paths["bakta_tsv"]
+
+
+def passes_prefilter(fasta_path, output_dir, logger, thresholds):
+    """Check the assembly statistics of a genome before CheckM, recording a
+    QC failure for genomes that cannot pass."""
+    paths = sample_paths(fasta_path, output_dir)
+    reasons = prefilter(fasta_stats(fasta_path), **thresholds)
+    if reasons:
+        paths["sample_dir"].mkdir(parents=True, exist_ok=True)
+        paths["qc_result"].write_text(f"{QC_FAIL}\n")
+        logger.info(f"QC failed for {paths['name']} before CheckM: {', '.join(reasons)}")
+    return not reasons
+
+
+def read_manifest_accessions(manifest_path):
+    """Accessions already in a manifest written by run_pipeline."""
+    if not Path(manifest_path).exists():
+        return set()
+    with open(manifest_path) as f:
+        return {row["assembly_accession"] for row in csv.DictReader(f, delimiter="\t")}
+
+
+@contextmanager
+def open_manifest(manifest_path):
+    """Open a manifest for appending, writing the header to a new one."""
+    new = not Path(manifest_path).exists() or Path(manifest_path).stat().st_size == 0
+    with open(manifest_path, "a", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        if new:
+            writer.writerow(MANIFEST_COLUMNS)
+            f.flush()
+        yield f, writer
+
+
+def run_pipeline(
+    fasta_paths,
+    output_dir,
+    logger,
+    cpus=None,
+    checkm_threads=1,
+    checkm_batch_size=1,
+    bakta_threads=4,
+    bakta_db=None,
+    min_completeness=95,
+    max_contamination=5,
+    source="external",
+    manifest_path=None,
+    prefilter_thresholds=None,
+):
+    """Run CheckM on every genome and Bakta on the genomes passing QC, using
+    at most cpus threads at once. Returns the path of the manifest and the
+    number of genomes annotated, failed_qc, with errors and skipped.
+
+    CheckM runs on checkm_batch_size genomes at a time, each batch using
+    checkm_threads. A genome goes to the Bakta queue as soon as it passes, and
+    queued Bakta runs start before further CheckM runs. Every annotated genome
+    is appended to the manifest right away, so an interrupted run keeps its
+    finished genomes. Genomes already in the manifest or that failed QC before
+    are skipped, genomes that passed QC before go straight to Bakta.
+
+    prefilter_thresholds are keyword arguments of fasta_stats.prefilter.
+    Genomes failing them fail QC without running CheckM.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(manifest_path or output_dir / f"{output_dir.name}_metadata.tsv")
+    cpus = cpus or os.cpu_count()
+    checkm_threads = min(checkm_threads, cpus)
+    bakta_threads = min(bakta_threads, cpus)
+
+    summary = dict.fromkeys(["annotated", "failed_qc", "errors", "skipped"], 0)
+    done = read_manifest_accessions(manifest_path)
+    waiting, annotate = deque(), deque()
+    for fasta_path in fasta_paths:
+        paths = sample_paths(fasta_path, output_dir)
+        verdict = paths["qc_result"].read_text().strip() if paths["qc_result"].exists() else None
+        if paths["name"] in done or verdict == QC_FAIL:
+            summary["skipped"] += 1
+        elif verdict == QC_PASS and paths["bin_stats"].exists():
+            # Bakta failed or was interrupted last time
+            annotate.append(fasta_path)
+        else:
+            waiting.append(fasta_path)
+    running = {}
+    free = cpus
+
+    with ThreadPoolExecutor(max_workers=cpus) as executor, open_manifest(manifest_path) as (f, writer):
+        while waiting or annotate or running:
+            while annotate and free >= bakta_threads:
+                fasta_path = annotate.popleft()
+                future = executor.submit(run_bakta, fasta_path, output_dir, bakta_threads, bakta_db)
+                running[future] = ("bakta", [fasta_path], bakta_threads)
+                free -= bakta_threads
+            # CheckM waits while a genome that passed QC waits for cpus
+            while waiting and not annotate and free >= checkm_threads:
+                batch = []
+                while waiting and len(batch) < checkm_batch_size:
+                    fasta_path = waiting.popleft()
+                    if prefilter_thresholds and not passes_prefilter(fasta_path, output_dir, logger, prefilter_thresholds):
+                        summary["failed_qc"] += 1
+                    else:
+                        batch.append(fasta_path)
+                if not batch:
+                    continue
+                future = executor.submit(run_checkm, batch, output_dir, checkm_threads)
+                running[future] = ("checkm", batch, checkm_threads)
+                free -= checkm_threads
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, batch, threads = running.pop(future)
+                free += threads
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{stage} failed for {', '.join(map(str, batch))}: {e}")
+                    summary["errors"] += len(batch)
+                    continue
+
+                if stage == "checkm":
+                    for fasta_path in batch:
+                        paths = sample_paths(fasta_path, output_dir)
+                        if paths["name"] not in result:
+                            logger.error(f"checkm reported no result for {fasta_path}")
+                            summary["errors"] += 1
+                            continue
+                        checkm_row = result[paths["name"]]
+                        passed = qc_verdict(checkm_row, min_completeness, max_contamination)
+                        paths["qc_result"].write_text(f"{QC_PASS if passed else QC_FAIL}\n")
+                        logger.info(
+                            f"QC {'passed' if passed else 'failed'} for {paths['name']}: completeness "
+                            f"{checkm_row['Completeness']}, contamination {checkm_row['Contamination']}"
+                        )
+                        if passed:
+                            annotate.append(fasta_path)
+                        else:
+                            summary["failed_qc"] += 1
+                else:
+                    fasta_path, paths = batch[0], sample_paths(batch[0], output_dir)
+                    writer.writerow([
+                        str(Path(fasta_path).resolve()),
+                        paths["name"],
+                        str(result.resolve()),
+                        str(paths["bin_stats"].resolve()),
+                        source,
+                    ])
+                    f.flush()
+                    summary["annotated"] += 1
+                    logger.info(f"Bakta finished for {paths['name']}")
+
+    logger.info(f"Annotation summary: {summary}")
+    return manifest_path, summary
@@ -0,0 +1,117 @@
+import os
+import sys
+import logging
+import pytest
+import pandas as pd
+from execution import run_pipeline
+from quality_control import extract_checkm_results, read_checkm_table
+
+# Stubs print or write what the real tools would and log "<start> <end> <threads>"
+# to $STUB_LOG. Bins named *low* fail QC, Bakta fails for *broken* genomes
+# and when contigs would be renamed.
+CHECKM_STUB = """#!{python}
+import os, sys, time, pathlib
+args = sys.argv[1:]
+bin_dir, out_dir = pathlib.Path(args[-2]), pathlib.Path(args[-1])
+ext, threads = args[args.index("-x") + 1], args[args.index("-t") + 1]
+start = time.time()
+time.sleep(0.1)
+(out_dir / "storage").mkdir(parents=True)
+print("[INFO] Running lineage_wf")
+print("Bin Id\\tMarker lineage\\t# genomes\\t# markers\\t# marker sets\\t0\\t1\\t2\\t3\\t4\\t5+\\tCompleteness\\tContamination\\tStrain heterogeneity")
+with open(out_dir / "storage" / "bin_stats_ext.tsv", "w") as f:
+    for fasta in bin_dir.glob("*." + ext):
+        completeness = 50.0 if "low" in fasta.stem else 99.1
+        print(f"{{fasta.stem}}\\tk__Bacteria (UID203)\\t5449\\t104\\t58\\t0\\t104\\t0\\t0\\t0\\t0\\t{{completeness}}\\t0.5\\t0.0")
+        stats = dict.fromkeys(["# scaffolds", "# contigs", "Longest scaffold", "Longest contig", "N50 (scaffolds)",
+                               "N50 (contigs)", "Mean scaffold length", "Mean contig length", "Coding density",
+                               "Translation table", "# predicted genes"], 1)
+        stats.update({{"marker lineage": "k__Bacteria", "Completeness": completeness, "Contamination": 0.5}})
+        f.write(f"{{fasta.stem}}\\t{{stats}}\\n")
+with open(os.environ["STUB_LOG"], "a") as f:
+    f.write(f"{{start}} {{time.time()}} {{threads}}\\n")
+"""
+BAKTA_STUB = """#!{python}
+import os, sys, time, pathlib
+args = sys.argv[1:]
+outdir, prefix = pathlib.Path(args[args.index("--outdir") + 1]), args[args.index("--prefix") + 1]
+start = time.time()
+time.sleep(0.1)
+if "broken" in prefix or "--keep-contig-headers" not in args:
+    sys.exit("bakta stub failed")
+outdir.mkdir(parents=True, exist_ok=True)
+(outdir / (prefix + ".tsv")).write_text("contig1\\tcds\\t1\\t900\\t+\\tLT1\\t\\thypothetical protein\\t\\n")
+with open(os.environ["STUB_LOG"], "a") as f:
+    f.write(f"{{start}} {{time.time()}} {{args[args.index('--threads') + 1]}}\\n")
+"""
+
+
+@pytest.fixture
+def stubs(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, stub in [("checkm", CHECKM_STUB), ("bakta", BAKTA_STUB)]:
+        path = bin_dir / name
+        path.write_text(stub.format(python=sys.executable))
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    stub_log = tmp_path / "stub.log"
+    monkeypatch.setenv("STUB_LOG", str(stub_log))
+    return stub_log
+
+
+@pytest.fixture
+def genomes(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    paths = []
+    for name in ["good1", "good2", "low1", "broken1"]:
+        path = input_dir / f"{name}.fa"
+        path.write_text(">contig1\nACGT\n")
+        paths.append(path)
+    return paths
+
+
+def test_run_pipeline_routes_by_qc(tmp_path, stubs, genomes):
+    manifest, summary = run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=2)
+    assert summary == {"annotated": 2, "failed_qc": 1, "errors": 1, "skipped": 0}
+    md_df = pd.read_csv(manifest, sep="\t")
+    assert sorted(md_df["assembly_accession"]) == ["good1", "good2"]
+    assert md_df["bakta_path"].str.endswith("bakta/good1.tsv").any()
+    assert (tmp_path / "out" / "low1" / "checkm_results.txt").read_text() == "FAIL\n"
+
+
+def test_run_pipeline_resumes(tmp_path, stubs, genomes):
+    run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=2)
+    runs = len(stubs.read_text().splitlines())
+    manifest, summary = run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=2)
+    # only Bakta of the broken genome runs again, its CheckM result is kept
+    assert summary == {"annotated": 0, "failed_qc": 0, "errors": 1, "skipped": 3}
+    assert len(stubs.read_text().splitlines()) == runs
+    assert len(pd.read_csv(manifest, sep="\t")) == 2
+
+
+def test_run_pipeline_cpu_budget(tmp_path, stubs, genomes):
+    run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=3, checkm_threads=1, bakta_threads=2)
+    intervals = [tuple(map(float, line.split())) for line in stubs.read_text().splitlines()]
+    in_use = [sum(t for s, e, t in intervals if s <= start < e) for start, _, _ in intervals]
+    assert max(in_use) <= 3
+
+
+def test_run_pipeline_checkm_batches(tmp_path, stubs, genomes):
+    manifest, summary = run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=2, checkm_batch_size=3)
+    assert summary == {"annotated": 2, "failed_qc": 1, "errors": 1, "skipped": 0}
+    # one CheckM run for the first three genomes, one for the last, two Bakta runs
+    assert len(stubs.read_text().splitlines()) == 4
+    sample_dir = tmp_path / "out" / "good2"
+    assert extract_checkm_results(sample_dir / "checkm" / "storage" / "bin_stats_ext.tsv")[1] == 99.1
+    assert list(read_checkm_table(sample_dir / "checkm" / "lineage.log")) == ["good2"]
+
+
+def test_run_pipeline_prefilter(tmp_path, stubs, genomes):
+    genomes[0].write_text(">contig1\nNNNN\n")
+    manifest, summary = run_pipeline(genomes, tmp_path / "out", logging.getLogger("test"), cpus=2,
+                                     prefilter_thresholds={"max_n_percent": 50})
+    assert summary == {"annotated": 1, "failed_qc": 2, "errors": 1, "skipped": 0}
+    assert (tmp_path / "out" / "good1" / "checkm_results.txt").read_text() == "FAIL\n"
+    assert not (tmp_path / "out" / "good1" / "checkm").exists()
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+from collections import OrderedDict
+from sql_connection import TRN
+from redgenes_settings import redgenes_config
+
+
+# Exported datasets, the table or view (support_files/009.sql) they are read
+# from, which has an entity_id column, and its key. Keys are AUTOINCREMENT ids, so rows committed later by the
+# single loading process always have larger keys than the rows exported
+EXPORT_DATASETS = {
+    "genomes": ("genome_export", "entity_id"),
+    "genes": ("gene_export", "bakta_accession"),
+    "dbxrefs": ("dbxref_export", "bakta_accession"),
+    "cds_info": ("cds_info", "cds_id"),
+    "ko_info": ("ko_info", "ko_id"),
+    "rrna_info": ("rrna_info", "rrna_id"),
+}
+# SQL of the hive partition value of a row of relation t
+PARTITION_KEYS = {
+    "entity_range": "(t.entity_id - 1) / {entity_range_size} * {entity_range_size} + 1",
+    "source": "(SELECT m.source FROM md_info m WHERE m.entity_id = t.entity_id)",
+}
+# Partition directory of rows whose partition value is NULL, as hive names it
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+STATE_FILE = "_export_state.json"
+
+
+def arrow_type(declared_type):
+    """Arrow type of a column from its declared SQLite type, following the
+    SQLite type affinity rules. Timestamps are read as text and cast."""
+    import pyarrow as pa
+
+    declared_type = declared_type.upper()
+    if "INT" in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ["CHAR", "CLOB", "TEXT"]):
+        return pa.string()
+    if "BLOB" in declared_type:
+        return pa.binary()
+    if any(name in declared_type for name in ["REAL", "FLOA", "DOUB"]):
+        return pa.float64()
+    if "TIMESTAMP" in declared_type or "DATETIME" in declared_type:
+        return pa.timestamp("s")
+    # expressions of views, such as group_concat, have no declared type
+    return pa.string()
+
+
+def export_schema(relation):
+    """Arrow schema of the columns of a table or view."""
+    import pyarrow as pa
+
+    with TRN:
+        TRN.add(f"PRAGMA table_info({relation})")
+        columns = TRN.execute_fetchindex()
+    return pa.schema([(column[1], arrow_type(column[2])) for column in columns])
+
+
+def rows_to_table(rows, schema):
+    """Arrow table of rows fetched from the database, in schema column order."""
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = []
+    for values, field in zip(columns, schema):
+        if pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(values, type=pa.string()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class PartitionedParquetWriter:
+    """Writes rows into the hive partitions <column>=<value> of a directory,
+    a parquet file per partition. At most max_open files are open at once;
+    a partition evicted and written again gets another file. Rows are
+    buffered per partition into row groups of row_group_size rows."""
+
+    def __init__(self, path, schema, column, file_prefix, max_open=16, row_group_size=100000):
+        self.path = Path(path)
+        self.schema = schema
+        self.column = column
+        self.file_prefix = file_prefix
+        self.max_open = max_open
+        self.row_group_size = row_group_size
+        # {partition value: (ParquetWriter, [buffered tables], buffered rows)}
+        self.open = OrderedDict()
+        self.files = {}
+        self.rows = 0
+
+    def write(self, value, table):
+        """Add the rows of table to the partition value."""
+        import pyarrow.parquet as pq
+
+        if value in self.open:
+            self.open.move_to_end(value)
+        else:
+            if len(self.open) >= self.max_open:
+                self._close(next(iter(self.open)))
+            # values are URI-encoded as pyarrow's hive partitioning expects
+            directory = self.path / f"{self.column}={NULL_PARTITION if value is None else quote(str(value), safe='')}"
+            directory.mkdir(parents=True, exist_ok=True)
+            self.files[value] = self.files.get(value, 0) + 1
+            file_path = directory / f"part-{self.file_prefix}-{self.files[value]:05d}.parquet"
+            self.open[value] = (pq.ParquetWriter(file_path, self.schema, compression="zstd"), [], 0)
+        writer, buffered, buffered_rows = self.open[value]
+        buffered.append(table)
+        buffered_rows += len(table)
+        self.rows += len(table)
+        if buffered_rows >= self.row_group_size:
+            self._flush(writer, buffered)
+            buffered_rows = 0
+        self.open[value] = (writer, buffered, buffered_rows)
+
+    def _flush(self, writer, buffered):
+        import pyarrow as pa
+
+        if buffered:
+            writer.write_table(pa.concat_tables(buffered), row_group_size=self.row_group_size)
+            buffered.clear()
+
+    def _close(self, value):
+        writer, buffered, _ = self.open.pop(value)
+        self._flush(writer, buffered)
+        writer.close()
+
+    def close(self):
+        for value in list(self.open):
+            self._close(value)
+
+
+def _export_relation(relation, key_column, path, partition_by, entity_range_size, file_prefix, after_key, chunksize):
+    """Stream the rows of relation whose key_column is above after_key, or
+    every row when it is None, into partitioned parquet files under path,
+    chunksize rows at a time. Returns (rows written, largest key written)."""
+    import pyarrow as pa
+
+    schema = export_schema(relation)
+    key_position = schema.names.index(key_column)
+    partition_key = PARTITION_KEYS[partition_by].format(entity_range_size=int(entity_range_size))
+    sql = f"SELECT t.*, {partition_key} FROM {relation} t"
+    args = []
+    if after_key is not None:
+        sql += f" WHERE t.{key_column} > ?"
+        args.append(after_key)
+
+    last_key = after_key
+    writer = PartitionedParquetWriter(path, schema, partition_by, file_prefix, row_group_size=chunksize)
+    try:
+        with TRN:
+            TRN.add(sql, args)
+            _, chunks = TRN.execute_fetchchunks(chunksize)
+            for chunk in chunks:
+                table = rows_to_table([row[:-1] for row in chunk], schema)
+                partitions = {}
+                for i, row in enumerate(chunk):
+                    partitions.setdefault(row[-1], []).append(i)
+                for value, indices in partitions.items():
+                    writer.write(value, table.take(pa.array(indices, type=pa.int64())))
+                last_key = max(last_key or 0, max(row[key_position] for row in chunk))
+    finally:
+        writer.close()
+    return writer.rows, last_key
+
+
+def read_export_state(output_dir):
+    """{dataset: {"last_key", "partition_by", "entity_range_size"}} of the
+    last export into output_dir."""
+    state_path = Path(output_dir) / STATE_FILE
+    return json.loads(state_path.read_text()) if state_path.exists() else {}
+
+
+def _write_export_state(output_dir, state):
+    state_path = Path(output_dir) / STATE_FILE
+    tmp_path = state_path.with_name(state_path.name + f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    os.replace(tmp_path, state_path)
+
+
+def export_datasets(output_dir, datasets=None, partition_by="entity_range", entity_range_size=1000,
+                    incremental=False, chunksize=None):
+    """Export datasets of EXPORT_DATASETS to partitioned parquet under
+    output_dir/<dataset>, streaming chunksize rows at a time so memory does
+    not grow with the database.
+
+    A full export replaces the dataset directory. An incremental export adds
+    files holding the rows whose key is above the largest exported by the
+    last export of the dataset, tracked in output_dir/_export_state.json; a
+    dataset never exported is exported in full. Rows are appended only: rows
+    changed after they were exported, such as genes whose dbxrefs were loaded
+    later, are not exported again.
+
+    Returns {dataset: rows written}.
+    """
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"Unknown partitioning {partition_by}, expected one of {list(PARTITION_KEYS)}")
+    datasets = list(datasets or EXPORT_DATASETS)
+    unknown = set(datasets) - set(EXPORT_DATASETS)
+    if unknown:
+        raise ValueError(f"Unknown datasets {sorted(unknown)}, expected some of {list(EXPORT_DATASETS)}")
+    chunksize = chunksize or redgenes_config.query_chunksize
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state = read_export_state(output_dir)
+    layout = {"partition_by": partition_by, "entity_range_size": entity_range_size if partition_by == "entity_range" else None}
+
+    # files of exports within the same second must not replace each other
+    file_prefix = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+    written = {}
+    for dataset in datasets:
+        previous = state.get(dataset) if incremental else None
+        if previous is not None and {name: previous.get(name) for name in layout} != layout:
+            raise ValueError(f"{dataset} was exported partitioned by {previous['partition_by']}, "
+                             f"an incremental export cannot partition it by {partition_by}")
+        relation, key_column = EXPORT_DATASETS[dataset]
+        after_key = previous["last_key"] if previous else None
+
+        # written next to the dataset directory and moved in, so a reader
+        # never sees a partial export
+        dataset_dir = output_dir / dataset
+        tmp_dir = output_dir / f".{dataset}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        written[dataset], last_key = _export_relation(
+            relation, key_column, tmp_dir, partition_by, entity_range_size, file_prefix, after_key, chunksize)
+        if previous is None:
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+            os.replace(tmp_dir, dataset_dir)
+        else:
+            for file_path in sorted(tmp_dir.glob("*/*.parquet")):
+                (dataset_dir / file_path.parent.name).mkdir(parents=True, exist_ok=True)
+                os.replace(file_path, dataset_dir / file_path.parent.name / file_path.name)
+            shutil.rmtree(tmp_dir)
+        state[dataset] = {"last_key": last_key, **layout}
+        _write_export_state(output_dir, state)
+    return written
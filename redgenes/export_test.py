@@ -0,0 +1,89 @@
+import sqlite3
+import pytest
+import pandas as pd
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db
+from metadata import insert_metadata, IDENTIFIER_CACHE
+from bakta_annotations import load_bakta_chunk, BAKTA_COLUMNS
+from export import export_datasets, read_export_state
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds  # noqa: E402
+
+CREATED_TABLES = ["identifier", "md_info", "bakta"]
+
+
+def insert_genome(accession, source, created_at):
+    features = [["contig1", "cds", i * 1000 + 1, i * 1000 + 900, "+", f"{accession}_{i}", None, "hypothetical protein",
+                 "KEGG:K00001, UniRef:UniRef90_A"] for i in range(3)]
+    with TRN:
+        entity_id = insert_metadata({"local_path": f"/genomes/{accession}.fa", "assembly_accession": accession, "source": source})[0]
+        load_bakta_chunk(entity_id, pd.DataFrame(features, columns=BAKTA_COLUMNS))
+        for table in CREATED_TABLES:
+            TRN.add(f"UPDATE {table} SET created_at = ? WHERE entity_id = ?", [created_at, entity_id])
+
+
+def read_dataset(path):
+    return ds.dataset(path, format="parquet", partitioning="hive").to_table().to_pandas()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "export.db"))
+    IDENTIFIER_CACHE.clear()
+    initialize_db()
+    insert_genome("GCA_1", "NCBI", "2020-01-01 00:00:00")
+    yield
+    IDENTIFIER_CACHE.clear()
+    TRN.close()
+
+
+def test_export_datasets(db, tmp_path):
+    written = export_datasets(tmp_path / "out", ["genomes", "genes", "dbxrefs"], entity_range_size=10, chunksize=2)
+    assert written == {"genomes": 1, "genes": 3, "dbxrefs": 6}
+    genes = read_dataset(tmp_path / "out" / "genes")
+    assert genes["locus_tag"].tolist() == ["GCA_1_0", "GCA_1_1", "GCA_1_2"]
+    assert genes["kegg"].tolist() == ["K00001"] * 3
+    assert genes["entity_range"].tolist() == [1] * 3
+    assert str(genes["created_at"][0]) == "2020-01-01 00:00:00"
+    assert sorted(read_dataset(tmp_path / "out" / "dbxrefs")["db"].unique()) == ["KEGG", "UniRef"]
+
+    export_datasets(tmp_path / "by_source", ["genomes"], partition_by="source")
+    assert [path.name for path in (tmp_path / "by_source" / "genomes").iterdir()] == ["source=NCBI"]
+
+
+def test_export_incremental(db, tmp_path):
+    out = tmp_path / "out"
+    export_datasets(out, ["genes"])
+    assert read_export_state(out)["genes"]["last_key"] == 3
+    insert_genome("GCA_2", "GTDB", "2022-01-01 00:00:00")
+
+    assert export_datasets(out, ["genes"], incremental=True) == {"genes": 3}
+    genes = read_dataset(out / "genes")
+    assert sorted(genes["filename_full"].unique()) == ["GCA_1", "GCA_2"]
+    assert len(list((out / "genes").glob("*/*.parquet"))) == 2
+    assert export_datasets(out, ["genes"], incremental=True) == {"genes": 0}
+    with pytest.raises(ValueError):
+        export_datasets(out, ["genes"], partition_by="source", incremental=True)
+    # a full export replaces the dataset
+    assert export_datasets(out, ["genes"]) == {"genes": 6}
+    assert len(read_dataset(out / "genes")) == 6
+
+
+def test_export_incremental_late_commit(db, tmp_path):
+    out = tmp_path / "out"
+    # a loader inserts a gene, with an old created_at, and commits it only
+    # after the next export ran
+    loader = sqlite3.connect(redgenes_config.dbpath, isolation_level=None)
+    loader.execute("BEGIN IMMEDIATE")
+    loader.execute("INSERT INTO identifier (filename_full, filepath) VALUES ('GCA_2', '/genomes/GCA_2.fa')")
+    loader.execute("""
+        INSERT INTO bakta (entity_id, contig_id, type_key, start, stop, strand_key, locus_tag, gene_key, product_key, created_at)
+        SELECT 2, contig_id, type_key, start, stop, strand_key, 'LATE', gene_key, product_key, '2000-01-01 00:00:00'
+        FROM bakta WHERE bakta_accession = 1""")
+    assert export_datasets(out, ["genes"]) == {"genes": 3}
+    loader.execute("COMMIT")
+    loader.close()
+    assert export_datasets(out, ["genes"], incremental=True) == {"genes": 1}
+    assert "LATE" in read_dataset(out / "genes")["locus_tag"].tolist()
@@ -0,0 +1,110 @@
+import mmap
+import numpy as np
+
+
+def concatenated_ranges(starts, ends):
+    """Concatenated np.arange(start, end) of every (start, end) pair."""
+    sizes = ends - starts
+    offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+    return np.arange(sizes.sum()) + offsets
+
+
+def header_positions(data):
+    """Return the offsets of the '>' and of the end of every header line of
+    a FASTA file held in a uint8 array."""
+    newlines = np.flatnonzero(data == ord("\n"))
+    starts = np.flatnonzero(data == ord(">"))
+    # '>' only starts a header at the beginning of a line
+    starts = starts[(starts == 0) | (data[starts - 1] == ord("\n"))]
+    # a header runs up to the next newline, or to the end of the file
+    line_ends = np.append(newlines, len(data))
+    return starts, line_ends[np.searchsorted(newlines, starts)]
+
+
+def contig_lengths_and_counts(data):
+    """Return the length of every contig of a FASTA file held in a uint8
+    array and the number of G or C (or S) and of N bases over all contigs.
+
+    Every letter and '-' outside header lines is a base, upper or lower case.
+    """
+    starts, header_ends = header_positions(data)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64), 0, 0
+    data = data[starts[0]:]
+    starts, header_ends = starts - starts[0], header_ends - starts[0]
+
+    # clearing bit 5 upper-cases ASCII letters
+    folded = data & 0xDF
+    is_base = ((folded >= ord("A")) & (folded <= ord("Z"))) | (data == ord("-"))
+    # Bytes that are not bases (line breaks, spaces) are few, so contig lengths
+    # come from counting them per contig rather than from the bases
+    not_base = np.flatnonzero(~is_base)
+    contig_ends = np.append(starts[1:], len(data))
+    lengths = (contig_ends - starts) - np.diff(np.searchsorted(not_base, np.append(starts, len(data))))
+
+    # and the letters of headers are taken back out. Every header holds at
+    # least its '>', so the offsets of the headers in their concatenation
+    # strictly increase as reduceat requires
+    header_sizes = header_ends - starts
+    headers = concatenated_ranges(starts, header_ends)
+    lengths -= np.add.reduceat(is_base[headers], np.cumsum(header_sizes) - header_sizes, dtype=np.int64)
+
+    def count(chars, values):
+        return sum(int(np.count_nonzero(values == ord(char))) for char in chars)
+
+    gc = count("GCS", folded) - count("GCS", folded[headers])
+    n = count("N", folded) - count("N", folded[headers])
+    return lengths, gc, n
+
+
+def n50(lengths):
+    """Return (N50, L50) of contig lengths."""
+    if len(lengths) == 0:
+        return 0, 0
+    ordered = np.sort(lengths)[::-1]
+    cumulative = np.cumsum(ordered)
+    l50 = int(np.searchsorted(cumulative, cumulative[-1] / 2)) + 1
+    return int(ordered[l50 - 1]), l50
+
+
+def fasta_stats(fasta_path):
+    """Compute assembly statistics of an uncompressed FASTA file from a
+    memory map of it, without a Python loop over contigs or lines.
+
+    Returns a dict with num_contigs, genome_size, longest_contig, N50, L50,
+    gc_percent (of the bases other than N) and n_percent (of all bases).
+    """
+    with open(fasta_path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lengths, gc, n = contig_lengths_and_counts(np.frombuffer(mm, dtype=np.uint8))
+        except ValueError:
+            # an empty file cannot be memory-mapped
+            lengths, gc, n = contig_lengths_and_counts(np.zeros(0, dtype=np.uint8))
+
+    genome_size = int(lengths.sum())
+    N50, L50 = n50(lengths)
+    return {
+        "num_contigs": len(lengths),
+        "genome_size": genome_size,
+        "longest_contig": int(lengths.max()) if len(lengths) else 0,
+        "N50": N50,
+        "L50": L50,
+        "gc_percent": round(100 * gc / (genome_size - n), 2) if genome_size > n else 0.0,
+        "n_percent": round(100 * n / genome_size, 2) if genome_size else 0.0,
+    }
+
+
+def prefilter(stats, min_genome_size=None, max_contigs=None, min_n50=None, max_n_percent=None):
+    """Return the reasons, if any, why a genome with these fasta_stats cannot
+    pass QC. Thresholds left as None are not checked."""
+    reasons = []
+    if min_genome_size is not None and stats["genome_size"] < min_genome_size:
+        reasons.append(f"genome size {stats['genome_size']} < {min_genome_size}")
+    if max_contigs is not None and stats["num_contigs"] > max_contigs:
+        reasons.append(f"{stats['num_contigs']} contigs > {max_contigs}")
+    if min_n50 is not None and stats["N50"] < min_n50:
+        reasons.append(f"N50 {stats['N50']} < {min_n50}")
+    if max_n_percent is not None and stats["n_percent"] > max_n_percent:
+        reasons.append(f"{stats['n_percent']}% N > {max_n_percent}%")
+    return reasons
@@ -0,0 +1,35 @@
+import numpy as np
+from pathlib import Path
+from fasta_stats import fasta_stats, prefilter
+
+GENOME = Path(__file__).parent / "test_files" / "YuJ_2015__SZAXPI015217-140__bin.3.fa"
+
+
+def test_fasta_stats(tmp_path):
+    path = tmp_path / "genome.fa"
+    # lowercase, N, CRLF line ends, a multi-line contig and an empty contig
+    path.write_bytes(b">c1 desc with GC>\r\nACGTN\r\nggcc\r\n>c2\nAT\n>c3\n>c4\nGGGGGGGGGG")
+    stats = fasta_stats(path)
+    assert stats == {
+        "num_contigs": 4, "genome_size": 21, "longest_contig": 10, "N50": 9, "L50": 2,
+        "gc_percent": 80.0, "n_percent": 4.76,
+    }
+    empty = tmp_path / "empty.fa"
+    empty.write_bytes(b"")
+    assert fasta_stats(empty)["num_contigs"] == 0
+
+
+def test_fasta_stats_matches_python():
+    contigs = "".join(line.strip() if not line.startswith(">") else "\n" for line in open(GENOME)).split("\n")[1:]
+    lengths = sorted(map(len, contigs), reverse=True)
+    l50 = int(np.searchsorted(np.cumsum(lengths), sum(lengths) / 2)) + 1
+    stats = fasta_stats(GENOME)
+    assert (stats["num_contigs"], stats["genome_size"], stats["L50"], stats["N50"]) == (
+        len(lengths), sum(lengths), l50, lengths[l50 - 1])
+
+
+def test_prefilter():
+    stats = {"num_contigs": 500, "genome_size": 1000, "N50": 2, "n_percent": 0.0}
+    assert prefilter(stats) == []
+    assert prefilter(stats, min_genome_size=10000, max_contigs=100) == ["genome size 1000 < 10000", "500 contigs > 100"]
+
@@ -0,0 +1,53 @@
+import pandas as pd
+from sql_connection import TRN
+from metadata import identifier_key
+from tool_annotations import TOOL_PATH_COLUMNS
+
+
+# "tools" is recorded once the outputs of the optional Prodigal, kofam_scan
+# and barrnap manifest columns are loaded
+STAGES = ["identifier", "qc", "bakta", "dbxref", "tools"]
+
+
+def stage_reached(stage, target):
+    """Whether the recorded stage is target or a later one."""
+    return stage is not None and STAGES.index(stage) >= STAGES.index(target)
+
+
+def read_ledger():
+    """Load the ledger as {(filename_full, filepath): (entity_id, stage)}."""
+    with TRN:
+        sql = "SELECT filename_full, filepath, entity_id, stage FROM load_ledger"
+        TRN.add(sql)
+        rows = TRN.execute_fetchindex()
+    return {(filename, filepath): (entity_id, stage) for filename, filepath, entity_id, stage in rows}
+
+
+def record_stage(row, entity_id, stage):
+    """Record that row finished stage. Run it inside the transaction that
+    wrote the stage so the ledger never gets ahead of the data."""
+    sql = """
+        INSERT INTO load_ledger (filename_full, filepath, entity_id, stage)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (filename_full, filepath) DO UPDATE SET
+            entity_id = excluded.entity_id,
+            stage = excluded.stage,
+            modified_at = current_timestamp"""
+    TRN.add(sql, [*identifier_key(row), entity_id, stage])
+
+
+def drop_completed(md_df, ledger):
+    """Remove manifest rows whose genome went through every stage: past
+    "dbxref", and past "tools" too when the row has tool outputs."""
+    stages = pd.DataFrame(
+        [(*key, stage) for key, (_, stage) in ledger.items() if stage_reached(stage, "dbxref")],
+        columns=["assembly_accession", "local_path", "stage"])
+    if stages.empty:
+        return md_df
+    keys = pd.MultiIndex.from_arrays([md_df["assembly_accession"].str.strip(), md_df["local_path"].str.strip()])
+    stage = pd.Series(stages["stage"].to_numpy(), index=pd.MultiIndex.from_frame(stages.iloc[:, :2]))
+    stage = stage.reindex(keys).to_numpy()
+    tool_columns = md_df.columns.intersection(list(TOOL_PATH_COLUMNS.values()))
+    has_tools = md_df[tool_columns].apply(lambda paths: paths.str.strip().fillna("") != "").any(axis=1).to_numpy()
+    completed = (stage == STAGES[-1]) | ((stage == "dbxref") & ~has_tools)
+    return md_df[~completed]
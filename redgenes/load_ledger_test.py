@@ -0,0 +1,29 @@
+import pandas as pd
+from load_ledger import stage_reached, drop_completed
+
+
+def test_stage_reached():
+    assert not stage_reached(None, "identifier")
+    assert stage_reached("qc", "identifier")
+    assert stage_reached("qc", "qc")
+    assert not stage_reached("qc", "bakta")
+
+
+def test_drop_completed():
+    md_df = pd.DataFrame({
+        "assembly_accession": ["GCA_1 ", "GCA_2", "GCA_3"],
+        "local_path": ["/a/1.fa", "/a/2.fa", "/a/3.fa"],
+    })
+    ledger = {("GCA_1", "/a/1.fa"): (1, "dbxref"), ("GCA_2", "/a/2.fa"): (2, "qc")}
+    assert drop_completed(md_df, ledger)["assembly_accession"].tolist() == ["GCA_2", "GCA_3"]
+
+
+def test_drop_completed_tool_outputs():
+    md_df = pd.DataFrame({
+        "assembly_accession": ["GCA_1", "GCA_2", "GCA_3"],
+        "local_path": ["/a/1.fa", "/a/2.fa", "/a/3.fa"],
+        "prodigal_path": ["/a/1.gff", None, "/a/3.gff"],
+    })
+    ledger = {("GCA_1", "/a/1.fa"): (1, "dbxref"), ("GCA_2", "/a/2.fa"): (2, "dbxref"), ("GCA_3", "/a/3.fa"): (3, "tools")}
+    # only the genome whose Prodigal output is not loaded yet is kept
+    assert drop_completed(md_df, ledger)["assembly_accession"].tolist() == ["GCA_1"]
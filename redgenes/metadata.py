@@ -1,14 +1,172 @@
+import os
+import glob
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from sql_connection import TRN
+from redgenes_settings import redgenes_config
+from utils import MD_DTYPES
+from tool_annotations import TOOL_PATH_COLUMNS
+
+
+# Manifest columns every row needs, and those holding paths that must exist
+REQUIRED_COLUMNS = ["local_path", "assembly_accession", "bakta_path", "checkm_path", "source"]
+PATH_COLUMNS = ["local_path", "bakta_path", "checkm_path", *TOOL_PATH_COLUMNS.values()]
+
+
+class IdentifierCache:
+    """Bounded map of (filename_full, filepath) to entity_id that evicts the
+    least recently used entries."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, key):
+        entity_id = self._ids.get(key)
+        if entity_id is not None:
+            self._ids.move_to_end(key)
+        return entity_id
+
+    def put(self, key, entity_id):
+        self._ids[key] = entity_id
+        self._ids.move_to_end(key)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def discard(self, key):
+        self._ids.pop(key, None)
+
+    def clear(self):
+        self._ids.clear()
+
+    def warm(self):
+        """Fill the cache with the most recent identifier entries."""
+        with TRN:
+            sql = """
+                SELECT filename_full, filepath, entity_id
+                FROM identifier
+                ORDER BY entity_id DESC
+                LIMIT ?"""
+            TRN.add(sql, [self.maxsize])
+            rows = TRN.execute_fetchindex()
+        for filename, filepath, entity_id in reversed(rows):
+            self.put((filename, filepath), entity_id)
+
+
+IDENTIFIER_CACHE = IdentifierCache(redgenes_config.identifier_cache_size)
+
+
+def identifier_key(row):
+    """Key of a manifest row in identifier, (filename_full, filepath)."""
+    return row["assembly_accession"].strip(), row["local_path"].strip()
 
 
 def extract_md_info(md_path):
-    """Load data from input and checks data integrity."""
+    """Load a manifest as text with surrounding whitespace stripped and empty
+    values as NaN. Raises ValueError if a required column is missing."""
     df = pd.read_csv(md_path, sep="\t", dtype=str)
-
+    df.columns = df.columns.str.strip()
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"{md_path} lacks the required columns {missing}")
+    for column in df.columns:
+        df[column] = df[column].str.strip()
+        df.loc[df[column] == "", column] = None
     return df
 
 
+def existing_paths(paths, patterns=False):
+    """Whether each of paths exists, listing every parent directory once
+    rather than calling stat on every path. With patterns, a path holding
+    glob characters exists when it matches a file."""
+    paths = pd.Series(paths, dtype=str)
+    exists = pd.Series(False, index=paths.index)
+    if patterns:
+        is_pattern = paths.str.contains(r"[*?\[]").to_numpy(bool)
+        exists[is_pattern] = np.array([bool(glob.glob(pattern)) for pattern in paths[is_pattern]], dtype=bool)
+        paths = paths[~is_pattern]
+    if paths.empty:
+        return exists
+    paths = paths.map(os.path.normpath)
+    parts = paths.str.rpartition("/")
+    parents = parts[0].where(parts[1] == "/", ".").replace("", "/")
+    for parent, index in parents.groupby(parents).groups.items():
+        try:
+            names = os.listdir(parent)
+        except OSError:
+            continue
+        exists[index] = parts[2][index].isin(names)
+    return exists
+
+
+def cast_md_info(md_df):
+    """The MD_DTYPES columns of a manifest cast to their types; values that
+    do not cast become NA."""
+    md_df = md_df.copy()
+    for column in md_df.columns.intersection(list(MD_DTYPES)):
+        if MD_DTYPES[column] == "datetime":
+            md_df[column] = pd.to_datetime(md_df[column], errors="coerce")
+        else:
+            md_df[column] = pd.to_numeric(md_df[column], errors="coerce").astype(MD_DTYPES[column])
+    return md_df
+
+
+def validate_md_info(md_df):
+    """Check a whole manifest at once for rows that cannot be loaded: missing
+    required values, paths that do not exist, repeated assembly_accessions and
+    values of the wrong type.
+
+    Returns one row per problem with the line of the manifest it is on, the
+    assembly_accession and the reason, empty if every row can be loaded.
+    """
+    if md_df.empty:
+        return pd.DataFrame({"line": pd.Series(dtype=int), "assembly_accession": pd.Series(dtype=object),
+                             "reason": pd.Series(dtype=object)})
+    problems = []
+
+    def report(mask, reason):
+        problems.append(pd.DataFrame({"index": md_df.index[mask.to_numpy()], "reason": reason}))
+
+    for column in REQUIRED_COLUMNS:
+        report(md_df[column].isna(), f"missing {column}")
+    for column in md_df.columns.intersection(PATH_COLUMNS):
+        given = md_df[column].notna()
+        # local_path can be a glob pattern, as stage_genomes takes
+        exists = existing_paths(md_df[column].fillna(""), patterns=column == "local_path")
+        report(given & ~exists, f"{column} does not exist")
+    accessions = md_df["assembly_accession"]
+    report(accessions.notna() & accessions.duplicated(), "duplicate assembly_accession")
+    cast_df = cast_md_info(md_df)
+    for column in md_df.columns.intersection(list(MD_DTYPES)):
+        report(md_df[column].notna() & cast_df[column].isna(), f"{column} is not {MD_DTYPES[column]}")
+
+    problems = pd.concat(problems).sort_values("index", kind="stable")
+    return pd.DataFrame({
+        # the header is line 1
+        "line": problems["index"].to_numpy() + 2,
+        "assembly_accession": accessions[problems["index"]].to_numpy(),
+        "reason": problems["reason"].to_numpy(),
+    })
+
+
+def check_md_info(md_df, report_path=None):
+    """Validate the rows of a manifest read by extract_md_info. Rows that
+    cannot be loaded are dropped and their problems written to report_path
+    as a tsv, if given and there are any.
+
+    Returns (md_df, report), md_df holding the valid rows with the MD_DTYPES
+    columns typed.
+    """
+    report = validate_md_info(md_df)
+    if report_path and len(report):
+        report.to_csv(report_path, sep="\t", index=False)
+    return cast_md_info(md_df.drop(report["line"].unique() - 2)), report
+
+
 def insert_metadata(row):
     """Insert relevant columns in identifier and metadata"""
     local_path = row["local_path"].strip()
@@ -25,6 +183,10 @@ def insert_metadata(row):
         TRN.add(sql_identifier, args_identifer)
         entity_id = TRN.execute_fetchflatten()
 
+        key = (filename, local_path)
+        IDENTIFIER_CACHE.put(key, entity_id[0])
+        TRN.add_post_rollback_func(IDENTIFIER_CACHE.discard, key)
+
         sql_md_info = """
             INSERT INTO md_info (entity_id, source, external_accession)
             VALUES (?, ?, ?)"""
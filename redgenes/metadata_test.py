@@ -0,0 +1,62 @@
+import pytest
+import pandas as pd
+from metadata import extract_md_info, existing_paths, validate_md_info, check_md_info
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    for name in ["g1.fa", "g1.tsv", "g1.checkm", "g2.fa", "g2.tsv", "g2.checkm"]:
+        (tmp_path / name).write_text("")
+    rows = [
+        ["local_path", "assembly_accession", "bakta_path", "checkm_path", "source", "taxid"],
+        [f" {tmp_path}/g1.fa ", "GCA_1", f"{tmp_path}/g1.tsv", f"{tmp_path}/g1.checkm", "NCBI", "562"],
+        [f"{tmp_path}/g2.fa", "GCA_2", f"{tmp_path}/missing.tsv", f"{tmp_path}/g2.checkm", "NCBI", "x"],
+        [f"{tmp_path}/g2.fa", "GCA_1", f"{tmp_path}/g2.tsv", f"{tmp_path}/g2.checkm", "", ""],
+    ]
+    path = tmp_path / "md.tsv"
+    path.write_text("".join("\t".join(row) + "\n" for row in rows))
+    return path
+
+
+def test_existing_paths(tmp_path, manifest):
+    paths = [str(manifest), f"{tmp_path}/nope", f"{tmp_path}/missing_dir/g1.fa", f"{tmp_path}/./g1.fa", "md.tsv"]
+    assert existing_paths(paths).tolist() == [True, False, False, True, False]
+    patterns = [f"{tmp_path}/g*.fa", f"{tmp_path}/x*.fa", f"{tmp_path}/g1.fa"]
+    assert existing_paths(patterns, patterns=True).tolist() == [True, False, True]
+    assert not existing_paths(patterns[:1]).any()
+    assert existing_paths(patterns[:2], patterns=True).tolist() == [True, False]
+    assert existing_paths([]).empty
+
+
+def test_validate_md_info(manifest):
+    md_df = extract_md_info(manifest)
+    assert md_df["local_path"][0] == f"{manifest.parent}/g1.fa"
+    report = validate_md_info(md_df)
+    assert report.values.tolist() == [
+        [3, "GCA_2", "bakta_path does not exist"],
+        [3, "GCA_2", "taxid is not Int64"],
+        [4, "GCA_1", "missing source"],
+        [4, "GCA_1", "duplicate assembly_accession"],
+    ]
+
+
+def test_check_md_info(manifest, tmp_path):
+    md_df, report = check_md_info(extract_md_info(manifest), tmp_path / "report.tsv")
+    assert md_df["assembly_accession"].tolist() == ["GCA_1"]
+    assert md_df["taxid"].tolist() == [562]
+    assert len(pd.read_csv(tmp_path / "report.tsv", sep="\t")) == len(report) == 4
+    (tmp_path / "bad.tsv").write_text("local_path\tsource\n")
+    with pytest.raises(ValueError):
+        extract_md_info(tmp_path / "bad.tsv")
+
+
+def test_check_md_info_glob_local_paths(manifest, tmp_path):
+    md_df = extract_md_info(manifest).iloc[:1]
+    md_df["local_path"] = f"{tmp_path}/g1.f*"
+    checked, report = check_md_info(md_df)
+    assert report.empty and checked["assembly_accession"].tolist() == ["GCA_1"]
+
+
+def test_check_md_info_empty(manifest):
+    checked, report = check_md_info(extract_md_info(manifest).iloc[:0])
+    assert checked.empty and report.empty
@@ -0,0 +1,89 @@
+import json
+import time
+from contextlib import contextmanager
+from collections import defaultdict
+
+
+COUNTERS = ["seconds", "sql_seconds", "statements", "rows_written", "bytes_read"]
+
+
+class Profiler:
+    """Collects wall time, SQL time, statements executed, rows written and
+    bytes read per genome and stage.
+
+    Every finished stage is one record, added to per-stage totals and, when
+    profiling to a file, written as a JSON line as soon as it finishes so a
+    killed job keeps its profile up to that point. Does nothing until start()
+    is called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.totals = defaultdict(lambda: dict.fromkeys(COUNTERS + ["genomes"], 0))
+        self._stack = []
+        self._file = None
+
+    def start(self, path=None):
+        """Start profiling, writing records to path if given."""
+        self.enabled = True
+        self.totals.clear()
+        if path:
+            self._file = open(path, "w")
+
+    def stop(self):
+        """Write one summary record per stage and stop profiling."""
+        if self._file:
+            for stage, totals in self.totals.items():
+                self._write({"genome": None, "stage": stage, "summary": True, **totals})
+            self._file.close()
+            self._file = None
+        self.enabled = False
+
+    @contextmanager
+    def stage(self, stage, genome=None, add=True):
+        """Profile the enclosed block as stage of genome. With add=False the
+        record is left to the caller, e.g. to send it back from a worker
+        process and add() it in the parent."""
+        if not self.enabled:
+            yield None
+            return
+        record = {"genome": genome, "stage": stage, **dict.fromkeys(COUNTERS, 0)}
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            record["sql_seconds"] = round(record["sql_seconds"], 6)
+            self._stack.pop()
+            if add:
+                self.add(record)
+
+    def count_sql(self, seconds, statements, rows_written):
+        """Add executed SQL to the innermost open stage."""
+        if self.enabled and self._stack:
+            record = self._stack[-1]
+            record["sql_seconds"] += seconds
+            record["statements"] += statements
+            record["rows_written"] += rows_written
+
+    def count_read(self, num_bytes):
+        """Add bytes read from input files to the innermost open stage."""
+        if self.enabled and self._stack:
+            self._stack[-1]["bytes_read"] += num_bytes
+
+    def add(self, record):
+        """Add a finished stage record."""
+        totals = self.totals[record["stage"]]
+        for counter in COUNTERS:
+            totals[counter] += record[counter]
+        totals["genomes"] += 1
+        if self._file:
+            self._write(record)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+
+PROFILER = Profiler()
@@ -0,0 +1,28 @@
+import json
+from profiling import Profiler
+
+
+def test_stage_records_and_summary(tmp_path):
+    profiler = Profiler()
+    path = tmp_path / "profile.jsonl"
+    profiler.start(str(path))
+    with profiler.stage("bakta", "GCA_1"):
+        profiler.count_sql(0.5, 2, 10)
+        profiler.count_read(100)
+    with profiler.stage("parse", "GCA_2", add=False) as record:
+        pass
+    profiler.add(record)
+    profiler.stop()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["genome"], r["stage"]) for r in records[:2]] == [("GCA_1", "bakta"), ("GCA_2", "parse")]
+    assert records[0]["rows_written"] == 10 and records[0]["bytes_read"] == 100
+    summaries = {r["stage"]: r for r in records if r.get("summary")}
+    assert summaries["bakta"]["statements"] == 2 and summaries["bakta"]["genomes"] == 1
+
+
+def test_disabled_profiler_counts_nothing():
+    profiler = Profiler()
+    with profiler.stage("qc", "GCA_1") as record:
+        profiler.count_sql(1.0, 1, 1)
+    assert record is None and not profiler.totals
@@ -1,78 +1,188 @@
-import ast
+import os
+import re
 from pathlib import Path
 from sql_connection import TRN
 from metadata import insert_metadata
+from load_ledger import record_stage
+from profiling import PROFILER
+from utils import genome_name
 
 
-def extract_checkm_results(inpath):
-    with open(inpath, "r") as file:
-        lines = file.readlines()
-    checkm_dict = ast.literal_eval(lines[0].split("\t")[1])
-
-    cols = [
-        "marker lineage",
-        "Completeness",
-        "Contamination",
-        "# scaffolds",
-        "# contigs",
-        "Longest scaffold",
-        "Longest contig",
-        "N50 (scaffolds)",
-        "N50 (contigs)",
-        "Mean scaffold length",
-        "Mean contig length",
-        "Coding density",
-        "Translation table",
-        "# predicted genes",
-    ]
-    checkm_res = [checkm_dict.get(col, None) for col in cols]
-    return checkm_res
+# CheckM statistics stored in qc_info, in column order, as named in bin_stats_ext.tsv
+CHECKM_COLUMNS = [
+    "marker lineage",
+    "Completeness",
+    "Contamination",
+    "# scaffolds",
+    "# contigs",
+    "Longest scaffold",
+    "Longest contig",
+    "N50 (scaffolds)",
+    "N50 (contigs)",
+    "Mean scaffold length",
+    "Mean contig length",
+    "Coding density",
+    "Translation table",
+    "# predicted genes",
+]
+# Tab table columns that are counts, all other columns but the lineage are floats
+CHECKM_INT_COLUMNS = {
+    "# genomes", "# markers", "# marker sets", "0", "1", "2", "3", "4", "5+",
+    "Genome size", "# ambiguous bases", "# scaffolds", "# contigs",
+    "Longest scaffold", "Longest contig", "N50 (scaffolds)", "N50 (contigs)",
+    "Translation table", "# predicted genes",
+}
+# 'key': value pairs of a bin_stats_ext.tsv dict with a number or string value.
+# List values, e.g. the marker genes of the GCN columns, are skipped.
+BIN_STATS_PAIR = re.compile(
+    r"""'(?P<key>[^']*)'\s*:\s*(?:'(?P<string>[^']*)'|"(?P<dstring>[^"]*)"|(?P<number>[-+]?[\d.]+(?:[eE][-+]?\d+)?)(?=\s*[,}]))"""
+)
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def iter_bin_stats(inpath):
+    """Stream a CheckM bin_stats_ext.tsv, yielding (bin_id, {key: value})
+    for every bin. Parsed with a regular expression rather than evaluated."""
+    with open(inpath) as f:
+        for line in f:
+            bin_id, _, stats = line.rstrip("\n").partition("\t")
+            if not stats:
+                continue
+            yield bin_id, {
+                m["key"]: _number(m["number"]) if m["number"] else m["string"] if m["string"] is not None else m["dstring"]
+                for m in BIN_STATS_PAIR.finditer(stats)
+            }
+
+
+def iter_checkm_table(inpath):
+    """Stream a CheckM tab table, as printed by lineage_wf or qa with
+    --tab_table, skipping the log lines around it. Yields (bin_id, {column:
+    value}) with counts as int, the lineage as str and the rest as float.
+    The ' (bp)' unit of the extended table columns is dropped."""
+    columns = None
+    with open(inpath) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "Bin Id":
+                columns = [column.replace(" (bp)", "") for column in fields]
+            elif columns and len(fields) == len(columns):
+                row = {"Bin Id": fields[0], columns[1]: fields[1]}
+                for column, value in zip(columns[2:], fields[2:]):
+                    row[column] = int(value) if column in CHECKM_INT_COLUMNS else float(value)
+                yield fields[0], row
+
+
+def read_checkm_table(inpath):
+    """Read a CheckM tab table into {bin_id: {column: value}}."""
+    return dict(iter_checkm_table(inpath))
+
+
+def read_checkm_results(inpath):
+    """Read a bin_stats_ext.tsv or a CheckM tab table into {bin_id:
+    checkm_res}, checkm_res holding the CHECKM_COLUMNS values, None when the
+    file does not have them."""
+    PROFILER.count_read(os.path.getsize(inpath))
+    with open(inpath) as f:
+        is_bin_stats = "\t{" in f.readline()
+    if is_bin_stats:
+        records = iter_bin_stats(inpath)
+    else:
+        records = iter_checkm_table(inpath)
+    results = {}
+    for bin_id, stats in records:
+        # the tab table spells the lineage column "Marker lineage"
+        stats = {key[0].lower() + key[1:] if key == "Marker lineage" else key: value for key, value in stats.items()}
+        results[bin_id] = [stats.get(column) for column in CHECKM_COLUMNS]
+    return results
+
+
+def extract_checkm_results(inpath, bin_id=None):
+    """Return the checkm_res of one genome: the only bin of the file, or the
+    bin named bin_id. Bin ids are compared without compression and FASTA
+    extensions, so bin_id can be the FASTA path of the genome."""
+    results = read_checkm_results(inpath)
+    if len(results) == 1:
+        return next(iter(results.values()))
+    if bin_id is not None:
+        names = {genome_name(name): name for name in results}
+        name = names.get(genome_name(bin_id))
+        if name is not None:
+            return results[name]
+    raise ValueError(f"{inpath} has bins {list(results)[:5]}, cannot pick {bin_id}")
+
+
+SQL_CHECKM = """
+    INSERT INTO qc_info (
+        entity_id,
+        marker_lineage,
+        completeness,
+        contamination,
+        num_scaffolds,
+        num_contigs,
+        longest_scaffold,
+        longest_contig,
+        N50_scaffolds,
+        N50_contigs,
+        mean_scaffold_length,
+        mean_contig_length,
+        coding_density,
+        translation_table,
+        num_predicted_genes)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+"""
 
 
 def insert_checkm_results(entity_id, checkm_res):
     with TRN:
-        sql_checkm = """
-            INSERT INTO qc_info (
-                entity_id,
-                marker_lineage,
-                completeness,
-                contamination,
-                num_scaffolds,
-                num_contigs,
-                longest_scaffold,
-                longest_contig,
-                N50_scaffolds,
-                N50_contigs,
-                mean_scaffold_length,
-                mean_contig_length,
-                coding_density,
-                translation_table,
-                num_predicted_genes)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """
         args_checkm = entity_id + checkm_res
-        TRN.add(sql_checkm, args_checkm)
+        TRN.add(SQL_CHECKM, args_checkm)
 
 
-def extract_and_insert_checkm_results(inpath, entity_id):
-    checkm_res = extract_checkm_results(inpath)
+def insert_checkm_batch(records):
+    """Insert [(entity_id, checkm_res)] into qc_info with a single
+    executemany and return the number of rows inserted."""
+    with TRN:
+        TRN.add_bulk(SQL_CHECKM, ([entity_id, *checkm_res] for entity_id, checkm_res in records))
+        return TRN.execute()[-1][0][0]
+
+
+def extract_and_insert_checkm_results(inpath, entity_id, bin_id=None):
+    checkm_res = extract_checkm_results(inpath, bin_id)
     insert_checkm_results(entity_id, checkm_res)
 
 
-def qc_db_insertion(row, logger):
+def qc_db_insertion(row, logger, checkm_res=None, entity_id=None):
+    """Insert metadata and CheckM results of one genome. checkm_res can be
+    passed in when it was already parsed, e.g. by a worker process. When
+    entity_id is given the identifier stage already ran and is skipped."""
     checkm_path = row["checkm_path"].strip()
 
-    try:
-        with TRN:
-            entity_id = insert_metadata(row)
-            extract_and_insert_checkm_results(checkm_path, entity_id)
-    except Exception as e:
-        logger.error(f"Error at database insertion: {e}")
-    else:
-        logger.info("Checkm insertion finished")
+    with PROFILER.stage("qc", row["assembly_accession"].strip()):
+        try:
+            with TRN:
+                if entity_id is None:
+                    entity_id = insert_metadata(row)
+                    record_stage(row, entity_id[0], "identifier")
+                else:
+                    entity_id = [entity_id]
+                if checkm_res is None:
+                    extract_and_insert_checkm_results(checkm_path, entity_id, genome_name(row["local_path"]))
+                else:
+                    insert_checkm_results(entity_id, checkm_res)
+                record_stage(row, entity_id[0], "qc")
+        except Exception as e:
+            logger.error(f"Error at database insertion: {e}")
+        else:
+            logger.info("Checkm insertion finished")
 
 
-def qc_bash_and_db_insertion(row, working_dir, logger):
+def qc_bash_and_db_insertion(row, working_dir, logger, checkm_res=None, entity_id=None):
     logger.info("CheckM insertion started")
 
-    qc_db_insertion(row, logger)
+    qc_db_insertion(row, logger, checkm_res, entity_id)
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from quality_control import read_checkm_results, read_checkm_table, extract_checkm_results, insert_checkm_batch
+
+BIN_STATS = (
+    "bin.1\t{'marker lineage': 'k__Bacteria', 'lineage_uid': 'UID203', '# genomes': 5449, 'Completeness': 98.44, "
+    "'Contamination': 3.79, 'GCN0': ['PF00164.20', 'PF00281.14'], '# scaffolds': 68, '# contigs': 68, "
+    "'Longest scaffold': 272822, 'Longest contig': 272822, 'N50 (scaffolds)': 33289, 'N50 (contigs)': 33289, "
+    "'Mean scaffold length': 46222.97, 'Mean contig length': 46222.97, 'Coding density': 0.89, "
+    "'Translation table': 11, '# predicted genes': 3143}\n"
+    "bin.2\t{'marker lineage': 'o__Clostridiales', 'Completeness': 60.5, 'Contamination': 1e-1}\n"
+)
+TAB_TABLE = (
+    "[2024-01-01 10:00:00] INFO: CheckM v1.2.2\n"
+    "Bin Id\tMarker lineage\t# genomes\tCompleteness\tContamination\tGenome size (bp)\t# scaffolds\t"
+    "N50 (contigs)\tMean contig length (bp)\tCoding density\n"
+    "bin.1\tk__Bacteria (UID203)\t5449\t98.44\t3.79\t3143162\t68\t33289\t46222.97\t0.89\n"
+    "[2024-01-01 10:05:00] INFO: { Current stage: 0:05:00.000 }\n"
+)
+
+
+@pytest.fixture
+def bin_stats(tmp_path):
+    path = tmp_path / "bin_stats_ext.tsv"
+    path.write_text(BIN_STATS)
+    return path
+
+
+def test_read_bin_stats_every_bin(bin_stats):
+    results = read_checkm_results(bin_stats)
+    assert list(results) == ["bin.1", "bin.2"]
+    assert results["bin.1"] == ["k__Bacteria", 98.44, 3.79, 68, 68, 272822, 272822, 33289, 33289,
+                                46222.97, 46222.97, 0.89, 11, 3143]
+    assert results["bin.2"][:3] == ["o__Clostridiales", 60.5, 0.1]
+
+
+def test_read_tab_table(tmp_path):
+    path = tmp_path / "lineage.log"
+    path.write_text(TAB_TABLE)
+    row = read_checkm_table(path)["bin.1"]
+    assert row["# genomes"] == 5449 and row["Genome size"] == 3143162 and row["Completeness"] == 98.44
+    checkm_res = read_checkm_results(path)["bin.1"]
+    assert checkm_res[:4] == ["k__Bacteria (UID203)", 98.44, 3.79, 68]
+    assert checkm_res[5] is None  # not in this table
+
+
+def test_extract_checkm_results_needs_bin_id(bin_stats):
+    assert extract_checkm_results(bin_stats, "bin.2")[1] == 60.5
+    with pytest.raises(ValueError):
+        extract_checkm_results(bin_stats)
+    assert extract_checkm_results(bin_stats, "/genomes/bin.2.fna.gz")[1] == 60.5
+    with pytest.raises(ValueError):
+        extract_checkm_results(bin_stats, "bin.3.fa")
+
+
+def test_extract_checkm_results_single_bin(tmp_path):
+    path = tmp_path / "bin_stats_ext.tsv"
+    path.write_text(BIN_STATS.splitlines(keepends=True)[0])
+    # the only bin is the genome's whatever the FASTA is named
+    assert extract_checkm_results(path, "/genomes/GCA_000001.1_ASM.fna.gz")[1] == 98.44
+    assert extract_checkm_results(path)[1] == 98.44
+
+
+@patch("quality_control.TRN", new_callable=MagicMock)
+def test_insert_checkm_batch_one_statement(mock_trn, bin_stats):
+    mock_trn.execute.return_value = [[(2,)]]
+    records = [(entity_id, checkm_res) for entity_id, checkm_res in enumerate(read_checkm_results(bin_stats).values())]
+    assert insert_checkm_batch(records) == 2
+    mock_trn.add_bulk.assert_called_once()
+    assert [row[:2] for row in mock_trn.add_bulk.call_args.args[1]] == [[0, "k__Bacteria"], [1, "o__Clostridiales"]]
@@ -0,0 +1,121 @@
+import json
+import pandas as pd
+from itertools import chain
+from sql_connection import TRN
+from redgenes_settings import redgenes_config
+
+
+def iter_query(sql, sql_args=None, chunksize=None):
+    """
+    Run a read-only query and yield its result as DataFrames of at most
+    chunksize rows (redgenes_config.query_chunksize by default).
+    TRN stays open until the last chunk is read.
+    """
+    with TRN:
+        TRN.add(sql, sql_args)
+        columns, chunks = TRN.execute_fetchchunks(chunksize or redgenes_config.query_chunksize)
+        for rows in chunks:
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def fetch_query(sql, sql_args=None, chunksize=None):
+    """
+    Run a read-only query. Returns a DataFrame, or an iterator of DataFrames
+    when chunksize is given.
+    """
+    if chunksize:
+        return iter_query(sql, sql_args, chunksize)
+    with TRN:
+        TRN.add(sql, sql_args)
+        columns, chunks = TRN.execute_fetchchunks(redgenes_config.query_chunksize)
+        rows = list(chain.from_iterable(chunks))
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def genomes_by_kegg(kegg_ids, chunksize=None):
+    """
+    Genomes with genes annotated with any of kegg_ids (one id or a list),
+    with the number of such genes per genome and KEGG id.
+    """
+    if isinstance(kegg_ids, str):
+        kegg_ids = [kegg_ids]
+    # One statement for any number of ids, so it is prepared once
+    sql = """
+        SELECT i.entity_id, i.filename_full, i.filepath, k.KEGG, count(*) AS num_genes
+        FROM kegg k
+        JOIN bakta b ON b.bakta_accession = k.bakta_accession
+        JOIN identifier i ON i.entity_id = b.entity_id
+        WHERE k.KEGG IN (SELECT value FROM json_each(?))
+        GROUP BY i.entity_id, k.KEGG
+        ORDER BY i.entity_id, k.KEGG"""
+    return fetch_query(sql, [json.dumps(list(kegg_ids))], chunksize)
+
+
+def genes_by_product(substring, chunksize=None):
+    """
+    Bakta features whose product contains substring, ignoring ASCII case.
+    The distinct products are matched first, so each one is compared once.
+    """
+    pattern = substring.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    sql = """
+        SELECT b.bakta_accession, b.entity_id, i.filename_full, b.contig_id,
+            b.start, b.stop, b.locus_tag, p.product
+        FROM bakta b
+        JOIN bakta_product p ON p.product_key = b.product_key
+        JOIN identifier i ON i.entity_id = b.entity_id
+        WHERE b.product_key IN (
+            SELECT product_key FROM bakta_product WHERE product LIKE ? ESCAPE '\\')
+        ORDER BY b.bakta_accession"""
+    return fetch_query(sql, [f"%{pattern}%"], chunksize)
+
+
+def search_features(text, prefix=False, column=None, limit=100, chunksize=None):
+    """
+    Full-text search of Bakta product, gene and locus_tag through bakta_fts.
+
+    Every word of text must match, as a prefix when prefix is True. column
+    restricts the match to one of product, gene or locus_tag. Results are
+    ordered by bm25 rank, best first; limit=None returns every match.
+    """
+    words = ['"{}"'.format(word.replace('"', '""')) + ("*" if prefix else "") for word in text.split()]
+    if not words:
+        raise ValueError("Empty search text")
+    match = " ".join(words)
+    if column:
+        if column not in ("product", "gene", "locus_tag"):
+            raise ValueError(f"Cannot search column {column}")
+        match = f"{column}: ({match})"
+    sql = """
+        SELECT b.bakta_accession, b.entity_id, i.filename_full, b.contig_id,
+            b.start, b.stop, b.locus_tag, g.gene, p.product, f.rank
+        FROM bakta_fts f
+        JOIN bakta b ON b.bakta_accession = f.rowid
+        JOIN identifier i ON i.entity_id = b.entity_id
+        LEFT JOIN bakta_gene g ON g.gene_key = b.gene_key
+        LEFT JOIN bakta_product p ON p.product_key = b.product_key
+        WHERE bakta_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?"""
+    return fetch_query(sql, [match, -1 if limit is None else limit], chunksize)
+
+
+def qc_genomes(min_completeness=90, max_contamination=5, chunksize=None):
+    """
+    Active genomes whose CheckM completeness and contamination pass the
+    thresholds, high-quality MIMAG by default.
+    """
+    sql = """
+        SELECT i.entity_id, i.filename_full, i.filepath, q.marker_lineage,
+            q.completeness, q.contamination, q.num_contigs, q.N50_contigs
+        FROM qc_info q
+        JOIN identifier i ON i.entity_id = q.entity_id
+        WHERE i.active = 1 AND q.completeness >= ? AND q.contamination <= ?
+        ORDER BY i.entity_id"""
+    return fetch_query(sql, [min_completeness, max_contamination], chunksize)
+
+
+def genome_features(entity_id, chunksize=None):
+    """The Bakta feature table of one genome, in the bakta_info column shape."""
+    sql = "SELECT * FROM bakta_info WHERE entity_id = ? ORDER BY bakta_accession"
+    # a numpy integer, e.g. taken from another result, would be bound as a blob
+    return fetch_query(sql, [int(entity_id)], chunksize)
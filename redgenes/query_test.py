@@ -0,0 +1,77 @@
+import pytest
+import pandas as pd
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db
+from metadata import insert_metadata, IDENTIFIER_CACHE
+from quality_control import insert_checkm_results
+from bakta_annotations import load_bakta_chunk, BAKTA_COLUMNS
+from query import fetch_query, genomes_by_kegg, genes_by_product, search_features, qc_genomes, genome_features
+
+CHECKM = ["k__Bacteria", 0, 0, 1, 1, 100, 100, 100, 100, 100.0, 100.0, 0.9, 11, 2]
+GENOMES = {
+    "GCA_1": (98.0, 1.0, [
+        ["contig1", "cds", 1, 900, "+", "LT1", "tuf", "Elongation factor Tu", "KEGG:K02358"],
+        ["contig1", "cds", 1001, 1900, "-", "LT2", None, "hypothetical protein", "KEGG:K00001"],
+    ]),
+    "GCA_2": (60.0, 12.0, [
+        ["contig1", "cds", 1, 900, "+", "LT1", None, "ABC transporter ATP-binding protein", "KEGG:K02358"],
+    ]),
+}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "query.db"))
+    IDENTIFIER_CACHE.clear()
+    initialize_db()
+    with TRN:
+        for accession, (completeness, contamination, features) in GENOMES.items():
+            row = {"local_path": "/genomes", "assembly_accession": accession, "source": "NCBI"}
+            entity_id = insert_metadata(row)
+            insert_checkm_results(entity_id, [CHECKM[0], completeness, contamination] + CHECKM[3:])
+            load_bakta_chunk(entity_id[0], pd.DataFrame(features, columns=BAKTA_COLUMNS))
+    yield
+    IDENTIFIER_CACHE.clear()
+    TRN.close()
+
+
+def test_genomes_by_kegg(db):
+    result = genomes_by_kegg(["K02358", "K00001"])
+    assert list(result.itertuples(index=False, name=None)) == [
+        (1, "GCA_1", "/genomes", "K00001", 1),
+        (1, "GCA_1", "/genomes", "K02358", 1),
+        (2, "GCA_2", "/genomes", "K02358", 1),
+    ]
+    assert genomes_by_kegg("K99999").empty
+
+
+def test_genes_by_product(db):
+    assert genes_by_product("PROTEIN")["locus_tag"].tolist() == ["LT2", "LT1"]
+    assert genes_by_product("100%").empty
+
+
+def test_qc_genomes(db):
+    assert qc_genomes()["filename_full"].tolist() == ["GCA_1"]
+    assert qc_genomes(50, 15)["filename_full"].tolist() == ["GCA_1", "GCA_2"]
+
+
+def test_genome_features_chunks(db):
+    chunks = list(genome_features(1, chunksize=1))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert chunks[1].loc[0, "product"] == "hypothetical protein"
+    assert pd.isna(chunks[1].loc[0, "gene"])
+
+
+def test_nested_query_while_iterating(db):
+    sql = "SELECT entity_id FROM identifier ORDER BY entity_id"
+    features = [len(genome_features(chunk.loc[0, "entity_id"])) for chunk in fetch_query(sql, chunksize=1)]
+    assert features == [2, 1]
+
+
+def test_search_features(db):
+    assert search_features("elongation")["locus_tag"].tolist() == ["LT1"]
+    assert set(search_features("prot", prefix=True)["product"]) == {
+        "hypothetical protein", "ABC transporter ATP-binding protein"}
+    assert search_features("tuf", column="gene")["entity_id"].tolist() == [1]
+    assert search_features("tuf", column="product").empty
@@ -1,6 +1,68 @@
+import os
+
+# PRAGMAs applied to every new connection. Negative cache_size is in KiB.
+DB_PROFILES = {
+    # durable, readers are not blocked by the writer
+    "default": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "memory",
+    },
+    # a single process loading genomes. With synchronous off a crash of the
+    # process loses nothing, but an OS crash or power loss can lose the last
+    # commits or corrupt the database: back it up first or be ready to reload
+    "bulk_load": {
+        "journal_mode": "wal",
+        "synchronous": "off",
+        "cache_size": -1048576,
+        "mmap_size": 1073741824,
+        "temp_store": "memory",
+    },
+    # analyses reading a loaded database
+    "read": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -262144,
+        "mmap_size": 4294967296,
+        "temp_store": "memory",
+    },
+}
+
+
 class db_config(object):
     def __init__(self):
         self.dbpath = "./redgenes_test.db"
+        # Keep one connection open across "with TRN" blocks
+        self.persistent = True
+        # Most (filename_full, filepath) -> entity_id entries kept in memory
+        self.identifier_cache_size = 500000
+        # Bakta features read, inserted and fanned out to dbxrefs at a time
+        self.bakta_chunksize = 50000
+        # Prepared statements sqlite3 keeps per connection
+        self.cached_statements = 256
+        # Rows fetched at a time by the query module
+        self.query_chunksize = 100000
+        # Local scratch for staged genomes and working directories, the
+        # system temp directory when None
+        self.scratch_dir = os.environ.get("REDGENES_SCRATCH")
+        # kmer2vec file the gene embeddings are computed from at load time,
+        # no embeddings when None
+        self.kmer_vectors = os.environ.get("REDGENES_KMER_VECTORS")
+        self.use_profile(os.environ.get("REDGENES_DB_PROFILE", "default"))
+
+    def use_profile(self, name):
+        """Set the connection PRAGMAs from one of DB_PROFILES."""
+        if name not in DB_PROFILES:
+            raise ValueError(f"Unknown database profile {name}, expected one of {list(DB_PROFILES)}")
+        self.profile = name
+        for pragma, value in DB_PROFILES[name].items():
+            setattr(self, pragma, value)
+
+    def pragmas(self):
+        """Return the PRAGMAs a new connection should run."""
+        return {pragma: getattr(self, pragma) for pragma in DB_PROFILES["default"]}
 
 
 redgenes_config = db_config()
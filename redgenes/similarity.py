@@ -0,0 +1,213 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sql_connection import TRN
+from redgenes_settings import redgenes_config
+from fasta_stats import concatenated_ranges
+from embedding import unpack_embedding
+from query import fetch_query
+
+
+# Database vectors scored at a time by the exact search, bounding the score
+# matrix to queries x SEARCH_CHUNKSIZE floats
+SEARCH_CHUNKSIZE = 65536
+# Vectors k-means trains the IVF centroids on, per centroid
+TRAINING_POINTS_PER_LIST = 64
+
+
+def normalize(matrix):
+    """Scale the rows of a float32 matrix to unit length, in place, so inner
+    products are cosine similarities. Zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def load_embeddings():
+    """Load every embedding into one contiguous float32 matrix, in
+    bakta_accession order, normalized for cosine similarity.
+
+    Returns (bakta_accessions, matrix).
+    """
+    with TRN:
+        TRN.add("SELECT count(*), min(dimension), max(dimension) FROM embedding")
+        count, dimension, max_dimension = TRN.execute_fetchindex()[0]
+        if dimension != max_dimension:
+            raise ValueError(f"Embeddings of {dimension} to {max_dimension} dimensions cannot be searched together")
+        accessions = np.empty(count, dtype=np.int64)
+        matrix = np.empty((count, dimension or 0), dtype=np.float32)
+        TRN.add("SELECT bakta_accession, embedding FROM embedding ORDER BY bakta_accession")
+        _, chunks = TRN.execute_fetchchunks(redgenes_config.query_chunksize)
+        row = 0
+        for chunk in chunks:
+            ids, blobs = zip(*chunk)
+            accessions[row:row + len(chunk)] = ids
+            matrix[row:row + len(chunk)] = unpack_embedding(b"".join(blobs)).reshape(len(chunk), dimension)
+            row += len(chunk)
+    return accessions, normalize(matrix)
+
+
+def top_k(queries, matrix, k=10, chunksize=SEARCH_CHUNKSIZE):
+    """Exact top-k of every query by inner product with the rows of matrix,
+    scored chunksize rows at a time.
+
+    Returns (rows, scores), both queries x min(k, len(matrix)), best first.
+    """
+    queries = np.atleast_2d(queries)
+    k = min(k, len(matrix))
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    if k == 0:
+        return best_rows, best_scores
+    for start in range(0, len(matrix), chunksize):
+        chunk_scores = queries @ matrix[start:start + chunksize].T
+        chunk_rows = np.broadcast_to(np.arange(start, start + chunk_scores.shape[1]), chunk_scores.shape)
+        # the best k so far compete with the chunk
+        scores = np.concatenate([best_scores, chunk_scores], axis=1)
+        rows = np.concatenate([best_rows, chunk_rows], axis=1)
+        if scores.shape[1] > k:
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores, rows = np.take_along_axis(scores, keep, axis=1), np.take_along_axis(rows, keep, axis=1)
+        best_scores, best_rows = scores, rows
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class ExactIndex:
+    """Brute-force cosine search over embeddings held in memory."""
+
+    def __init__(self, accessions, matrix):
+        self.accessions = accessions
+        self.matrix = matrix
+
+    def search(self, queries, k=10):
+        """Return (bakta_accessions, scores) of the k most similar genes of
+        every query, best first."""
+        rows, scores = top_k(normalize(np.atleast_2d(queries).astype(np.float32)), self.matrix, k)
+        return self.accessions[rows], scores
+
+
+def nearest_centroids(matrix, centroids, chunksize=4096):
+    """Index of the most similar centroid of every row of matrix, scoring
+    chunksize rows at a time."""
+    return np.concatenate([
+        np.argmax(matrix[start:start + chunksize] @ centroids.T, axis=1)
+        for start in range(0, len(matrix), chunksize)
+    ] or [np.zeros(0, dtype=np.int64)])
+
+
+def train_centroids(matrix, n_lists, iterations=10, seed=0):
+    """Spherical k-means centroids of a sample of the rows of matrix."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), n_lists * TRAINING_POINTS_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # an empty list restarts from a random vector
+        empty = np.bincount(assignment, minlength=n_lists) == 0
+        sums[empty] = sample[rng.choice(len(sample), empty.sum())]
+        centroids = normalize(sums)
+    return centroids
+
+
+def build_ivf_index(accessions, matrix, path, n_lists=None, iterations=10, seed=0):
+    """Write an inverted file index of normalized embeddings to directory
+    path: k-means centroids, and the vectors and bakta_accessions grouped by
+    nearest centroid so each list is one contiguous slice. n_lists defaults
+    to 4 * sqrt(number of vectors).
+    """
+    n_lists = min(n_lists or max(int(4 * np.sqrt(len(matrix))), 1), len(matrix))
+    centroids = train_centroids(matrix, n_lists, iterations, seed)
+    assignment = nearest_centroids(matrix, centroids)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+
+    # written next to path and renamed, so a reader never sees a partial index
+    path = Path(path)
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    np.save(tmp_path / "centroids.npy", centroids)
+    np.save(tmp_path / "offsets.npy", offsets)
+    np.save(tmp_path / "vectors.npy", matrix[order])
+    np.save(tmp_path / "accessions.npy", accessions[order])
+    (tmp_path / "index.json").write_text(json.dumps({
+        "vectors": len(matrix),
+        "dimension": matrix.shape[1],
+        "lists": n_lists,
+        "max_bakta_accession": int(accessions.max()) if len(accessions) else None,
+    }))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return IVFIndex(path)
+
+
+class IVFIndex:
+    """Approximate cosine search through an index written by build_ivf_index.
+    The vectors stay on disk, memory-mapped, and a query reads only the lists
+    of its n_probe nearest centroids."""
+
+    def __init__(self, path, n_probe=8):
+        path = Path(path)
+        self.info = json.loads((path / "index.json").read_text())
+        self.centroids = np.load(path / "centroids.npy")
+        self.offsets = np.load(path / "offsets.npy")
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.accessions = np.load(path / "accessions.npy", mmap_mode="r")
+        self.n_probe = n_probe
+
+    def search(self, queries, k=10, n_probe=None):
+        """Return (bakta_accessions, scores) of the k most similar genes of
+        every query among the lists probed, best first. A query whose lists
+        hold fewer than k vectors is padded with accession -1 and score -inf."""
+        queries = normalize(np.atleast_2d(queries).astype(np.float32))
+        lists, _ = top_k(queries, self.centroids, n_probe or self.n_probe)
+        accessions = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, probed) in enumerate(zip(queries, lists)):
+            rows = concatenated_ranges(self.offsets[probed], self.offsets[probed + 1])
+            best, best_scores = top_k(query, self.vectors[rows], k)
+            accessions[i, :best.shape[1]] = self.accessions[rows[best[0]]]
+            scores[i, :best.shape[1]] = best_scores[0]
+        return accessions, scores
+
+
+def similar_genes(bakta_accessions, k=10, index_path=None, n_probe=8):
+    """The k genes most similar to each of bakta_accessions by cosine
+    similarity of their embeddings, excluding the gene itself. Searches
+    exactly over all embeddings, or through the IVF index at index_path.
+    """
+    if isinstance(bakta_accessions, (int, np.integer)):
+        bakta_accessions = [bakta_accessions]
+    sql = """
+        SELECT bakta_accession, embedding FROM embedding
+        WHERE bakta_accession IN (SELECT value FROM json_each(?))"""
+    queries = fetch_query(sql, [json.dumps([int(accession) for accession in bakta_accessions])])
+    missing = set(map(int, bakta_accessions)) - set(queries["bakta_accession"])
+    if missing:
+        raise ValueError(f"No embedding for bakta_accession {sorted(missing)}")
+
+    index = IVFIndex(index_path, n_probe) if index_path else ExactIndex(*load_embeddings())
+    vectors = np.stack([unpack_embedding(blob) for blob in queries["embedding"]])
+    accessions, scores = index.search(vectors, k + 1)
+    hits = pd.DataFrame({
+        "query_accession": np.repeat(queries["bakta_accession"].to_numpy(), accessions.shape[1]),
+        "bakta_accession": accessions.ravel(),
+        "score": scores.ravel(),
+    })
+    hits = hits[(hits["bakta_accession"] >= 0) & (hits["bakta_accession"] != hits["query_accession"])]
+    hits = hits.groupby("query_accession", sort=False).head(k)
+
+    sql = """
+        SELECT b.bakta_accession, b.entity_id, i.filename_full, b.locus_tag, b.gene, b.product
+        FROM bakta_info b
+        JOIN identifier i ON i.entity_id = b.entity_id
+        WHERE b.bakta_accession IN (SELECT value FROM json_each(?))"""
+    genes = fetch_query(sql, [json.dumps(hits["bakta_accession"].astype(int).tolist())])
+    return hits.merge(genes, on="bakta_accession", how="left").reset_index(drop=True)
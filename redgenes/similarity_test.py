@@ -0,0 +1,56 @@
+import pytest
+import numpy as np
+import pandas as pd
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db
+from metadata import insert_metadata, IDENTIFIER_CACHE
+from bakta_annotations import load_bakta_chunk, BAKTA_COLUMNS
+from embedding import insert_embeddings
+from similarity import normalize, top_k, load_embeddings, build_ivf_index, similar_genes
+
+VECTORS = np.array([[1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0.1, 0.8, 0.2], [-1, 0, 0]], dtype=np.float32)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "similarity.db"))
+    IDENTIFIER_CACHE.clear()
+    initialize_db()
+    features = [["contig1", "cds", i * 1000 + 1, i * 1000 + 900, "+", f"LT{i}", None, "hypothetical protein", None]
+                for i in range(len(VECTORS))]
+    with TRN:
+        entity_id = insert_metadata({"local_path": "/genomes", "assembly_accession": "GCA_1", "source": "NCBI"})[0]
+        load_bakta_chunk(entity_id, pd.DataFrame(features, columns=BAKTA_COLUMNS))
+        insert_embeddings(range(1, len(VECTORS) + 1), VECTORS * 3)
+    yield
+    IDENTIFIER_CACHE.clear()
+    TRN.close()
+
+
+def test_top_k_matches_full_sort():
+    rng = np.random.default_rng(0)
+    matrix = normalize(rng.normal(size=(1000, 8)).astype(np.float32))
+    queries = normalize(rng.normal(size=(4, 8)).astype(np.float32))
+    rows, scores = top_k(queries, matrix, 5, chunksize=97)
+    assert (rows == np.argsort(-(queries @ matrix.T), axis=1)[:, :5]).all()
+    assert (np.diff(scores, axis=1) <= 0).all()
+    assert top_k(queries, matrix[:3], 5)[0].shape == (4, 3)
+
+
+def test_load_embeddings(db):
+    accessions, matrix = load_embeddings()
+    assert accessions.tolist() == [1, 2, 3, 4, 5]
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1, rtol=1e-6)
+
+
+def test_similar_genes(db, tmp_path):
+    hits = similar_genes(1, k=2)
+    assert hits["bakta_accession"].tolist() == [2, 4]
+    assert hits["locus_tag"].tolist() == ["LT1", "LT3"]
+    # probing every list of the index is exact
+    build_ivf_index(*load_embeddings(), tmp_path / "index", n_lists=2)
+    indexed = similar_genes([1, 3], k=2, index_path=tmp_path / "index", n_probe=2)
+    assert indexed["bakta_accession"].tolist() == [2, 4, 4, 2]
+    with pytest.raises(ValueError):
+        similar_genes(99)
@@ -1,8 +1,11 @@
+import time
+import atexit
 import sqlite3
 from itertools import chain
 from functools import wraps
 from contextlib import contextmanager
 from redgenes_settings import redgenes_config
+from profiling import PROFILER
 
 def _checker(func):
     @wraps(func)
@@ -12,6 +15,14 @@ def _checker(func):
         return func(self, *args, **kwargs)
     return wrapper
 
+class _Bulk:
+    """Marks queued sql_args that are run with a single executemany call."""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = rows
+
 @contextmanager
 def get_cursor(connection):
     cursor = connection.cursor()
@@ -25,27 +36,59 @@ class Transaction:
         self._queries = []
         self._contexts_entered = 0
         self._connection = None
+        self._read_cursor = None
+        self._reading = False
+        self._dbpath = None
+        self._pragmas = None
         self._admin = admin
         self._post_commit_funcs = []
         self._post_rollback_funcs = []
+        # Lengths of the post commit/rollback lists when each savepoint began
+        self._savepoint_marks = []
 
     def _open_connection(self):
+        if self._connection and self._dbpath != redgenes_config.dbpath:
+            self.close()
         if not self._connection:
-            self._connection = sqlite3.connect(redgenes_config.dbpath)
+            self._connection = sqlite3.connect(
+                redgenes_config.dbpath, cached_statements=redgenes_config.cached_statements
+            )
             self._connection.row_factory = sqlite3.Row
+            self._dbpath = redgenes_config.dbpath
+        self._apply_pragmas()
+
+    def _apply_pragmas(self):
+        """Run the PRAGMAs of the configured profile if they changed since the
+        connection last applied them."""
+        pragmas = redgenes_config.pragmas()
+        if pragmas == self._pragmas:
+            return
+        with get_cursor(self._connection) as cursor:
+            for pragma, value in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+        self._pragmas = pragmas
 
     def __enter__(self):
         if self._contexts_entered == 0:
             self._open_connection()
+        else:
+            self._begin_savepoint()
         self._contexts_entered += 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._clean_up(exc_type)
-        self._contexts_entered -= 1
+        try:
+            if self._contexts_entered == 1:
+                self._clean_up(exc_type)
+            else:
+                self._end_savepoint(exc_type)
+        finally:
+            self._contexts_entered -= 1
         if self._contexts_entered == 0:
-            self._connection.close()
-            self._connection = None
+            # an execute_fetchchunks iterator may have been left unconsumed
+            self._reading = False
+            if not redgenes_config.persistent:
+                self.close()
 
     def _clean_up(self, exc_type):
         if exc_type:
@@ -55,6 +98,36 @@ class Transaction:
                 self.execute()
             self.commit()
 
+    def _begin_savepoint(self):
+        """Nested contexts run inside a savepoint of the outermost transaction,
+        so an error rolls back only the work of the nested context."""
+        if self._queries:
+            self.execute()
+        if not self._connection.in_transaction:
+            self._connection.execute("BEGIN")
+        self._connection.execute(f"SAVEPOINT redgenes_{self._contexts_entered}")
+        self._savepoint_marks.append(
+            (len(self._post_commit_funcs), len(self._post_rollback_funcs))
+        )
+
+    def _end_savepoint(self, exc_type):
+        # _contexts_entered still counts this context, the savepoint was
+        # created with the count of the enclosing one
+        name = f"redgenes_{self._contexts_entered - 1}"
+        commit_mark, rollback_mark = self._savepoint_marks.pop()
+        if exc_type:
+            self._queries = []
+            self._connection.execute(f"ROLLBACK TO {name}")
+            # Only the functions registered inside the savepoint apply
+            rollback_funcs = self._post_rollback_funcs[rollback_mark:]
+            del self._post_commit_funcs[commit_mark:]
+            del self._post_rollback_funcs[rollback_mark:]
+            for func, args, kwargs in rollback_funcs:
+                func(*args, **kwargs)
+        elif self._queries:
+            self.execute()
+        self._connection.execute(f"RELEASE {name}")
+
     @_checker
     def add(self, sql, sql_args=None, many=False):
         if many:
@@ -62,12 +135,30 @@ class Transaction:
         else:
             self._queries.append((sql, sql_args or []))
 
+    @_checker
+    def add_bulk(self, sql, sql_args):
+        """Queues sql to be run once over all sql_args with executemany.
+
+        Unlike add(many=True), the rows are sent in a single call, so sql
+        cannot use RETURNING. The result of the query is [(rowcount,)].
+        """
+        self._queries.append((sql, _Bulk(sql_args)))
+
     def _execute(self):
         results = []
+        rows_written = 0
+        start = time.perf_counter()
         with get_cursor(self._connection) as cursor:
             for sql, sql_args in self._queries:
-                cursor.execute(sql, sql_args or [])
-                results.append(cursor.fetchall())
+                if isinstance(sql_args, _Bulk):
+                    cursor.executemany(sql, sql_args.rows)
+                    results.append([(cursor.rowcount,)])
+                else:
+                    cursor.execute(sql, sql_args or [])
+                    results.append(cursor.fetchall())
+                # rowcount is -1 for statements that do not modify rows
+                rows_written += max(cursor.rowcount, 0)
+        PROFILER.count_sql(time.perf_counter() - start, len(self._queries), rows_written)
         self._queries = []
         return results
 
@@ -76,7 +167,10 @@ class Transaction:
         try:
             return self._execute()
         except sqlite3.Error as e:
-            self.rollback()
+            self._queries = []
+            # Inside a nested context the savepoint is rolled back on exit
+            if self._contexts_entered == 1:
+                self.rollback()
             raise RuntimeError(f"Database execution error: {e}") from e
 
     @_checker
@@ -105,6 +199,50 @@ class Transaction:
         """Flattens and fetches results of the indexed query."""
         return list(chain.from_iterable(self.execute()[idx])) if self._queries else None
 
+    @_checker
+    def execute_fetchchunks(self, chunksize=1000):
+        """Executes the queued queries and returns the column names of the
+        last one with an iterator over its rows, as lists of at most chunksize
+        tuples. The rows are fetched lazily, so consume the iterator before
+        leaving the context."""
+        *queries, (sql, sql_args) = self._queries
+        self._queries = queries
+        if queries:
+            self.execute()
+        cursor = self._get_read_cursor()
+        try:
+            cursor.execute(sql, sql_args or [])
+        except sqlite3.Error as e:
+            if self._contexts_entered == 1:
+                self.rollback()
+            raise RuntimeError(f"Database execution error: {e}") from e
+        columns = [column[0] for column in cursor.description or []]
+        return columns, self._iter_chunks(cursor, chunksize)
+
+    def _get_read_cursor(self):
+        """Reuse one plain-tuple cursor for reads, unless it is still being
+        read from, e.g. by a query run while iterating over another."""
+        if self._reading:
+            cursor = self._connection.cursor()
+        else:
+            if self._read_cursor is None:
+                self._read_cursor = self._connection.cursor()
+            cursor = self._read_cursor
+            self._reading = True
+        cursor.row_factory = None
+        return cursor
+
+    def _iter_chunks(self, cursor, chunksize):
+        try:
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            if cursor is self._read_cursor:
+                self._reading = False
+
     @_checker
     def execute_fetchiter(self):
         """Generates an iterator for the results of the queries."""
@@ -118,6 +256,9 @@ class Transaction:
         if self._connection:
             self._connection.close()
             self._connection = None
+            self._read_cursor = None
+            self._reading = False
+            self._pragmas = None
 
     @_checker
     def commit(self):
@@ -125,6 +266,7 @@ class Transaction:
         for func, args, kwargs in self._post_commit_funcs:
             func(*args, **kwargs)
         self._post_commit_funcs = []
+        self._post_rollback_funcs = []
 
     @_checker
     def rollback(self):
@@ -133,6 +275,7 @@ class Transaction:
         for func, args, kwargs in self._post_rollback_funcs:
             func(*args, **kwargs)
         self._post_rollback_funcs = []
+        self._post_commit_funcs = []
 
     @property
     def index(self):
@@ -156,6 +299,8 @@ class Transaction:
 # Singleton pattern, create the transaction for the entire system
 TRN = Transaction()
 TRNADMIN = Transaction(admin=True)
+atexit.register(TRN.close)
+atexit.register(TRNADMIN.close)
 
 
 def perform_as_transaction(sql, parameters=None):
@@ -0,0 +1,83 @@
+import pytest
+from redgenes_settings import redgenes_config
+from sql_connection import Transaction
+
+
+@pytest.fixture
+def trn(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "test.db"))
+    trn = Transaction()
+    with trn:
+        trn.add("CREATE TABLE t (x INTEGER)")
+    yield trn
+    trn.close()
+
+
+def count_rows(trn):
+    with trn:
+        trn.add("SELECT count(*) FROM t")
+        return trn.execute_fetchflatten()[0]
+
+
+def test_nested_context_commits_with_outermost(trn):
+    with trn:
+        with trn:
+            trn.add("INSERT INTO t VALUES (1)")
+        trn.add("INSERT INTO t VALUES (2)")
+    assert count_rows(trn) == 2
+
+
+def test_nested_context_error_rolls_back_only_itself(trn):
+    with trn:
+        trn.add("INSERT INTO t VALUES (1)")
+        try:
+            with trn:
+                trn.add("INSERT INTO t VALUES (2)")
+                trn.execute()
+                raise ValueError("bad genome")
+        except ValueError:
+            pass
+        with trn:
+            trn.add("INSERT INTO t VALUES (3)")
+    with trn:
+        trn.add("SELECT x FROM t ORDER BY x")
+        assert trn.execute_fetchflatten() == [1, 3]
+
+
+def test_nested_sql_error_keeps_outer_work(trn):
+    with trn:
+        trn.add("INSERT INTO t VALUES (1)")
+        with pytest.raises(RuntimeError):
+            with trn:
+                trn.add("INSERT INTO missing VALUES (2)")
+                trn.execute()
+    assert count_rows(trn) == 1
+
+
+def test_outermost_error_rolls_back_everything(trn):
+    with pytest.raises(ValueError):
+        with trn:
+            with trn:
+                trn.add("INSERT INTO t VALUES (1)")
+            raise ValueError
+    assert count_rows(trn) == 0
+
+
+def test_add_bulk(trn):
+    with trn:
+        trn.add_bulk("INSERT INTO t VALUES (?)", ([i] for i in range(5)))
+        assert trn.execute() == [[(5,)]]
+    assert count_rows(trn) == 5
+
+
+def test_savepoint_rollback_runs_its_rollback_funcs(trn):
+    called = []
+    with trn:
+        trn.add_post_rollback_func(called.append, "outer")
+        try:
+            with trn:
+                trn.add_post_rollback_func(called.append, "inner")
+                raise ValueError
+        except ValueError:
+            pass
+    assert called == ["inner"]
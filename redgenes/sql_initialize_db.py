@@ -3,6 +3,11 @@ from sql_connection import TRN
 from exceptions import PatchDirectoryNotFound, PatchFileExecutionError
 
 
+# Indexes the loader itself reads, per genome, which defer_indexes keeps:
+# fetch_bakta_accessions and embed_genome select Bakta features by entity_id
+LOADER_INDEXES = ["idx_bakta_entity_id"]
+
+
 def get_patch_list(patch_dir):
     """Returns the list of patch files in order."""
     # Check if patch_dir exists and is a directory because
@@ -68,3 +73,38 @@ def initialize_db():
                     sql = "update settings set executed = 1, modified_at = current_timestamp where patch_id = ?"
                     TRN.add(sql, [patch_id])
                     TRN.execute()
+
+
+def defer_indexes():
+    """Drop the non-unique indexes before a bulk load, except LOADER_INDEXES.
+    Their SQL is kept in deferred_index so rebuild_indexes can recreate them,
+    even after a crash."""
+    loader_indexes = ", ".join("?" * len(LOADER_INDEXES))
+    with TRN:
+        sql = f"""
+            insert or ignore into deferred_index (name, sql)
+            select name, sql from sqlite_master
+            where type = 'index' and sql is not null and sql not like 'create unique%'
+                and name not in ({loader_indexes})"""
+        TRN.add(sql, LOADER_INDEXES)
+        TRN.add(f"select name from deferred_index where name not in ({loader_indexes})", LOADER_INDEXES)
+        index_names = TRN.execute_fetchflatten()
+        for name in index_names:
+            TRN.add(f"drop index if exists {name}")
+    return index_names
+
+
+def rebuild_indexes():
+    """Recreate the indexes dropped by defer_indexes and refresh the query
+    planner statistics. Does nothing if no index is deferred."""
+    with TRN:
+        TRN.add("select name, sql from deferred_index")
+        deferred = TRN.execute_fetchindex()
+        if not deferred:
+            return []
+        for name, sql in deferred:
+            TRN.add(f"drop index if exists {name}")
+            TRN.add(sql)
+        TRN.add("delete from deferred_index")
+        TRN.add("analyze")
+    return [name for name, _ in deferred]
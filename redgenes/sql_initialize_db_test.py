@@ -0,0 +1,20 @@
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db, defer_indexes, rebuild_indexes, LOADER_INDEXES
+
+
+def test_defer_indexes_keeps_loader_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "indexes.db"))
+    initialize_db()
+    try:
+        deferred = defer_indexes()
+        assert "idx_kegg_bakta_accession" in deferred
+        assert not set(LOADER_INDEXES) & set(deferred)
+        with TRN:
+            TRN.add("SELECT name FROM sqlite_master WHERE type = 'index'")
+            indexes = TRN.execute_fetchflatten()
+        assert set(LOADER_INDEXES) <= set(indexes)
+        assert "idx_kegg_bakta_accession" not in indexes
+        assert sorted(rebuild_indexes()) == sorted(deferred)
+    finally:
+        TRN.close()
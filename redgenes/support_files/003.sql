@@ -0,0 +1,27 @@
+-- load_ledger: last completed ingestion stage of each genome
+-- stages in order: identifier, qc, bakta, dbxref
+BEGIN TRANSACTION;
+
+create table if not exists load_ledger(
+    filename_full varchar not null,
+    filepath varchar not null,
+    entity_id integer,
+    stage varchar not null,
+    created_at timestamp default current_timestamp not null,
+    modified_at timestamp default current_timestamp not null,
+    foreign key (entity_id) references identifier (entity_id),
+    primary key (filename_full, filepath)
+);
+
+-- backfill genomes loaded before the ledger existed. bakta and dbxref rows
+-- used to be committed together, so genomes with bakta rows are complete
+insert or ignore into load_ledger (filename_full, filepath, entity_id, stage)
+select i.filename_full, i.filepath, i.entity_id,
+    case
+        when exists (select 1 from bakta b where b.entity_id = i.entity_id) then 'dbxref'
+        when exists (select 1 from qc_info q where q.entity_id = i.entity_id) then 'qc'
+        else 'identifier'
+    end
+from identifier i;
+
+COMMIT;
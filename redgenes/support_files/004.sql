@@ -0,0 +1,24 @@
+-- indexes for per-genome lookups and for bulk loads
+BEGIN TRANSACTION;
+
+-- bakta_accession is the rowid, this index only slows down inserts
+DROP INDEX IF EXISTS idx_bakta_accession;
+
+CREATE INDEX IF NOT EXISTS idx_bakta_entity_id ON bakta(entity_id);
+CREATE INDEX IF NOT EXISTS idx_md_info_entity_id ON md_info(entity_id);
+CREATE INDEX IF NOT EXISTS idx_refseq_bakta_accession ON refseq(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_so_bakta_accession ON so(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_uniparc_bakta_accession ON uniparc(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_uniref_bakta_accession ON uniref(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_kegg_bakta_accession ON kegg(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_pfam_bakta_accession ON pfam(bakta_accession);
+CREATE INDEX IF NOT EXISTS idx_embedding_bakta_accession ON embedding(bakta_accession);
+
+-- indexes dropped for a bulk load, recreated when the load finishes
+create table if not exists deferred_index(
+    name varchar primary key,
+    sql varchar not null,
+    created_at timestamp default current_timestamp not null
+);
+
+COMMIT;
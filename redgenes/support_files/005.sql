@@ -0,0 +1,98 @@
+-- dictionary-encode the repetitive bakta columns: type, strand, gene and
+-- product are stored once in lookup tables and bakta keeps their integer keys.
+-- bakta_info has the columns bakta used to have.
+BEGIN TRANSACTION;
+
+create table if not exists bakta_type(
+    type_key integer primary key,
+    type varchar not null unique
+);
+
+create table if not exists bakta_strand(
+    strand_key integer primary key,
+    strand varchar not null unique
+);
+
+create table if not exists bakta_gene(
+    gene_key integer primary key,
+    gene varchar not null unique
+);
+
+create table if not exists bakta_product(
+    product_key integer primary key,
+    product varchar not null unique
+);
+
+insert or ignore into bakta_type (type) select distinct type from bakta where type is not null;
+insert or ignore into bakta_strand (strand) select distinct strand from bakta where strand is not null;
+insert or ignore into bakta_gene (gene) select distinct gene from bakta where gene is not null;
+insert or ignore into bakta_product (product) select distinct product from bakta where product is not null;
+
+-- rebuild bakta with the keys. The dbxref and embedding tables reference bakta
+-- by name, so their foreign keys point at the new table after the rename
+CREATE TABLE bakta_new (
+    bakta_accession integer primary key autoincrement,
+    entity_id integer,
+    contig_id varchar,
+    type_key integer,
+    gene_id varchar,
+    start integer,
+    stop integer,
+    strand_key integer,
+    locus_tag varchar,
+    gene_key integer,
+    product_key integer,
+    gene_accession integer,
+    created_at timestamp default current_timestamp not null,
+    updated_at timestamp default current_timestamp not null,
+    foreign key (entity_id) references identifier (entity_id),
+    foreign key (type_key) references bakta_type (type_key),
+    foreign key (strand_key) references bakta_strand (strand_key),
+    foreign key (gene_key) references bakta_gene (gene_key),
+    foreign key (product_key) references bakta_product (product_key)
+);
+
+INSERT INTO bakta_new (
+    bakta_accession, entity_id, contig_id, type_key, gene_id, start, stop,
+    strand_key, locus_tag, gene_key, product_key, gene_accession, created_at, updated_at)
+SELECT b.bakta_accession, b.entity_id, b.contig_id, t.type_key, b.gene_id, b.start, b.stop,
+    s.strand_key, b.locus_tag, g.gene_key, p.product_key, b.gene_accession, b.created_at, b.updated_at
+FROM bakta b
+LEFT JOIN bakta_type t ON t.type = b.type
+LEFT JOIN bakta_strand s ON s.strand = b.strand
+LEFT JOIN bakta_gene g ON g.gene = b.gene
+LEFT JOIN bakta_product p ON p.product = b.product
+ORDER BY b.bakta_accession;
+
+-- keep handing out accessions after the last one ever used, not after the last row
+DELETE FROM sqlite_sequence WHERE name = 'bakta_new';
+INSERT INTO sqlite_sequence (name, seq) SELECT 'bakta_new', seq FROM sqlite_sequence WHERE name = 'bakta';
+
+DROP TABLE bakta;
+ALTER TABLE bakta_new RENAME TO bakta;
+
+CREATE INDEX IF NOT EXISTS idx_bakta_entity_id ON bakta(entity_id);
+
+CREATE VIEW IF NOT EXISTS bakta_info AS
+SELECT
+    b.bakta_accession,
+    b.entity_id,
+    b.contig_id,
+    t.type,
+    b.gene_id,
+    b.start,
+    b.stop,
+    s.strand,
+    b.locus_tag,
+    g.gene,
+    p.product,
+    b.gene_accession,
+    b.created_at,
+    b.updated_at
+FROM bakta b
+LEFT JOIN bakta_type t ON t.type_key = b.type_key
+LEFT JOIN bakta_strand s ON s.strand_key = b.strand_key
+LEFT JOIN bakta_gene g ON g.gene_key = b.gene_key
+LEFT JOIN bakta_product p ON p.product_key = b.product_key;
+
+COMMIT;
@@ -0,0 +1,77 @@
+-- cluster the dbxref tables on (accession, bakta_accession): a lookup by
+-- accession reads the bakta accessions straight from the primary key b-tree,
+-- without the surrogate key, its sqlite_sequence updates or a second index.
+-- Duplicate (accession, bakta_accession) pairs are dropped.
+BEGIN TRANSACTION;
+
+CREATE TABLE kegg_new (
+    KEGG varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (KEGG, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO kegg_new (KEGG, bakta_accession) SELECT KEGG, bakta_accession FROM kegg;
+DROP TABLE kegg;
+ALTER TABLE kegg_new RENAME TO kegg;
+CREATE INDEX IF NOT EXISTS idx_kegg_bakta_accession ON kegg(bakta_accession);
+
+CREATE TABLE refseq_new (
+    RefSeq varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (RefSeq, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO refseq_new (RefSeq, bakta_accession) SELECT RefSeq, bakta_accession FROM refseq;
+DROP TABLE refseq;
+ALTER TABLE refseq_new RENAME TO refseq;
+CREATE INDEX IF NOT EXISTS idx_refseq_bakta_accession ON refseq(bakta_accession);
+
+CREATE TABLE uniparc_new (
+    UniParc varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (UniParc, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO uniparc_new (UniParc, bakta_accession) SELECT UniParc, bakta_accession FROM uniparc;
+DROP TABLE uniparc;
+ALTER TABLE uniparc_new RENAME TO uniparc;
+CREATE INDEX IF NOT EXISTS idx_uniparc_bakta_accession ON uniparc(bakta_accession);
+
+CREATE TABLE uniref_new (
+    UniRef varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (UniRef, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO uniref_new (UniRef, bakta_accession) SELECT UniRef, bakta_accession FROM uniref;
+DROP TABLE uniref;
+ALTER TABLE uniref_new RENAME TO uniref;
+CREATE INDEX IF NOT EXISTS idx_uniref_bakta_accession ON uniref(bakta_accession);
+
+CREATE TABLE so_new (
+    SO varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (SO, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO so_new (SO, bakta_accession) SELECT SO, bakta_accession FROM so;
+DROP TABLE so;
+ALTER TABLE so_new RENAME TO so;
+CREATE INDEX IF NOT EXISTS idx_so_bakta_accession ON so(bakta_accession);
+
+CREATE TABLE pfam_new (
+    PFAM varchar NOT NULL,
+    bakta_accession INTEGER NOT NULL,
+    primary key (PFAM, bakta_accession),
+    foreign key (bakta_accession) references bakta (bakta_accession)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO pfam_new (PFAM, bakta_accession) SELECT PFAM, bakta_accession FROM pfam;
+DROP TABLE pfam;
+ALTER TABLE pfam_new RENAME TO pfam;
+CREATE INDEX IF NOT EXISTS idx_pfam_bakta_accession ON pfam(bakta_accession);
+
+-- the accession indexes of 001.sql and their deferred copies are covered by the primary keys
+DELETE FROM deferred_index WHERE name IN ('idx_kegg', 'idx_refseq', 'idx_uniparc', 'idx_uniref');
+DELETE FROM sqlite_sequence WHERE name IN ('kegg', 'refseq', 'uniparc', 'uniref', 'so', 'pfam');
+
+COMMIT;
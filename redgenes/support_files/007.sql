@@ -0,0 +1,22 @@
+-- full-text index over the product, gene and locus_tag of bakta features.
+-- It stores only the index: the text is read from bakta_info, by
+-- bakta_accession. The loader adds the features of each chunk it inserts;
+-- deleting features from bakta requires the FTS5 'delete' command.
+-- '_' is part of tokens so locus tags stay whole, prefix indexes speed up
+-- 2 and 3 character prefix queries.
+BEGIN TRANSACTION;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS bakta_fts USING fts5(
+    product,
+    gene,
+    locus_tag,
+    content = 'bakta_info',
+    content_rowid = 'bakta_accession',
+    tokenize = "unicode61 tokenchars '_'",
+    prefix = '2 3'
+);
+
+-- index the features loaded so far
+INSERT INTO bakta_fts (bakta_fts) VALUES ('rebuild');
+
+COMMIT;
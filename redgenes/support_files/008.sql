@@ -0,0 +1,20 @@
+-- one row per gene embedding, its float32 values packed little-endian in a
+-- blob, instead of one row per dimension. The previous table was never
+-- written by the loader, so it is replaced rather than converted.
+-- bakta_accession is the rowid, so a lookup by gene reads a single b-tree.
+BEGIN TRANSACTION;
+
+DROP INDEX IF EXISTS idx_embedding_bakta_accession;
+DROP TABLE IF EXISTS embedding;
+DELETE FROM deferred_index WHERE name = 'idx_embedding_bakta_accession';
+DELETE FROM sqlite_sequence WHERE name = 'embedding';
+
+CREATE TABLE embedding (
+    bakta_accession integer primary key,
+    dimension integer not null,
+    embedding blob not null,
+    created_at timestamp default current_timestamp not null,
+    foreign key (bakta_accession) references bakta (bakta_accession)
+);
+
+COMMIT;
@@ -0,0 +1,83 @@
+-- denormalized views of genomes, genes and gene dbxrefs, as exported by
+-- export.py. Every view has the entity_id and created_at of its rows.
+BEGIN TRANSACTION;
+
+-- one row per genome with its metadata and CheckM results
+CREATE VIEW IF NOT EXISTS genome_export AS
+SELECT
+    i.entity_id,
+    i.filename_full,
+    i.filepath,
+    i.active,
+    m.source,
+    m.source_detailed,
+    m.external_accession,
+    q.marker_lineage,
+    q.completeness,
+    q.contamination,
+    q.num_scaffolds,
+    q.num_contigs,
+    q.longest_scaffold,
+    q.longest_contig,
+    q.N50_scaffolds,
+    q.N50_contigs,
+    q.mean_scaffold_length,
+    q.mean_contig_length,
+    q.coding_density,
+    q.translation_table,
+    q.num_predicted_genes,
+    i.created_at
+FROM identifier i
+LEFT JOIN md_info m ON m.entity_id = i.entity_id
+LEFT JOIN qc_info q ON q.entity_id = i.entity_id;
+
+-- one row per Bakta feature with its genome, QC and comma-separated dbxrefs
+CREATE VIEW IF NOT EXISTS gene_export AS
+SELECT
+    b.bakta_accession,
+    b.entity_id,
+    i.filename_full,
+    m.source,
+    b.contig_id,
+    b.type,
+    b.start,
+    b.stop,
+    b.strand,
+    b.locus_tag,
+    b.gene,
+    b.product,
+    (SELECT group_concat(x.KEGG, ',') FROM kegg x WHERE x.bakta_accession = b.bakta_accession) AS kegg,
+    (SELECT group_concat(x.RefSeq, ',') FROM refseq x WHERE x.bakta_accession = b.bakta_accession) AS refseq,
+    (SELECT group_concat(x.UniParc, ',') FROM uniparc x WHERE x.bakta_accession = b.bakta_accession) AS uniparc,
+    (SELECT group_concat(x.UniRef, ',') FROM uniref x WHERE x.bakta_accession = b.bakta_accession) AS uniref,
+    (SELECT group_concat(x.SO, ',') FROM so x WHERE x.bakta_accession = b.bakta_accession) AS so,
+    (SELECT group_concat(x.PFAM, ',') FROM pfam x WHERE x.bakta_accession = b.bakta_accession) AS pfam,
+    q.completeness,
+    q.contamination,
+    b.created_at
+FROM bakta_info b
+JOIN identifier i ON i.entity_id = b.entity_id
+LEFT JOIN md_info m ON m.entity_id = b.entity_id
+LEFT JOIN qc_info q ON q.entity_id = b.entity_id;
+
+-- one row per (gene, dbxref), the long form of the gene_export dbxrefs
+CREATE VIEW IF NOT EXISTS dbxref_export AS
+SELECT b.bakta_accession, b.entity_id, 'KEGG' AS db, x.KEGG AS accession, b.created_at
+FROM kegg x JOIN bakta b ON b.bakta_accession = x.bakta_accession
+UNION ALL
+SELECT b.bakta_accession, b.entity_id, 'RefSeq', x.RefSeq, b.created_at
+FROM refseq x JOIN bakta b ON b.bakta_accession = x.bakta_accession
+UNION ALL
+SELECT b.bakta_accession, b.entity_id, 'UniParc', x.UniParc, b.created_at
+FROM uniparc x JOIN bakta b ON b.bakta_accession = x.bakta_accession
+UNION ALL
+SELECT b.bakta_accession, b.entity_id, 'UniRef', x.UniRef, b.created_at
+FROM uniref x JOIN bakta b ON b.bakta_accession = x.bakta_accession
+UNION ALL
+SELECT b.bakta_accession, b.entity_id, 'SO', x.SO, b.created_at
+FROM so x JOIN bakta b ON b.bakta_accession = x.bakta_accession
+UNION ALL
+SELECT b.bakta_accession, b.entity_id, 'PFAM', x.PFAM, b.created_at
+FROM pfam x JOIN bakta b ON b.bakta_accession = x.bakta_accession;
+
+COMMIT;
@@ -0,0 +1,147 @@
+import re
+import pandas as pd
+from sql_connection import TRN
+from redgenes_settings import redgenes_config
+from utils import parse_gff3, process_gff_info
+from profiling import PROFILER
+
+
+# Optional manifest columns with the outputs of each tool
+TOOL_PATH_COLUMNS = {"prodigal": "prodigal_path", "kofam_scan": "kofam_path", "barrnap": "barrnap_path"}
+CDS_COLUMNS = [
+    "contig_id", "gene_id", "gene_type", "start", "end", "conf", "score", "source", "strand", "phase",
+    "partial", "start_type", "stop_type", "rbs_motif", "rbs_spacer", "gc_cont",
+    "cscore", "sscore", "rscore", "uscore", "tscore", "mscore", "start_fuzzy", "end_fuzzy",
+]
+KO_COLUMNS = ["gene_name", "ko", "threshold", "score", "e_value", "ko_definition"]
+RRNA_COLUMNS = [
+    "contig_id", "gene_type", "rrna_name", "start", "end", "strand", "source", "score",
+    "start_fuzzy", "end_fuzzy", "product", "note",
+]
+TOOL_TABLES = {"prodigal": ("cds_info", CDS_COLUMNS), "kofam_scan": ("ko_info", KO_COLUMNS), "barrnap": ("rrna_info", RRNA_COLUMNS)}
+# GFF3 strands as stored in the integer strand columns
+STRANDS = {"+": 1, "-": -1}
+# {(dbpath, software, version, commands): run_id} of the run_info rows seen
+RUN_IDS = {}
+
+
+def fetch_run_id(software, version, commands, notes=None):
+    """Return the run_id of a run_info entry, inserting it the first time.
+    Ids are cached, so the provenance of a run is written and looked up once
+    rather than for every genome or row."""
+    key = (redgenes_config.dbpath, software, version, commands)
+    if key not in RUN_IDS:
+        with TRN:
+            sql = """
+                INSERT OR IGNORE INTO run_info (software, version, commands, notes)
+                VALUES (?, ?, ?, ?)"""
+            TRN.add(sql, [software, version, commands, notes])
+            sql = "SELECT run_id FROM run_info WHERE software = ? AND version = ? AND commands = ?"
+            TRN.add(sql, [software, version, commands])
+            RUN_IDS[key] = TRN.execute_fetchflatten()[0]
+            TRN.add_post_rollback_func(RUN_IDS.pop, key, None)
+    return RUN_IDS[key]
+
+
+def _gff_features(gff_df, columns, dtype_map):
+    """GFF3 features in the column order of a table: 1-based start as in the
+    file, integer strands, missing attributes as None."""
+    gff_df = gff_df.copy()
+    gff_df["start"] = (gff_df["start"].astype(int) + 1).astype(str)
+    gff_df["strand"] = gff_df["strand"].map(STRANDS).fillna(0).astype(str)
+    gff_df = gff_df.reindex(columns=list(dict.fromkeys(columns + list(gff_df.columns))))
+    return process_gff_info(gff_df, columns, dtype_map)[columns]
+
+
+def parse_prodigal_gff(gff_path):
+    """Parse the GFF3 output of prodigal -f gff into cds_info columns.
+
+    Returns (features, run), run being the (software, version, commands) of
+    run_info. The commands are the settings in Prodigal's Model Data comment
+    that are the same for every genome of a run.
+    """
+    with open(gff_path) as f:
+        header = "".join(line for line in f if line.startswith("#"))
+    model = dict(re.findall(r"(\w+)=([^;\n]*)", header.split("# Model Data:", 1)[-1].split("\n", 1)[0]))
+    version = model.get("version", "unknown").removeprefix("Prodigal.v")
+    commands = ";".join(f"{setting}={model[setting]}" for setting in ["run_type", "transl_table"] if setting in model)
+
+    gff_df = parse_gff3(gff_path).rename(columns={"ID": "gene_id", "type": "gene_type"})
+    gff_df["phase"] = gff_df["phase"].fillna("0")
+    dtype_map = {
+        "start": int, "end": int, "conf": float, "score": float, "strand": int, "phase": int,
+        "gc_cont": float, "cscore": float, "sscore": float, "rscore": float, "uscore": float,
+        "tscore": float, "mscore": float,
+    }
+    return _gff_features(gff_df, CDS_COLUMNS, dtype_map), ("prodigal", version, commands)
+
+
+def parse_barrnap_gff(gff_path):
+    """Parse the GFF3 output of barrnap into rrna_info columns.
+
+    Returns (features, run), the version taken from the source column.
+    """
+    gff_df = parse_gff3(gff_path).rename(columns={"type": "gene_type", "Name": "rrna_name"})
+    sources = gff_df["source"].unique() if len(gff_df) else []
+    version = sources[0].split(":", 1)[-1] if len(sources) else "unknown"
+    dtype_map = {"start": int, "end": int, "strand": int, "score": float}
+    return _gff_features(gff_df, RRNA_COLUMNS, dtype_map), ("barrnap", version, "")
+
+
+def parse_kofam_results(kofam_path):
+    """Parse the hits kofam_scan marks as significant ('*') from its detail
+    or detail-tsv output into ko_info columns.
+
+    Returns (hits, run). kofam_scan does not write its version.
+    """
+    with open(kofam_path) as f:
+        lines = pd.Series(f.read().splitlines(), dtype=str)
+    lines = lines[lines.str.startswith("*")]
+    # both formats split on whitespace, the definition is the rest of the line
+    hits = lines.str[1:].str.strip().str.split(r"\s+", n=5, regex=True, expand=True)
+    hits = hits.reindex(columns=range(len(KO_COLUMNS)))
+    hits.columns = KO_COLUMNS
+    hits["ko_definition"] = hits["ko_definition"].str.strip('"')
+    hits = hits.astype({"threshold": float, "score": float, "e_value": float})
+    return hits.reset_index(drop=True), ("kofam_scan", "unknown", "")
+
+
+TOOL_PARSERS = {"prodigal": parse_prodigal_gff, "kofam_scan": parse_kofam_results, "barrnap": parse_barrnap_gff}
+
+
+def parse_tool_outputs(row):
+    """Parse the outputs of the tools whose optional manifest column is set
+    for row. Returns {tool: (rows, run)}."""
+    parsed = {}
+    for tool, column in TOOL_PATH_COLUMNS.items():
+        path = row.get(column)
+        if isinstance(path, str) and path.strip():
+            parsed[tool] = TOOL_PARSERS[tool](path.strip())
+    return parsed
+
+
+def insert_tool_results(tool, entity_id, rows_df, run_id):
+    """Bulk insert the parsed rows of one tool for one genome, ignoring rows
+    already loaded. Returns the number of rows inserted."""
+    table, columns = TOOL_TABLES[tool]
+    sql = f"""
+        INSERT OR IGNORE INTO {table} (entity_id, {", ".join(columns)}, run_id)
+        VALUES ({", ".join(["?"] * (len(columns) + 2))})"""
+    values = rows_df[columns].astype(object).where(rows_df[columns].notna(), None)
+    with TRN:
+        TRN.add_bulk(sql, ([entity_id, *row, run_id] for row in values.itertuples(index=False, name=None)))
+        return TRN.execute()[-1][0][0]
+
+
+def load_tool_annotations(row, entity_id, tool_results, logger):
+    """Insert the parsed Prodigal, kofam_scan and barrnap results of one
+    genome. Returns whether they were loaded, not when the genome has no
+    identifier entry."""
+    if entity_id is None:
+        logger.error(f"Skipping tool outputs of {row['assembly_accession']}: no identifier entry")
+        return False
+    for tool, (rows_df, run) in tool_results.items():
+        with PROFILER.stage(tool, row["assembly_accession"].strip()):
+            inserted = insert_tool_results(tool, int(entity_id), rows_df, fetch_run_id(*run))
+        logger.info(f"{tool}: {inserted} rows inserted")
+    return True
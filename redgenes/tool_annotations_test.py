@@ -0,0 +1,85 @@
+import logging
+import pytest
+import pandas as pd
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from sql_initialize_db import initialize_db
+from metadata import insert_metadata, IDENTIFIER_CACHE
+from tool_annotations import (
+    parse_prodigal_gff, parse_barrnap_gff, parse_kofam_results, parse_tool_outputs, load_tool_annotations, RUN_IDS,
+)
+
+PRODIGAL = """##gff-version  3
+# Sequence Data: seqnum=1;seqlen=5000;seqhdr="contig_1 length=5000"
+# Model Data: version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";gc_cont=50.00;transl_table=11;uses_sd=1
+contig_1\tProdigal_v2.6.3\tCDS\t2\t424\t52.9\t-\t0\tID=1_1;partial=10;start_type=Edge;rbs_motif=None;rbs_spacer=None;gc_cont=0.491;conf=100.00;score=52.88;cscore=51.47;sscore=1.41;rscore=0.00;uscore=0.00;tscore=1.41;
+contig_1\tProdigal_v2.6.3\tCDS\t601\t1500\t80.1\t+\t0\tID=1_2;partial=00;start_type=ATG;rbs_motif=AGGAG;rbs_spacer=5-10bp;gc_cont=0.512;conf=99.99;score=80.10;cscore=70.00;sscore=10.10;rscore=8.00;uscore=0.10;tscore=2.00;
+"""
+KOFAM = """#\tgene name\tKO\tthrshld\tscore\tE-value\t"KO definition"
+#\t---------\t--\t-------\t-----\t-------\t-------------
+*\t1_1\tK02358\t234.13\t456.7\t1.2e-137\t"elongation factor Tu"
+\t1_1\tK02357\t300.00\t20.1\t0.002\t"elongation factor Ts"
+*\t1_2\tK03043\t1500.50\t2100.0\t0\t"DNA-directed RNA polymerase subunit beta [EC:2.7.7.6]"
+"""
+BARRNAP = """##gff-version 3
+contig_1\tbarrnap:0.9\trRNA\t2001\t3500\t0\t+\t.\tName=16S_rRNA;product=16S ribosomal RNA
+contig_1\tbarrnap:0.9\trRNA\t4001\t4100\t7.3e-10\t-\t.\tName=5S_rRNA;product=5S ribosomal RNA;note=aligned only 40 percent of the 5S ribosomal RNA
+"""
+
+
+@pytest.fixture
+def row(tmp_path):
+    paths = {}
+    for column, text in [("prodigal_path", PRODIGAL), ("kofam_path", KOFAM), ("barrnap_path", BARRNAP)]:
+        paths[column] = tmp_path / column
+        paths[column].write_text(text)
+    return pd.Series({"local_path": "/genomes/g1.fa", "assembly_accession": "GCA_1", "source": "NCBI",
+                      **{column: str(path) for column, path in paths.items()}})
+
+
+def test_parse_prodigal_gff(row):
+    features, run = parse_prodigal_gff(row["prodigal_path"])
+    assert run == ("prodigal", "2.6.3", "run_type=Single;transl_table=11")
+    assert features[["gene_id", "start", "end", "strand", "score"]].values.tolist() == [
+        ["1_1", 2, 424, -1, 52.88], ["1_2", 601, 1500, 1, 80.1]]
+    assert pd.isna(features["stop_type"]).all()
+
+
+def test_parse_kofam_results(row):
+    hits, run = parse_kofam_results(row["kofam_path"])
+    assert run == ("kofam_scan", "unknown", "")
+    assert hits["ko"].tolist() == ["K02358", "K03043"]
+    assert hits["ko_definition"][1] == "DNA-directed RNA polymerase subunit beta [EC:2.7.7.6]"
+    assert hits["e_value"].tolist() == [1.2e-137, 0.0]
+
+
+def test_parse_barrnap_gff(row):
+    features, run = parse_barrnap_gff(row["barrnap_path"])
+    assert run == ("barrnap", "0.9", "")
+    assert features[["rrna_name", "start", "strand"]].values.tolist() == [["16S_rRNA", 2001, 1], ["5S_rRNA", 4001, -1]]
+    assert pd.isna(features["note"][0])
+
+
+def test_load_tool_annotations(tmp_path, monkeypatch, row):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "tools.db"))
+    IDENTIFIER_CACHE.clear()
+    initialize_db()
+    logger = logging.getLogger("test")
+    try:
+        parsed = parse_tool_outputs(row)
+        with TRN:
+            entity_id = insert_metadata(row)[0]
+            load_tool_annotations(row, entity_id, parsed, logger)
+            # loading again inserts nothing and reuses the run_info entries
+            load_tool_annotations(row, entity_id, parsed, logger)
+            counts = []
+            for table in ["cds_info", "ko_info", "rrna_info", "run_info"]:
+                TRN.add(f"SELECT count(*) FROM {table}")
+                counts.append(TRN.execute_fetchflatten()[0])
+        assert counts == [2, 2, 2, 3]
+        assert not load_tool_annotations(row, None, parsed, logger)
+        assert parse_tool_outputs(row.drop(["kofam_path", "barrnap_path"])).keys() == {"prodigal"}
+    finally:
+        RUN_IDS.clear()
+        IDENTIFIER_CACHE.clear()
+        TRN.close()
@@ -1,10 +1,18 @@
+import io
+import os
+import re
+import csv
+import glob
 import gzip
 import shutil
+import logging
+import tempfile
 import subprocess
 import pandas as pd
 from pathlib import Path
-from skbio.io import read
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from redgenes_settings import redgenes_config
 
 
 ################################
@@ -52,6 +60,25 @@ MD_HEADER = [
     "source",
     "local_path",
 ]
+# Types of the MD_HEADER columns that are not text
+MD_DTYPES = {
+    "taxid": "Int64",
+    "species_taxid": "Int64",
+    "genome_size": "Int64",
+    "genome_size_ungapped": "Int64",
+    "gc_percent": "float",
+    "replicon_count": "Int64",
+    "scaffold_count": "Int64",
+    "contig_count": "Int64",
+    "annotation_date": "datetime",
+    "total_gene_count": "Int64",
+    "protein_coding_gene_count": "Int64",
+    "non_coding_gene_count": "Int64",
+}
+
+GFF3_COLUMNS = ["contig_id", "source", "type", "start", "end", "score", "strand", "phase", "attributes"]
+# Attribute names renamed the same way as skbio's GFF3 reader
+GFF3_ATTRIBUTE_NAMES = {"Dbxref": "db_xref", "Note": "note"}
 
 
 ################################
@@ -59,6 +86,8 @@ MD_HEADER = [
 ################################
 def read_gff_file(gff_path: str):
     """Read GFF3 file into a generator."""
+    from skbio.io import read
+
     gen = read(gff_path, format="gff3")
     return gen
 
@@ -91,6 +120,65 @@ def extract_gff_info(gen):
     return attributes_df
 
 
+def parse_gff3(gff_path: str):
+    """Parse the features of a GFF3 file into a pandas DataFrame.
+
+    Same output as extract_gff_info(read_gff_file(gff_path)) without going
+    through skbio: the nine columns are read by pandas in one pass and the
+    attribute strings are split with vectorized string operations. start is
+    0-based like skbio's bounds. Values are strings.
+    """
+    with open(gff_path) as f:
+        text = f.read()
+    # Sequences appended after ##FASTA are not features
+    fasta_start = text.find("\n##FASTA")
+    if fasta_start != -1:
+        text = text[: fasta_start + 1]
+    text = re.sub(r"(?m)^#.*\n?", "", text)
+    if not text.strip():
+        return pd.DataFrame(columns=GFF3_COLUMNS[:-1] + ["note", "start_fuzzy", "end_fuzzy"])
+
+    gff_df = pd.read_csv(
+        io.StringIO(text),
+        sep="\t",
+        header=None,
+        names=GFF3_COLUMNS,
+        dtype=str,
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+    )
+    try:
+        gff_df["start"] = (gff_df["start"].astype(int) - 1).astype(str)
+        gff_df["end"] = gff_df["end"].astype(int).astype(str)
+    except Exception as e:
+        raise ValueError(f"Invalid start and end values from GFF3 file.")
+    gff_df["phase"] = gff_df["phase"].where(gff_df["phase"] != ".")
+
+    # One (feature, key, value) row per attribute, then back to one column per key
+    attributes = gff_df.pop("attributes").str.rstrip(";").str.split(";").explode()
+    attributes = attributes[attributes.str.contains("=", regex=False, na=False)]
+    key_value = attributes.str.split("=", n=1, expand=True)
+    if key_value.empty:
+        key_value = pd.DataFrame(columns=[0, 1])
+    long_df = pd.DataFrame(
+        {"key": key_value[0].replace(GFF3_ATTRIBUTE_NAMES), "value": key_value[1]}
+    )
+    long_df = long_df.rename_axis("feature").reset_index()
+    long_df = long_df.drop_duplicates(["feature", "key"], keep="last")
+    attributes_df = long_df.pivot(index="feature", columns="key", values="value")
+    attributes_df = attributes_df[long_df["key"].unique()]
+    attributes_df.columns.name = None
+
+    # an attribute named like a column, e.g. Prodigal's score, replaces the
+    # column as skbio's metadata update does
+    gff_df = gff_df.drop(columns=gff_df.columns.intersection(attributes_df.columns)).join(attributes_df)
+    if "note" not in gff_df:
+        gff_df["note"] = None
+    gff_df["start_fuzzy"] = "False"
+    gff_df["end_fuzzy"] = "False"
+    return gff_df
+
+
 def process_gff_info(attributes_df, cols_to_front, dtype_map):
     """Format and process the DataFrame containing GFF3 information."""
     for col in cols_to_front:
@@ -131,65 +219,157 @@ def run_command_and_check_outputs(commands, error, files=None, shell_bool=False)
         if res:
             error_message += f"\n Additional error details: {res.stderr}"
         raise error(error_message)
+    except subprocess.CalledProcessError as e:
+        raise error(f"There is an error {e}: \n{e.stderr}")
     except Exception as e:
         error_message = f"There is an error {e}"
         if res:
-            eror_message += f": \n{res.stderr}"
+            error_message += f": \n{res.stderr}"
         raise error(error_message)
 
     # Check if outputs exist
     if files:
         for file in files:
-            if not Path(file).exists:
+            if not Path(file).exists():
                 raise error(f"Output file {file} not generated.")
 
     return res, " ".join(list(map(str, commands)))
 
 
 ################################
-# Zip and unzip fasta files
+# Logging and clean up
 ################################
-@contextmanager
-def copy_and_unzip(zip_path, tmp_dir):
-    """Given a zipped fna file and a temp directory, creates a subdirectory and
-    unzip the fna file in the subdirectory. Remove the subdirectory when done."""
+def create_logfile(logger, log_path):
+    """Attach a file handler writing to log_path and return the logger."""
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
 
-    if "*" in zip_path:
-        source_paths = list(Path(zip_path).parent.glob("*.fna.gz"))
-        if not source_paths:
-            raise FileNotFoundError(f"No matching files found for pattern: {zip_path}")
-        else:
-            source_path = source_paths[0]
-
-    else:
-        source_path = Path(zip_path)
-        if not source_path.exists():
-            raise FileNotFoundError(
-                f"Error in context manager: the zipfile {zip_path} does not exist."
-            )
 
-    source_filename = source_path.name  # genome1.fna.gz
-    source_filename_unzipped = Path(source_filename).stem  # genome1.fna
-    source_stem = Path(source_filename_unzipped).stem  # genome1
+def _unlink_directory(dir_path):
+    """Remove dir_path and everything in it, ignoring missing files."""
+    shutil.rmtree(dir_path, ignore_errors=True)
 
-    target_path = Path(tmp_dir) / source_stem
-    target_path.mkdir(parents=True)
 
-    target_file = target_path / source_filename_unzipped
+################################
+# Stage fasta files
+################################
+# Read and write size when decompressing in Python
+STAGE_BUFFER_SIZE = 16 * 2**20
+# Extensions taken off file names to name genomes, compression first
+COMPRESSION_SUFFIXES = [".gz", ".bz2", ".xz", ".zip"]
+FASTA_SUFFIXES = [".fa", ".fna", ".fasta", ".fas", ".fsa"]
+
+
+def genome_name(path):
+    """Name of a genome from its FASTA path or bin id, without directories,
+    compression and FASTA extensions: dir/GCA_1.1_ASM.fna.gz is GCA_1.1_ASM."""
+    name = Path(str(path).strip()).name
+    for suffixes in [COMPRESSION_SUFFIXES, FASTA_SUFFIXES]:
+        for suffix in suffixes:
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+    return name
+
+
+def _source_paths(source):
+    """Files matching source, a path, a glob pattern or a list of them, sorted."""
+    if isinstance(source, (list, tuple)):
+        return [path for item in source for path in _source_paths(item)]
+    if any(char in str(source) for char in "*?["):
+        paths = sorted(Path(path) for path in glob.glob(str(source)))
+        if not paths:
+            raise FileNotFoundError(f"No matching files found for pattern: {source}")
+        return paths
+    path = Path(source)
+    if not path.exists():
+        raise FileNotFoundError(f"The file {source} does not exist.")
+    return [path]
+
+
+def _stage_file(source_path, target_dir, threads=1):
+    """Put an uncompressed copy of source_path in target_dir and return its
+    path. Compressed files are decompressed in binary mode, with pigz when it
+    is installed; uncompressed files are hardlinked, or symlinked when
+    target_dir is on another file system."""
+    if source_path.suffix == ".gz":
+        target_path = target_dir / source_path.stem
+        pigz = shutil.which("pigz")
+        with open(target_path, "wb") as target_file:
+            if pigz:
+                subprocess.run([pigz, "-dc", "-p", str(threads), str(source_path)], stdout=target_file, check=True)
+            else:
+                with gzip.open(source_path, "rb") as source_file:
+                    shutil.copyfileobj(source_file, target_file, STAGE_BUFFER_SIZE)
+    else:
+        target_path = target_dir / source_path.name
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            os.symlink(source_path.resolve(), target_path)
+    return target_path
 
-    open_func = gzip.open if str(source_path).endswith(".gz") else open
 
+@contextmanager
+def stage_genomes(source, tmp_dir=None, threads=None):
+    """Stage every fasta file matching source (a path, a glob pattern or a
+    list of them) for tools that need uncompressed files, and remove the
+    staged files afterwards.
+
+    Each file goes to its own subdirectory of tmp_dir, named after the file
+    without its extensions and numbered when several files share a name. Without tmp_dir a temporary directory is made in
+    redgenes_config.scratch_dir. Files are staged by up to threads workers.
+    Yields the staged paths in the order of the sources.
+    """
+    source_paths = _source_paths(source)
+    threads = threads or min(4, os.cpu_count())
+    own_tmp_dir = tmp_dir is None
+    tmp_dir = Path(tempfile.mkdtemp(dir=redgenes_config.scratch_dir) if own_tmp_dir else tmp_dir)
+
+    target_dirs = []
     try:
-        # Unzip a fasta file into tmpdir/genomename
-        with open_func(source_path, "rt") as compressed_file, open(
-            target_file, "w"
-        ) as decompressed_file:
-            shutil.copyfileobj(compressed_file, decompressed_file)
+        for source_path in source_paths:
+            # genome1.fna.gz and genome1.fna go to tmp_dir/genome1, and files
+            # with the same name, e.g. a/assembly.fna.gz and b/assembly.fna.gz,
+            # to tmp_dir/assembly, tmp_dir/assembly_2 and so on
+            name = genome_name(source_path)
+            target_dir, copy = tmp_dir / name, 1
+            while target_dir in target_dirs or target_dir.exists():
+                copy += 1
+                target_dir = tmp_dir / f"{name}_{copy}"
+            target_dir.mkdir(parents=True)
+            target_dirs.append(target_dir)
+        # threads are shared between the files staged at once
+        pigz_threads = [max(1, threads // len(source_paths))] * len(source_paths)
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            staged = list(executor.map(_stage_file, source_paths, target_dirs, pigz_threads))
+        yield staged
+    finally:
+        for target_dir in target_dirs:
+            shutil.rmtree(target_dir, ignore_errors=True)
+        if own_tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        yield target_file
 
-    finally:
-        shutil.rmtree(target_path)
+@contextmanager
+def copy_and_unzip(zip_path, tmp_dir):
+    """Given a zipped fna file and a temp directory, creates a subdirectory and
+    unzip the fna file in the subdirectory. Remove the subdirectory when done.
+
+    Kept for single genomes on top of stage_genomes. A pattern matching
+    several files stages the first one, use stage_genomes for all of them."""
+    source_paths = _source_paths(zip_path)
+    if len(source_paths) > 1:
+        logging.getLogger("redgenes").warning(
+            f"{zip_path} matches {len(source_paths)} files, staging only {source_paths[0]}"
+        )
+    with stage_genomes(source_paths[0], tmp_dir, threads=1) as staged:
+        yield staged[0]
 
 
 # if __name__ == "__main__":
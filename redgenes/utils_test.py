@@ -0,0 +1,99 @@
+import gzip
+import pytest
+import pandas as pd
+from pathlib import Path
+from utils import parse_gff3, process_gff_info, read_gff_file, extract_gff_info, stage_genomes, copy_and_unzip, genome_name
+
+GFF3 = """##gff-version 3
+##sequence-region contig_1 1 5000
+contig_1\tBakta\tregion\t1\t5000\t.\t+\t.\tID=contig_1;Name=contig_1
+contig_1\tProdigal\tCDS\t100\t900\t.\t+\t0\tID=LT_00010;product=hypothetical protein;Dbxref=SO:0001217,UniRef:UniRef50_A
+contig_1\ttRNAscan-SE\ttRNA\t1000\t1080\t45.2\t-\t.\tID=LT_00015;gene=trnL;product=tRNA-Leu;Note=anticodon
+##FASTA
+>contig_1
+ACGT
+"""
+
+
+@pytest.fixture
+def gff_path(tmp_path):
+    path = tmp_path / "test.gff3"
+    path.write_text(GFF3)
+    return str(path)
+
+
+def test_parse_gff3(gff_path):
+    gff_df = parse_gff3(gff_path)
+    assert gff_df["ID"].tolist() == ["contig_1", "LT_00010", "LT_00015"]
+    assert gff_df["start"].tolist() == ["0", "99", "999"]
+    assert gff_df["db_xref"][1] == "SO:0001217,UniRef:UniRef50_A"
+    assert gff_df["note"][2] == "anticodon"
+    assert pd.isna(gff_df["phase"][0])
+
+
+def test_parse_gff3_matches_skbio(gff_path):
+    pytest.importorskip("skbio")
+    cols = ["contig_id", "ID", "type", "start", "end", "strand", "product", "db_xref", "note"]
+    dtype_map = {"start": int, "end": int}
+    expected = process_gff_info(extract_gff_info(read_gff_file(gff_path)), cols, dtype_map)
+    result = process_gff_info(parse_gff3(gff_path), cols, dtype_map)
+    pd.testing.assert_frame_equal(
+        result[cols].fillna("").astype(str), expected[cols].fillna("").astype(str)
+    )
+
+
+def test_parse_gff3_no_features(tmp_path):
+    path = tmp_path / "empty.gff3"
+    path.write_text("##gff-version 3\n")
+    assert parse_gff3(str(path)).empty
+
+
+@pytest.fixture
+def fasta_files(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name in ["GCA_1.1_ASM", "GCA_2.1_ASM"]:
+        with gzip.open(source_dir / f"{name}.fna.gz", "wb") as f:
+            f.write(f">{name}\nACGT\n".encode())
+    (source_dir / "plain.fa").write_text(">plain\nACGT\n")
+    return source_dir
+
+
+def test_stage_genomes_all_matches(tmp_path, fasta_files):
+    with stage_genomes(str(fasta_files / "*.fna.gz"), tmp_path / "stage") as staged:
+        assert [path.relative_to(tmp_path / "stage") for path in staged] == [
+            Path("GCA_1.1_ASM/GCA_1.1_ASM.fna"), Path("GCA_2.1_ASM/GCA_2.1_ASM.fna")]
+        assert staged[1].read_text() == ">GCA_2.1_ASM\nACGT\n"
+    assert not any((tmp_path / "stage").iterdir())
+
+
+def test_stage_genomes_same_names(tmp_path):
+    for directory in ["a", "b"]:
+        (tmp_path / directory).mkdir()
+        with gzip.open(tmp_path / directory / "assembly.fna.gz", "wb") as f:
+            f.write(f">{directory}\nACGT\n".encode())
+    with stage_genomes(str(tmp_path / "*" / "assembly.fna.gz"), tmp_path / "stage") as staged:
+        assert [path.relative_to(tmp_path / "stage") for path in staged] == [
+            Path("assembly/assembly.fna"), Path("assembly_2/assembly.fna")]
+        assert [path.read_text() for path in staged] == [">a\nACGT\n", ">b\nACGT\n"]
+
+
+def test_stage_genomes_links_uncompressed(fasta_files):
+    source = fasta_files / "plain.fa"
+    with stage_genomes(source) as staged:
+        assert staged[0].stat().st_ino == source.stat().st_ino
+        tmp_dir = staged[0].parent.parent
+    assert not tmp_dir.exists() and source.exists()
+
+
+def test_copy_and_unzip(tmp_path, fasta_files):
+    with copy_and_unzip(str(fasta_files / "GCA_1.1_ASM.fna.gz"), tmp_path) as path:
+        assert path == tmp_path / "GCA_1.1_ASM" / "GCA_1.1_ASM.fna"
+        assert path.read_text().startswith(">GCA_1.1_ASM")
+    assert not path.parent.exists()
+
+
+def test_genome_name():
+    assert genome_name("/genomes/GCA_000001.1_ASM.fna.gz") == "GCA_000001.1_ASM"
+    assert genome_name(" bins/bin.3.fa ") == "bin.3"
+    assert genome_name("bin.3") == "bin.3"
@@ -4,41 +4,262 @@ import atexit
 import logging
 import tempfile
 from pathlib import Path
-from sql_initialize_db import initialize_db
-from utils import _unlink_directory, create_logfile
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from sql_initialize_db import initialize_db, defer_indexes, rebuild_indexes
+from utils import _unlink_directory, create_logfile, genome_name
 from sql_connection import TRN
-from metadata import extract_md_info
-from quality_control import qc_bash_and_db_insertion
-from bakta_annotations import annotation_pipeline
+from redgenes_settings import redgenes_config, DB_PROFILES
+from profiling import PROFILER
+from metadata import extract_md_info, check_md_info, identifier_key, IDENTIFIER_CACHE
+from load_ledger import read_ledger, record_stage, stage_reached, drop_completed
+from quality_control import qc_bash_and_db_insertion, extract_checkm_results
+from bakta_annotations import annotation_pipeline, fetch_entity_id
+from execution import run_pipeline
+from similarity import similar_genes, load_embeddings, build_ivf_index
+from tool_annotations import parse_tool_outputs, load_tool_annotations
+from export import export_datasets, EXPORT_DATASETS, PARTITION_KEYS
 
 
 timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
 my_logger = logging.getLogger("redgenes")
 
+
+def parse_genome(row):
+    """Parse the CheckM and tool outputs of one genome without touching the
+    database, so it can run in a worker process. The Bakta tsv is not parsed
+    here: the writer streams it in chunks, so memory does not grow with its
+    size and no frame is passed between processes.
+
+    Returns (row, checkm_res, tool_results, error, profile), tool_results
+    being the parsed outputs of the optional Prodigal, kofam_scan and barrnap
+    manifest columns and profile the profiler record of the parse stage, or
+    None when not profiling.
+    """
+    with PROFILER.stage("parse", row["assembly_accession"].strip(), add=False) as profile:
+        try:
+            # a CheckM file of several genomes is matched on the FASTA name
+            checkm_res = extract_checkm_results(row["checkm_path"].strip(), genome_name(row["local_path"]))
+            tool_results = parse_tool_outputs(row)
+        except Exception as e:
+            error = f"Error at parsing {row['assembly_accession']}: {e}"
+            return row, None, None, error, profile
+    return row, checkm_res, tool_results, None, profile
+
+
+def iter_parsed_genomes(md_df, jobs=1):
+    """Yield parse_genome results in manifest order.
+
+    With jobs > 1 the parsing runs in a process pool. At most 2 * jobs genomes
+    are in flight so memory stays bounded when the writer falls behind.
+    """
+    rows = (row for _, row in md_df.iterrows())
+    if jobs <= 1:
+        yield from map(parse_genome, rows)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for row in rows:
+            pending.append(executor.submit(parse_genome, row))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def insert_parsed_genomes(parsed, working_dir, logger, batch_size=100, ledger=None):
+    """Write parsed genomes from a single process, batch_size genomes per
+    transaction. Each genome runs in its own savepoint and resumes after the
+    last stage recorded for it in ledger."""
+    ledger = ledger or {}
+    while True:
+        batch = list(islice(parsed, batch_size))
+        if not batch:
+            break
+        with TRN:
+            for row, checkm_res, tool_results, error, profile in batch:
+                if profile:
+                    PROFILER.add(profile)
+                if error:
+                    logger.error(error)
+                    continue
+                entity_id, stage = ledger.get(identifier_key(row), (None, None))
+                try:
+                    with TRN:
+                        if not stage_reached(stage, "qc"):
+                            qc_bash_and_db_insertion(row, working_dir, logger, checkm_res, entity_id)
+                        if not stage_reached(stage, "dbxref"):
+                            annotation_pipeline(row, working_dir, logger, stage=stage)
+                        # in the savepoint of the genome, so they are loaded
+                        # with their ledger stage or not at all
+                        if tool_results:
+                            entity_id = fetch_entity_id(row)
+                            if load_tool_annotations(row, entity_id, tool_results, logger):
+                                record_stage(row, entity_id, "tools")
+                except Exception as e:
+                    logger.error(f"Error at database insertion of {row['assembly_accession']}: {e}")
+
+
 @click.group()
 def redgenes():
     pass
 
 
-@redgenes.command()
+@redgenes.command("db_insertion")
 @click.option("--metadata", type=click.Path(exists=True), required=True)
 @click.option("--working-dir", type=click.Path(exists=True), required=False)
+@click.option("--jobs", type=int, default=1, show_default=True, help="Processes parsing CheckM and Bakta outputs.")
+@click.option("--batch-size", type=int, default=100, show_default=True, help="Genomes written per transaction.")
+@click.option("--db-profile", type=click.Choice(list(DB_PROFILES)), required=False, help="SQLite connection profile, e.g. bulk_load.")
+@click.option("--bulk-load", is_flag=True, help="Drop secondary indexes during the load, rebuild them and ANALYZE at the end.")
+@click.option("--kmer-vectors", type=click.Path(exists=True, dir_okay=False), required=False, help="kmer2vec file to embed genes with [default: $REDGENES_KMER_VECTORS].")
 
 # metadata should contain the columns - local_path, assembly_accession, bakta_path, checkm_path
+# and may contain prodigal_path, kofam_path and barrnap_path
 
-def db_insertion(metadata, working_dir):
+def db_insertion(metadata, working_dir, jobs, batch_size, db_profile, bulk_load, kmer_vectors):
     logger = create_logfile(my_logger, f"./redgenes_insertion_{timestamp}.log")
+    if kmer_vectors:
+        redgenes_config.kmer_vectors = kmer_vectors
+    # Per genome and stage timings, one JSON object per line
+    PROFILER.start(f"./redgenes_insertion_{timestamp}.profile.jsonl")
+    if db_profile or bulk_load:
+        redgenes_config.use_profile(db_profile or "bulk_load")
 
     if not working_dir:
-        working_dir = tempfile.TemporaryDirectory()
-        atexit.register(_unlink_directory(working_dir))
+        working_dir = tempfile.mkdtemp(dir=redgenes_config.scratch_dir)
+        atexit.register(_unlink_directory, working_dir)
+
+    try:
+        run_db_insertion(metadata, working_dir, logger, jobs, batch_size, bulk_load,
+                         f"./redgenes_insertion_{timestamp}.manifest_report.tsv")
+    finally:
+        PROFILER.stop()
 
-    initialize_db()
 
+def run_db_insertion(metadata, working_dir, logger, jobs=1, batch_size=100, bulk_load=False, report_path=None):
+    """Load the genomes listed in the metadata file into the database. The
+    manifest rows of genomes not loaded yet are validated before any of them
+    is, and rows that cannot be loaded are skipped and listed in
+    report_path."""
+    # a manifest without the required columns fails before the database is touched
     md_df = extract_md_info(metadata)
-    for _, row in md_df.iterrows():
-        qc_bash_and_db_insertion(row, working_dir, logger)
-        annotation_pipeline(row, working_dir, logger)
+    initialize_db()
+    if bulk_load:
+        logger.info(f"Deferred indexes: {defer_indexes()}")
+    else:
+        # Indexes left dropped by an interrupted bulk load
+        rebuilt = rebuild_indexes()
+        if rebuilt:
+            logger.info(f"Rebuilt deferred indexes: {rebuilt}")
+
+    ledger = read_ledger()
+    IDENTIFIER_CACHE.warm()
+    num_genomes = len(md_df)
+    md_df = drop_completed(md_df, ledger)
+    logger.info(f"Skipping {num_genomes - len(md_df)} genomes already loaded")
+    # genomes already loaded are not checked, their files may have moved since
+    md_df, report = check_md_info(md_df, report_path)
+    if len(report):
+        logger.error(f"Skipping {report['line'].nunique()} invalid manifest rows"
+                     + (f", listed in {report_path}" if report_path else ""))
+
+    parsed = iter_parsed_genomes(md_df, jobs)
+    insert_parsed_genomes(parsed, working_dir, logger, batch_size, ledger)
+
+    if bulk_load:
+        with PROFILER.stage("indexes"):
+            logger.info(f"Rebuilt indexes: {rebuild_indexes()}")
+
+    for stage, totals in PROFILER.totals.items():
+        logger.info(
+            f"Stage {stage}: {totals['genomes']} genomes in {totals['seconds']:.1f}s "
+            f"({totals['sql_seconds']:.1f}s SQL), {totals['statements']} statements, "
+            f"{totals['rows_written']} rows written, {totals['bytes_read']} bytes read"
+        )
+
+
+@redgenes.command("annotate")
+@click.option("--input-dir", type=click.Path(exists=True, file_okay=False), required=True, help="Searched recursively for genomes.")
+@click.option("--output-dir", type=click.Path(file_okay=False), required=True)
+@click.option("--suffix", default="fa", show_default=True, help="Extension of the genome FASTA files.")
+@click.option("--cpus", type=int, required=False, help="Threads used by all CheckM and Bakta runs together [default: all cpus].")
+@click.option("--checkm-threads", type=int, default=1, show_default=True)
+@click.option("--checkm-batch-size", type=int, default=1, show_default=True, help="Genomes per CheckM run, which loads its reference data once per run.")
+@click.option("--bakta-threads", type=int, default=4, show_default=True)
+@click.option("--bakta-db", type=click.Path(exists=True), required=False)
+@click.option("--min-completeness", type=float, default=95, show_default=True)
+@click.option("--max-contamination", type=float, default=5, show_default=True)
+@click.option("--source", default="external", show_default=True, help="Source written to the manifest.")
+@click.option("--manifest", type=click.Path(dir_okay=False), required=False, help="[default: <output-dir>/<name>_metadata.tsv]")
+@click.option("--min-genome-size", type=int, required=False, help="Fail genomes with fewer bases before CheckM.")
+@click.option("--max-contigs", type=int, required=False, help="Fail genomes with more contigs before CheckM.")
+@click.option("--min-n50", type=int, required=False, help="Fail genomes with a lower contig N50 before CheckM.")
+@click.option("--max-n-percent", type=float, required=False, help="Fail genomes with a higher percentage of N before CheckM.")
+def annotate(input_dir, output_dir, suffix, cpus, checkm_threads, checkm_batch_size, bakta_threads, bakta_db, min_completeness, max_contamination, source, manifest,
+             min_genome_size, max_contigs, min_n50, max_n_percent):
+    """Run CheckM and, on genomes passing QC, Bakta. Writes the manifest db_insertion reads."""
+    logger = create_logfile(my_logger, f"./redgenes_annotation_{timestamp}.log")
+    fasta_paths = sorted(Path(input_dir).rglob(f"*.{suffix}"))
+    manifest, summary = run_pipeline(
+        fasta_paths,
+        output_dir,
+        logger,
+        cpus,
+        checkm_threads,
+        checkm_batch_size,
+        bakta_threads,
+        bakta_db,
+        min_completeness,
+        max_contamination,
+        source,
+        manifest,
+        dict(min_genome_size=min_genome_size, max_contigs=max_contigs, min_n50=min_n50, max_n_percent=max_n_percent),
+    )
+    click.echo(f"{summary['annotated']} genomes annotated, {summary['failed_qc']} failed QC, "
+               f"{summary['errors']} errors, {summary['skipped']} skipped. Manifest: {manifest}")
+
+
+@redgenes.command("similar")
+@click.option("--accession", "bakta_accessions", type=int, multiple=True, required=True, help="bakta_accession of a query gene, repeatable.")
+@click.option("--top-k", type=int, default=10, show_default=True)
+@click.option("--index", "index_path", type=click.Path(exists=True, file_okay=False), required=False, help="IVF index from build-similarity-index [default: exact search].")
+@click.option("--n-probe", type=int, default=8, show_default=True, help="Index lists searched per query.")
+def similar(bakta_accessions, top_k, index_path, n_probe):
+    """Print the genes whose embeddings are most similar to the query genes, as a tsv."""
+    hits = similar_genes(list(bakta_accessions), top_k, index_path, n_probe)
+    click.echo(hits.to_csv(sep="\t", index=False), nl=False)
+
+
+@redgenes.command("build-similarity-index")
+@click.option("--output", type=click.Path(file_okay=False), required=True, help="Index directory, replaced if it exists.")
+@click.option("--n-lists", type=int, required=False, help="k-means lists [default: 4 * sqrt(embeddings)].")
+def build_similarity_index(output, n_lists):
+    """Build the on-disk IVF index of all gene embeddings used by similar --index."""
+    accessions, matrix = load_embeddings()
+    if not len(accessions):
+        raise click.ClickException("The database holds no embeddings")
+    index = build_ivf_index(accessions, matrix, output, n_lists)
+    click.echo(f"Indexed {index.info['vectors']} embeddings in {index.info['lists']} lists: {output}")
+
+
+@redgenes.command("export")
+@click.option("--output", type=click.Path(file_okay=False), required=True, help="Directory with a parquet dataset per table.")
+@click.option("--dataset", "datasets", type=click.Choice(list(EXPORT_DATASETS)), multiple=True, help="Dataset to export, repeatable [default: all].")
+@click.option("--partition-by", type=click.Choice(list(PARTITION_KEYS)), default="entity_range", show_default=True)
+@click.option("--entity-range-size", type=int, default=1000, show_default=True, help="Genomes per entity_range partition.")
+@click.option("--incremental", is_flag=True, help="Only add the rows loaded since the last export to --output.")
+@click.option("--chunksize", type=int, required=False, help="Rows read and converted at a time [default: query_chunksize].")
+def export(output, datasets, partition_by, entity_range_size, incremental, chunksize):
+    """Export genomes, genes and annotations to partitioned parquet files."""
+    try:
+        written = export_datasets(output, datasets, partition_by, entity_range_size, incremental, chunksize)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for dataset, rows in written.items():
+        click.echo(f"{dataset}: {rows} rows")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import logging
+import pytest
+import bakta_annotations
+from redgenes_settings import redgenes_config
+from sql_connection import TRN
+from metadata import IDENTIFIER_CACHE
+from workflow import run_db_insertion
+
+CHECKM = ("{name}\t{{'marker lineage': 'k__Bacteria', 'Completeness': 98.4, 'Contamination': 1.2, '# scaffolds': 1, "
+          "'# contigs': 1, 'Longest scaffold': 96, 'Longest contig': 96, 'N50 (scaffolds)': 96, 'N50 (contigs)': 96, "
+          "'Mean scaffold length': 96.0, 'Mean contig length': 96.0, 'Coding density': 0.9, 'Translation table': 11, "
+          "'# predicted genes': 3}}\n")
+BAKTA = """# Annotated with Bakta
+#Sequence Id\tType\tStart\tStop\tStrand\tLocus Tag\tGene\tProduct\tDbXrefs
+contig1\tcds\t1\t30\t+\tLT1\ttuf\tElongation factor Tu\tKEGG:K02358, UniRef:UniRef90_A
+contig1\tcds\t31\t60\t-\tLT2\t\thypothetical protein\t
+contig1\tcds\t61\t90\t+\tLT3\t\thypothetical protein\tPFAM:PF00009
+"""
+
+
+def write_genome(tmp_path, name):
+    genome_dir = tmp_path / name
+    genome_dir.mkdir()
+    (genome_dir / f"{name}.fa").write_text(">contig1\n" + "ACGTTGCA" * 12 + "\n")
+    (genome_dir / "bin_stats_ext.tsv").write_text(CHECKM.format(name=name))
+    (genome_dir / f"{name}.tsv").write_text(BAKTA)
+    return [str(genome_dir / f"{name}.fa"), name, str(genome_dir / f"{name}.tsv"), str(genome_dir / "bin_stats_ext.tsv"), "NCBI"]
+
+
+def write_manifest(path, rows, columns=("local_path", "assembly_accession", "bakta_path", "checkm_path", "source")):
+    path.write_text("".join("\t".join(row) + "\n" for row in [list(columns), *rows]))
+    return path
+
+
+def count(table):
+    with TRN:
+        TRN.add(f"SELECT count(*) FROM {table}")
+        return TRN.execute_fetchflatten()[0]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(redgenes_config, "dbpath", str(tmp_path / "workflow.db"))
+    IDENTIFIER_CACHE.clear()
+    yield
+    IDENTIFIER_CACHE.clear()
+    TRN.close()
+
+
+def test_run_db_insertion_streams_bakta(tmp_path, monkeypatch, db):
+    monkeypatch.setattr(redgenes_config, "bakta_chunksize", 2)
+    # the whole tsv is never read into one frame
+    monkeypatch.setattr(bakta_annotations, "extract_bakta_results", None)
+    manifest = write_manifest(tmp_path / "md.tsv", [write_genome(tmp_path, "g1"), write_genome(tmp_path, "g2")])
+    run_db_insertion(manifest, tmp_path, logging.getLogger("test"), jobs=2)
+    assert [count("identifier"), count("qc_info"), count("bakta"), count("kegg")] == [2, 2, 6, 2]
+
+
+def test_run_db_insertion_adds_tool_outputs(tmp_path, db):
+    logger = logging.getLogger("test")
+    rows = [write_genome(tmp_path, "g1")]
+    run_db_insertion(write_manifest(tmp_path / "md.tsv", rows), tmp_path, logger)
+    # Prodigal outputs added to the manifest of a loaded genome are loaded
+    prodigal = tmp_path / "g1" / "g1.gff"
+    prodigal.write_text("##gff-version 3\n"
+                        "contig1\tProdigal_v2.6.3\tCDS\t1\t30\t5.1\t+\t0\tID=1_1;partial=00;conf=90.00;score=5.1\n")
+    columns = ("local_path", "assembly_accession", "bakta_path", "checkm_path", "source", "prodigal_path")
+    manifest = write_manifest(tmp_path / "md_tools.tsv", [rows[0] + [str(prodigal)]], columns)
+    run_db_insertion(manifest, tmp_path, logger)
+    assert [count("bakta"), count("cds_info")] == [3, 1]
+    with TRN:
+        TRN.add("SELECT stage FROM load_ledger")
+        assert TRN.execute_fetchflatten() == ["tools"]
+
+
+def test_run_db_insertion_checks_genomes_not_loaded(tmp_path, db):
+    logger = logging.getLogger("test")
+    rows = [write_genome(tmp_path, "g1")]
+    run_db_insertion(write_manifest(tmp_path / "md.tsv", rows), tmp_path, logger)
+    # the input files of a loaded genome are gone, a new genome's Bakta tsv is missing
+    (tmp_path / "g1" / "g1.tsv").unlink()
+    rows += [write_genome(tmp_path, "g2"), write_genome(tmp_path, "g3")]
+    (tmp_path / "g3" / "g3.tsv").unlink()
+    report_path = tmp_path / "report.tsv"
+    run_db_insertion(write_manifest(tmp_path / "md.tsv", rows), tmp_path, logger, report_path=report_path)
+    assert count("identifier") == 2
+    assert report_path.read_text().splitlines()[1:] == ["4\tg3\tbakta_path does not exist"]
+
+
+def test_run_db_insertion_rerun_loaded_manifest(tmp_path, db):
+    logger = logging.getLogger("test")
+    manifest = write_manifest(tmp_path / "md.tsv", [write_genome(tmp_path, "g1")])
+    run_db_insertion(manifest, tmp_path, logger)
+    # every genome is loaded, nothing is left to check or load
+    run_db_insertion(manifest, tmp_path, logger)
+    assert [count("identifier"), count("bakta")] == [1, 3]
+
+
+def test_run_db_insertion_embeds_glob_local_path(tmp_path, monkeypatch, db, caplog):
+    kmers = ["".join((a, b)) for a in "ACGT" for b in "ACGT"]
+    kmer_path = tmp_path / "kmer2vec.txt"
+    kmer_path.write_text("\n".join([f"{len(kmers)} 2"] + [f"{kmer} {i} 1" for i, kmer in enumerate(kmers)]) + "\n")
+    monkeypatch.setattr(redgenes_config, "kmer_vectors", str(kmer_path))
+    logger = logging.getLogger("test")
+    g1 = write_genome(tmp_path, "g1")
+    g1[0] = str(tmp_path / "g1" / "g1.f*")
+    g2 = write_genome(tmp_path, "g2")
+    run_db_insertion(write_manifest(tmp_path / "md.tsv", [g1, g2]), tmp_path, logger)
+    assert count("embedding") == 6
+    # a FASTA gone after its check is not embedded, the genome is still loaded
+    g3 = write_genome(tmp_path, "g3")
+    (tmp_path / "g3" / "g3.fa").unlink()
+    g3[0] = str(tmp_path / "g3" / "*.fa")
+    monkeypatch.setattr("workflow.check_md_info", lambda md_df, report_path=None: (md_df, []))
+    run_db_insertion(write_manifest(tmp_path / "md3.tsv", [g3]), tmp_path, logger)
+    assert [count("identifier"), count("bakta"), count("embedding")] == [3, 9, 6]
+    assert "Skipping gene embeddings of g3" in caplog.text